@@ -0,0 +1,159 @@
+# Length-bucketed batched generation for the labelling stage
+
+import time
+import argparse
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+MAX_BATCH_TOKENS = 65536 # prompt and generated tokens of a batch, padding included
+MAX_BATCH_SIZE = 16
+
+def length_batches(lengths:Sequence[int], max_new_tokens:int, max_batch_tokens:int=MAX_BATCH_TOKENS,
+                   max_batch_size:int=MAX_BATCH_SIZE)->List[List[int]]:
+    """
+    Groups the indices of prompts of similar length: the prompts are sorted by length (longest first, so that
+    a batch that does not fit fails early) and a batch is closed when padding its prompts to the longest one,
+    plus max_new_tokens each, would exceed max_batch_tokens. A prompt over the budget gets a batch of its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda index: lengths[index], reverse=True)
+    batches, batch = [], []
+    for index in order:
+        if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * (lengths[batch[0]] + max_new_tokens) > max_batch_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+    return batches
+
+class BatchedLabeller:
+    """
+    Generates the answers to many prompts with model.generate, a batch of similar-length, left-padded
+    prompts at a time, and returns them in the order of the prompts. Prompts are strings or chat messages
+    (as accepted by the text-generation pipeline); only the generated text is returned.
+    """
+    def __init__(self, model, tokenizer, generation_args:Dict, max_batch_tokens:int=MAX_BATCH_TOKENS,
+                 max_batch_size:int=MAX_BATCH_SIZE):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.tokenizer.padding_side = 'left' # decoder-only models continue from the last token
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.generate_args = self.to_generate_args(generation_args)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.rows = 0
+        self.seconds = 0.0
+
+    @staticmethod
+    def to_generate_args(generation_args:Dict)->Dict:
+        # The pipeline arguments, minus the ones model.generate does not know
+        generate_args = {key: value for key, value in generation_args.items() if key != 'return_full_text'}
+        if not generate_args.get('do_sample', False):
+            generate_args.pop('temperature', None)
+        generate_args.setdefault('max_new_tokens', 256)
+        return generate_args
+
+    def encode(self, prompt)->List[int]:
+        if isinstance(prompt, str):
+            return self.tokenizer(prompt)['input_ids']
+        # Chat messages: the chat template already adds the special tokens
+        return self.tokenizer.apply_chat_template(prompt, add_generation_prompt=True, tokenize=True)
+
+    def _generate_batch(self, batch_ids:List[List[int]], generate_args:Dict)->List[str]:
+        import torch # imported here so that length_batches works without torch
+        inputs = self.tokenizer.pad({'input_ids': batch_ids}, padding=True, return_tensors='pt').to(self.model.device)
+        try:
+            with torch.inference_mode():
+                generated = self.model.generate(**inputs, pad_token_id=self.tokenizer.pad_token_id, **generate_args)
+        except torch.cuda.OutOfMemoryError:
+            if len(batch_ids) == 1:
+                raise
+            # The token budget was too optimistic for this batch: retry it in halves
+            torch.cuda.empty_cache()
+            half = len(batch_ids) // 2
+            return self._generate_batch(batch_ids[:half], generate_args) + self._generate_batch(batch_ids[half:], generate_args)
+        return self.tokenizer.batch_decode(generated[:, inputs['input_ids'].shape[1]:], skip_special_tokens=True)
+
+    def _generate_rows(self, batch_ids:List[List[int]], generate_args:Dict)->List:
+        # A batch that failed (e.g. out of memory at size 1, or a prompt the model rejects): every prompt
+        # is generated on its own, so only the ones that fail again lose their output (None)
+        outputs = []
+        for ids in batch_ids:
+            try:
+                outputs.extend(self._generate_batch([ids], generate_args))
+            except Exception as e:
+                print(f"Generation failed for a prompt of {len(ids)} tokens: {type(e).__name__}: {e}")
+                outputs.append(None)
+        return outputs
+
+    def generate(self, prompts:List, generation_args:Dict=None)->List:
+        """
+        The generated texts of the prompts, in their order; a prompt that could not be encoded or generated gets None.
+        generation_args: pipeline arguments replacing the ones given to the constructor for these prompts
+        """
+        outputs = [None] * len(prompts)
+        for indices, texts in self.iter_generate(prompts, generation_args):
+            for index, text in zip(indices, texts):
+                outputs[index] = text
+        return outputs
+
+    def iter_generate(self, prompts:List, generation_args:Dict=None)->Iterator[Tuple[List[int], List]]:
+        """
+        Like generate, but yields (indices of the prompts, generated texts) for every batch as soon as it is
+        done, so the caller can keep the outputs of a long run as they come.
+        """
+        start = time.perf_counter()
+        generate_args = self.to_generate_args(generation_args) if generation_args is not None else self.generate_args
+        input_ids, failed = {}, []
+        for index, prompt in enumerate(prompts):
+            try:
+                input_ids[index] = self.encode(prompt)
+            except Exception as e:
+                print(f"Could not encode prompt {index}: {type(e).__name__}: {e}")
+                failed.append(index)
+        indices = list(input_ids)
+        batches = length_batches([len(input_ids[index]) for index in indices], generate_args['max_new_tokens'],
+                                 self.max_batch_tokens, self.max_batch_size)
+        self.rows += len(failed)
+        self.seconds += time.perf_counter() - start
+        if failed:
+            yield failed, [None] * len(failed)
+        for number, batch in enumerate(batches, 1):
+            start = time.perf_counter()
+            batch = [indices[position] for position in batch]
+            batch_ids = [input_ids[index] for index in batch]
+            print(f"Labelling batch {number}/{len(batches)}: {len(batch)} prompts of up to {len(batch_ids[0])} tokens")
+            try:
+                texts = self._generate_batch(batch_ids, generate_args)
+            except Exception as e:
+                print(f"Batch {number} failed ({type(e).__name__}: {e})" + (", generating its prompts one at a time" if len(batch) > 1 else ""))
+                texts = self._generate_rows(batch_ids, generate_args) if len(batch) > 1 else [None]
+            self.rows += len(batch)
+            self.seconds += time.perf_counter() - start
+            yield batch, texts
+
+    def report(self)->str:
+        rate = self.rows / self.seconds if self.seconds else 0
+        return f"Batched labelling: {self.rows} rows in {self.seconds:.1f} s ({rate:.2f} rows/sec)"
+
+if __name__ == '__main__':
+    # Throughput check on CPU with a tiny stand-in model, batched against one prompt at a time
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    parser = argparse.ArgumentParser(description="Compare batched and one-at-a-time generation with a small model.")
+    parser.add_argument('--model', default='hf-internal-testing/tiny-random-LlamaForCausalLM')
+    parser.add_argument('--rows', type=int, default=64)
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    args = parser.parse_args()
+    model = AutoModelForCausalLM.from_pretrained(args.model).to('cpu').eval()
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    prompts = [f"Label the license terms of: Permission is hereby granted {'free of charge ' * (i % 20)}to any person." for i in range(args.rows)]
+    generation_args = {"max_new_tokens": args.max_new_tokens, "return_full_text": False, "do_sample": False}
+    batched = BatchedLabeller(model, tokenizer, generation_args, max_batch_size=args.max_batch_size)
+    batched_outputs = batched.generate(prompts)
+    single = BatchedLabeller(model, tokenizer, generation_args, max_batch_size=1)
+    single_outputs = single.generate(prompts)
+    print(batched.report())
+    print(single.report().replace('Batched labelling', 'One at a time'))
+    same = sum(a == b for a, b in zip(batched_outputs, single_outputs))
+    print(f"{same}/{len(prompts)} outputs identical to one-at-a-time generation")
@@ -0,0 +1,100 @@
+# Resolution of license identifiers (e.g. "Apache 2.0", "GPL v3") to the knowledgebase licenses
+
+import re
+from collections import Counter
+from fuzzywuzzy import process
+from typing import Dict, Iterable, List, Tuple
+
+MATCH_THRESHOLD = 80 # fuzzy score (0-100) from which an identifier is taken as a match
+MAX_CANDIDATES = 20 # identifiers sharing the most trigrams with a query that are fuzzy scored
+NGRAM_SIZE = 3
+
+LICENSE_WORD_PATTERN = re.compile(r'\b(?:the|licen[cs]es?|version)\b')
+OR_LATER_PATTERN = re.compile(r'(?:-or-later|\s+or\s+later)\b')
+ONLY_PATTERN = re.compile(r'-only\b')
+VERSION_PREFIX_PATTERN = re.compile(r'(?<=[a-z\s])v(?=\d)')
+ZERO_MINOR_PATTERN = re.compile(r'(\d)\.0\b')
+NON_ALIAS_PATTERN = re.compile(r'[^a-z0-9+]')
+
+def normalize_identifier(identifier:str)->str:
+    return str(identifier).lower().strip()
+
+def alias_key(identifier:str)->str:
+    """
+    The form under which spellings of the same identifier meet: case, punctuation, whitespace, the words
+    'license'/'version', a 'v' before the version, '.0' minors and '-only' are dropped and '-or-later' becomes '+',
+    e.g. "Apache License, Version 2.0", "Apache-2.0" and "APACHEv2" are all "apache2".
+    """
+    key = normalize_identifier(identifier)
+    key = OR_LATER_PATTERN.sub('+', key)
+    key = ONLY_PATTERN.sub('', key)
+    key = LICENSE_WORD_PATTERN.sub(' ', key)
+    key = VERSION_PREFIX_PATTERN.sub('', key)
+    key = ZERO_MINOR_PATTERN.sub(r'\1', key)
+    return NON_ALIAS_PATTERN.sub('', key)
+
+def ngrams(key:str, size:int=NGRAM_SIZE)->List[str]:
+    padded = f" {key} "
+    return [padded[i:i + size] for i in range(max(len(padded) - size + 1, 1))]
+
+class IdentifierIndex:
+    """
+    Resolves an identifier to a knowledgebase identifier: an exact match, then an alias match (see
+    alias_key) from hash maps, and only then a fuzzy match among the identifiers sharing the most
+    character trigrams with it. Results are memoized per distinct identifier.
+    """
+    def __init__(self, identifiers:Iterable[str], texts:Iterable[str]=None, threshold:int=MATCH_THRESHOLD,
+                 max_candidates:int=MAX_CANDIDATES, alias_keys:Iterable[str]=None):
+        # alias_keys: precomputed alias_key of every identifier (see knowledgebase.py), computed here if None
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.identifiers: List[str] = []
+        self.texts: Dict[str, str] = {} # identifier -> license text, for the identifiers that have one
+        self.exact: Dict[str, str] = {}
+        self.aliases: Dict[str, str] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.memo: Dict[str, Tuple[str, int]] = {}
+        texts = list(texts) if texts is not None else []
+        alias_keys = list(alias_keys) if alias_keys is not None else None
+        for position, identifier in enumerate(identifiers):
+            if not isinstance(identifier, str) or identifier in self.exact:
+                continue
+            key = alias_keys[position] if alias_keys is not None else alias_key(identifier)
+            self.identifiers.append(identifier)
+            text = texts[position] if position < len(texts) else None
+            if isinstance(text, str) and text:
+                self.texts[identifier] = text
+            self.exact[identifier] = identifier
+            self.exact.setdefault(normalize_identifier(identifier), identifier)
+            self.aliases.setdefault(key, identifier)
+            for gram in set(ngrams(key)):
+                self.postings.setdefault(gram, []).append(len(self.identifiers) - 1)
+
+    def candidates(self, identifier:str)->List[str]:
+        # The identifiers sharing the most trigrams with the query
+        counts = Counter(position for gram in set(ngrams(alias_key(identifier))) for position in self.postings.get(gram, ()))
+        return [self.identifiers[position] for position, _ in counts.most_common(self.max_candidates)]
+
+    def resolve(self, identifier:str)->Tuple[str, int]:
+        """(knowledgebase identifier, score) of the best match; the identifier is None if the score is below the threshold."""
+        if identifier in self.memo:
+            return self.memo[identifier]
+        normalized_id = normalize_identifier(identifier)
+        if identifier in self.exact or normalized_id in self.exact:
+            result = (self.exact.get(identifier) or self.exact[normalized_id], 100)
+        elif alias_key(identifier) and alias_key(identifier) in self.aliases:
+            result = (self.aliases[alias_key(identifier)], 100)
+        else:
+            candidates = self.candidates(identifier)
+            best = process.extractOne(normalized_id, candidates) if candidates else None
+            if best is None:
+                result = (None, 0)
+            else:
+                result = (best[0] if best[1] >= self.threshold else None, best[1])
+        self.memo[identifier] = result
+        return result
+
+    def text_of(self, identifier:str):
+        """License text of the knowledgebase license an identifier resolves to, None if there is none."""
+        match, _ = self.resolve(identifier)
+        return self.texts.get(match) if match else None
@@ -0,0 +1,127 @@
+# Compiled form of the knowledgebase of referenced licenses, loaded on first use and rebuilt when the .xlsx changes
+
+import os
+import pickle
+import hashlib
+import argparse
+import tempfile
+import pandas as pd
+from functools import cached_property, lru_cache
+from typing import Dict
+from identifier_index import IdentifierIndex, alias_key, normalize_identifier
+from license_fingerprint import FingerprintIndex, normalize_license_text, NUM_PERMUTATIONS, BANDS
+
+KNOWLEDGEBASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Knowledgebase_for_Referenced_licenses.xlsx')
+ARTIFACT_SUFFIX = '.kb.pickle'
+# Bump when the compiled content (normalization, aliases, fingerprints) changes, so old artifacts are rebuilt.
+ARTIFACT_VERSION = '2'
+
+def artifact_path(xlsx_path:str)->str:
+    # The artifact is kept next to the workbook it was compiled from
+    return os.path.splitext(xlsx_path)[0] + ARTIFACT_SUFFIX
+
+def file_hash(path:str)->str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def source_info(xlsx_path:str)->Dict:
+    stat = os.stat(xlsx_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': file_hash(xlsx_path)}
+
+def compile_knowledgebase(xlsx_path:str=KNOWLEDGEBASE_PATH, output_path:str=None)->Dict:
+    """
+    Reads the workbook once and writes its identifiers, texts, normalized forms and fingerprints to a
+    pickle next to it (or to output_path); returns the compiled artifact.
+    """
+    df = pd.read_excel(xlsx_path)
+    identifiers = [identifier if isinstance(identifier, str) else None for identifier in df['Ref license']]
+    texts = [text if isinstance(text, str) else None for text in df['License text']]
+    fingerprints = FingerprintIndex(identifiers, texts)
+    artifact = {
+        'version': ARTIFACT_VERSION,
+        'source': source_info(xlsx_path),
+        'identifiers': identifiers,
+        'texts': texts,
+        'normalized_identifiers': [normalize_identifier(identifier) if identifier else None for identifier in identifiers],
+        'alias_keys': [alias_key(identifier) if identifier else None for identifier in identifiers],
+        'normalized_texts': [normalize_license_text(text) if text else None for text in texts],
+        'fingerprints': {'identifiers': fingerprints.identifiers, 'signatures': fingerprints.signatures,
+                         'num_permutations': NUM_PERMUTATIONS, 'bands': BANDS},
+    }
+    output_path = output_path or artifact_path(xlsx_path)
+    # Written to a temporary file first, so that a worker never reads a half written artifact
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, output_path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    return artifact
+
+def is_stale(artifact:Dict, xlsx_path:str)->bool:
+    if artifact.get('version') != ARTIFACT_VERSION:
+        return True
+    if not os.path.exists(xlsx_path):
+        return False # the artifact is all there is
+    stat = os.stat(xlsx_path)
+    source = artifact['source']
+    if stat.st_size == source['size'] and stat.st_mtime_ns == source['mtime_ns']:
+        return False
+    # Touched (e.g. checked out again), but maybe not changed
+    return file_hash(xlsx_path) != source['sha1']
+
+class Knowledgebase:
+    """The compiled knowledgebase; the DataFrame and the indexes are built from it on first use."""
+    def __init__(self, artifact:Dict):
+        self.artifact = artifact
+        self.identifiers = artifact['identifiers']
+        self.texts = artifact['texts']
+
+    @cached_property
+    def spdx_df(self)->pd.DataFrame:
+        return pd.DataFrame({'Ref license': self.identifiers, 'License text': self.texts})
+
+    @cached_property
+    def identifier_index(self)->IdentifierIndex:
+        return IdentifierIndex(self.identifiers, self.texts, alias_keys=self.artifact['alias_keys'])
+
+    @cached_property
+    def fingerprint_index(self)->FingerprintIndex:
+        fingerprints = self.artifact['fingerprints']
+        text_of = dict(zip(self.identifiers, self.texts))
+        return FingerprintIndex(fingerprints['identifiers'], [text_of[identifier] for identifier in fingerprints['identifiers']],
+                                num_permutations=fingerprints['num_permutations'], bands=fingerprints['bands'],
+                                signatures=fingerprints['signatures'])
+
+@lru_cache(maxsize=None)
+def _load_knowledgebase(xlsx_path:str)->Knowledgebase:
+    path = artifact_path(xlsx_path)
+    artifact = None
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                artifact = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            print(f"Could not read the compiled knowledgebase {path} ({e}), rebuilding it")
+    if artifact is None or is_stale(artifact, xlsx_path):
+        print(f"Compiling the knowledgebase {xlsx_path}...")
+        artifact = compile_knowledgebase(xlsx_path)
+    return Knowledgebase(artifact)
+
+def load_knowledgebase(xlsx_path:str=KNOWLEDGEBASE_PATH)->Knowledgebase:
+    """
+    The knowledgebase of xlsx_path, read from its compiled artifact (compiled first if it is missing or
+    older than the workbook). Loaded once per process; load it before forking workers to share it with them.
+    """
+    return _load_knowledgebase(os.path.abspath(xlsx_path))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile the knowledgebase workbook into the artifact loaded by the labelling stage.")
+    parser.add_argument('xlsx_path', nargs='?', default=KNOWLEDGEBASE_PATH)
+    parser.add_argument('--output', default=None, help="artifact to write (default: next to the workbook)")
+    args = parser.parse_args()
+    artifact = compile_knowledgebase(args.xlsx_path, args.output)
+    print(f"Compiled {sum(1 for identifier in artifact['identifiers'] if identifier)} identifiers "
+          f"({len(artifact['fingerprints']['identifiers'])} fingerprinted texts) to {args.output or artifact_path(args.xlsx_path)}.")
@@ -0,0 +1,95 @@
+# Persistent cache of the labels given by the model, so that a license text is labelled once across runs
+
+import re
+import time
+import sqlite3
+import hashlib
+import argparse
+from typing import List, Tuple
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def normalize_text(text:str)->str:
+    # Texts that only differ in whitespace get the same labels
+    return WHITESPACE_PATTERN.sub(' ', str(text)).strip()
+
+def text_hash(text:str)->str:
+    return hashlib.sha256(normalize_text(text).encode('utf-8', errors='surrogatepass')).hexdigest()
+
+class LabelCache:
+    """
+    SQLite cache of labels keyed on (normalized text hash, model id, adapter, prompt version).
+    Labels of another model, adapter or prompt version are never returned, and can be removed
+    with `invalidate`.
+    """
+    def __init__(self, db_path:str, model_id:str, adapter:str=None, prompt_version:str='1'):
+        self.db_path = db_path
+        self.model_id = model_id
+        self.adapter = adapter or ''
+        self.prompt_version = str(prompt_version)
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS labels (
+                                   text_hash TEXT, model_id TEXT, adapter TEXT, prompt_version TEXT,
+                                   label TEXT, labelled_at REAL,
+                                   PRIMARY KEY (text_hash, model_id, adapter, prompt_version))""")
+
+    def _key(self, text:str)->Tuple[str, str, str, str]:
+        return (text_hash(text), self.model_id, self.adapter, self.prompt_version)
+
+    def get(self, text:str):
+        """Returns (True, label) if the text was labelled by this model, adapter and prompt version, (False, None) otherwise."""
+        row = self.connection.execute("""SELECT label FROM labels
+                                         WHERE text_hash=? AND model_id=? AND adapter=? AND prompt_version=?""",
+                                      self._key(text)).fetchone()
+        if row is None:
+            self.misses += 1
+            return (False, None)
+        self.hits += 1
+        return (True, row[0])
+
+    def put(self, text:str, label:str)->None:
+        self.connection.execute("INSERT OR REPLACE INTO labels VALUES (?,?,?,?,?,?)", self._key(text) + (label, time.time()))
+        self.connection.commit()
+
+    def invalidate(self, model_id:str=None, adapter:str=None, prompt_version:str=None)->int:
+        """Removes the labels of the given model, adapter and/or prompt version (all labels if none is given)."""
+        conditions, values = [], []
+        for column, value in (('model_id', model_id), ('adapter', adapter), ('prompt_version', prompt_version)):
+            if value is not None:
+                conditions.append(f"{column}=?")
+                values.append(str(value))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        removed = self.connection.execute(f"DELETE FROM labels{where}", values).rowcount
+        self.connection.commit()
+        return removed
+
+    def stats(self)->List[Tuple]:
+        # (model id, adapter, prompt version, number of labels)
+        return self.connection.execute("""SELECT model_id, adapter, prompt_version, COUNT(*) FROM labels
+                                          GROUP BY model_id, adapter, prompt_version ORDER BY model_id, adapter, prompt_version""").fetchall()
+
+    def report(self)->str:
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0
+        return f"Label cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
+
+    def close(self)->None:
+        self.connection.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show or invalidate the labels in the label cache.")
+    parser.add_argument('db_path', help="SQLite file of the cache")
+    parser.add_argument('command', choices=['stats', 'invalidate'])
+    parser.add_argument('--model-id', default=None, help="only the labels of this model (invalidate)")
+    parser.add_argument('--adapter', default=None, help="only the labels of this adapter (invalidate)")
+    parser.add_argument('--prompt-version', default=None, help="only the labels of this prompt version (invalidate)")
+    args = parser.parse_args()
+    cache = LabelCache(args.db_path, model_id='')
+    if args.command == 'stats':
+        for model_id, adapter, prompt_version, count in cache.stats():
+            print(f"{model_id} | adapter: {adapter or '-'} | prompt version: {prompt_version} | {count} labels")
+    else:
+        print(f"Removed {cache.invalidate(args.model_id, args.adapter, args.prompt_version)} labels.")
+    cache.close()
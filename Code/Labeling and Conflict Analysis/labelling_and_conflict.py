@@ -1,24 +1,25 @@
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
-from transformers import BitsAndBytesConfig
-from huggingface_hub import login
 import json
 import pandas as pd
 from itertools import combinations
 import os
-from fuzzywuzzy import process
+import sys
 from license_match import *
+from label_cache import LabelCache
+from model_server import ModelClient
+from knowledgebase import load_knowledgebase
 from prompts import *
+# The output of the license extraction module is read with its own reader (see output_sink.read_records)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'License Extraction'))
+from output_sink import read_records
 
 token = "<hugging_face_token>"
-
-login(token=token)
-
-torch.random.manual_seed(0)
+# URL of a running model_server.py (e.g. "http://127.0.0.1:8765"); None loads the model in this process
+model_server_url = None
 
 
 labelling_DIR = '<output_path_for_labelled_licenses>/<file_name>.xlsx'
 conflict_DIR = '<output_path_for_conflict_analysis>/<file_name>.xlsx'
+label_cache_DIR = 'label_cache.sqlite' # labels kept between runs, see label_cache.py
 
 def extract_first_json(text):
     start = text.find('{')
@@ -37,49 +38,14 @@ def extract_first_json(text):
     
     return None
 
-def load_spdx_identifiers(file_path):
-    df = pd.read_excel(file_path)
-    return df['Ref license'].tolist()
-
-
-def normalize_identifier(identifier):
-    return identifier.lower().strip()
-
-def find_best_matches(extracted_identifiers, spdx_identifiers, threshold=80):
-    matches = {}
-    scores = []
-    for identifier in extracted_identifiers:
-        normalized_id = normalize_identifier(identifier)
-        best_match, score = process.extractOne(normalized_id, spdx_identifiers)
-        scores.append(score)
-        if score >= threshold:
-            matches[identifier] = best_match
-        else:
-            matches[identifier] = None 
-    return matches, scores
-
-file_path = "Knowledgebase for Referenced licenses.xlsx"
-spdx_df = pd.read_excel(file_path)
-spdx_identifiers = load_spdx_identifiers(file_path)
-
-data = pd.read_excel('<path_to_licenses_output_of_license_extraction_module>')
+# .sqlite, .jsonl or .parquet output of the license extraction module, or an older .xlsx/.csv file
+data = read_records('<path_to_licenses_output_of_license_extraction_module>')
 
 model_id = "meta-llama/Llama-3.1-8B-Instruct"
-
-model = AutoModelForCausalLM.from_pretrained(
-    model_id,
-    device_map="auto", 
-    torch_dtype="auto", 
-    trust_remote_code=True, 
-    #quantization_config=quantization_config
-)
-tokenizer = AutoTokenizer.from_pretrained(model_id)
-
-pipe = pipeline(
-    "text-generation",
-    model=model,
-    tokenizer=tokenizer,
-)
+adapter_id = None # fine-tuned adapter loaded on top of the model, if any
+# Bump when get_labelling_prompt changes, so cached labels are not reused.
+LABEL_PROMPT_VERSION = '1'
+label_cache = LabelCache(label_cache_DIR, model_id, adapter_id, LABEL_PROMPT_VERSION)
 
 generation_args = {
     "max_new_tokens": 4000,
@@ -88,6 +54,41 @@ generation_args = {
     "do_sample": False,
 }
 
+if model_server_url:
+    # The model is loaded once by the server; labelling, conflict analysis and summaries are sent to it
+    client = ModelClient(model_server_url, generation_args)
+    print(f"Using the model server at {model_server_url}: {client.health()}")
+    pipe = client.pipe
+    labeller = client
+else:
+    # torch and transformers are only needed in the process that holds the model
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+    from transformers import BitsAndBytesConfig
+    from huggingface_hub import login
+    from batched_labelling import BatchedLabeller
+
+    login(token=token)
+    torch.random.manual_seed(0)
+
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id,
+        device_map="auto", 
+        torch_dtype="auto", 
+        trust_remote_code=True, 
+        #quantization_config=quantization_config
+    )
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+
+    pipe = pipeline(
+        "text-generation",
+        model=model,
+        tokenizer=tokenizer,
+    )
+
+    # Prompts of similar length are labelled together, see batched_labelling.py
+    labeller = BatchedLabeller(model, tokenizer, generation_args)
+
 classes = {
     "Distribute": {
         "label": "NOT MENTIONED",
@@ -183,85 +184,143 @@ classes = {
     }
 }
 
-def labelling(data):
-    license_text = list(data['License text'])
-    labels = []
-    for i in range(len(license_text)):
-        output = None
-        print('===================================================================================')
+def labelling_text(license_text, referenced):
+    # The text the labels are asked for; referenced licenses are looked up in the knowledgebase first
+    text = None
+    if referenced:
+        identifier_index = load_knowledgebase().identifier_index
+        match, score = identifier_index.resolve(license_text)
+        if match:
+            text = identifier_index.texts.get(match)
+            print("found a match for referenced license......")
+    if not text:
+        text = license_text
+    return text
+
+def parse_labels(generated_text):
+    # Returns (labels as a JSON string, whether the output parsed as JSON); when it did not, the first
+    # JSON object in the output is used, and the default classes if there is none.
+    try:
+        json.loads(generated_text)
+        return generated_text, True
+    except Exception as e:
+        print('something went wrong in classification - ', str(e))
+    try:
+        first_json = extract_first_json(generated_text)
+        if first_json:
+            first_json_value = first_json
+            print("Labels in output - ", first_json_value)
+            if 'Distribute' in first_json_value:
+                return first_json_value, False
+    except Exception as e:
+        pass
+    print("classification - ",classes)
+    return json.dumps(classes), False
+
+def label_texts(keys):
+    """
+    Labels (JSON strings) of a list of (license text, referenced) pairs, in their order. Cached labels
+    are reused; the prompts of the other texts are generated together in length-bucketed batches and
+    every output is parsed and cached on its own as soon as its batch is done.
+    """
+    labels = [None] * len(keys)
+    pending, texts, prompts = [], [], []
+    prompt_of_text = {} # copies of the same text share one prompt
+    for index, (license_text, referenced) in enumerate(keys):
         try:
-            text = None
-            if data.iloc[i]['License type'] == 'Referenced':
-                extracted_identifiers = [license_text[i]]
-                matches, scores = find_best_matches(extracted_identifiers, spdx_identifiers)
-                for extracted, match in matches.items():
-                    if match:
-                        results = spdx_df.loc[spdx_df['Ref license'] == match, 'License text']
-                        result = results.iloc[0]
-                        if result:
-                            text = result
-                        else:
-                            text = license_text[i]
-                        print("found a match for referenced license......")
-                    else:
-                        text = license_text[i]
-            if text:
-                if len(text) > 20000:
-                    check = True
-                else:
-                    check = False
-                prompt = get_labelling_prompt(text, check)
-            else:
-                if len(license_text[i]) > 20000:
-                    check = True
-                else:
-                    check = False
-                prompt = get_labelling_prompt(license_text[i], check)
-            
-            if prompt:
-                output = pipe(prompt, **generation_args)
-                print('Before JSON - ', output[0]["generated_text"])
-                json_output = json.loads(output[0]["generated_text"])
-                labels.append(output[0]["generated_text"])
+            text = labelling_text(license_text, referenced)
+            hit, label = label_cache.get(text)
+            if hit:
+                labels[index] = label
+                continue
+            if len(text) > 20000:
+                check = True
             else:
-                labels.append(json.dumps(classes))
+                check = False
+            prompt = get_labelling_prompt(text, check)
         except Exception as e:
             print('something went wrong in classification - ', str(e))
-            try:
-                first_json = extract_first_json(output[0]["generated_text"])
-                if first_json:
-                    first_json_value = first_json
-                    print("Labels in output - ", first_json_value)
-                    if 'Distribute' in first_json_value:
-                        labels.append(first_json_value)
-                    else:
-                        print("classification - ",classes)
-                        labels.append(json.dumps(classes))
-                else:
-                    print("classification - ",classes)
-                    labels.append(json.dumps(classes))        
-            except Exception as e:
-                print("classification - ",classes)
-                labels.append(json.dumps(classes))
-        
-        if output:
-            del output
-        torch.cuda.empty_cache()
-        gpu_id = torch.cuda.current_device()
-        gpu_memory = torch.cuda.get_device_properties(gpu_id).total_memory
-        gpu_memory_allocated = torch.cuda.memory_allocated(gpu_id)
-        gpu_memory_free = gpu_memory - gpu_memory_allocated
-
-        print(f"Available GPU Memory: {gpu_memory_free // (1024 ** 2)} MB")
-        print('=========================================================================================')
-
+            prompt = None
+        if prompt:
+            if text not in prompt_of_text:
+                prompt_of_text[text] = len(prompts)
+                texts.append(text)
+                prompts.append(prompt)
+            pending.append((index, prompt_of_text[text]))
+        else:
+            labels[index] = json.dumps(classes)
+    print(f"{len(keys) - len(pending)} labels taken from the cache or the defaults, {len(prompts)} distinct texts to generate...")
+    # The labels of every batch are parsed and cached as soon as it is generated, so an interrupted run keeps them
+    parsed_labels = [None] * len(prompts)
+    try:
+        for positions, outputs in (labeller.iter_generate(prompts) if prompts else []):
+            for position, generated_text in zip(positions, outputs):
+                print('===================================================================================')
+                print('Before JSON - ', generated_text)
+                label, parsed = parse_labels(generated_text)
+                if parsed:
+                    label_cache.put(texts[position], label)
+                parsed_labels[position] = label
+    except Exception as e:
+        print('something went wrong in classification - ', str(e))
+    parsed_labels = [label if label is not None else json.dumps(classes) for label in parsed_labels]
+    for index, position in pending:
+        labels[index] = parsed_labels[position]
+    print(labeller.report())
+    return labels
+
+def label_text(license_text, referenced):
+    # Returns the labels (a JSON string) of one license text
+    return label_texts([(license_text, referenced)])[0]
+
+def precompute_canonical_labels(identifiers=None):
+    """
+    Labels of the knowledgebase licenses of identifiers (all of them if None), as a dict identifier -> labels.
+    They are kept in the label cache, so the copies of them found by the fingerprint index are labelled without
+    the model; labelling() calls it for the licenses it matched, and calling it once up front labels the
+    whole knowledgebase ahead of a run.
+    """
+    texts = load_knowledgebase().fingerprint_index.texts
+    identifiers = list(texts if identifiers is None else identifiers)
+    return dict(zip(identifiers, label_texts([(texts[identifier], False) for identifier in identifiers])))
 
-    data['labels'] = labels
+def labelling(data):
+    # The same license text appears in many rows, so every distinct (text, referenced) pair is labelled
+    # only once and its labels are copied to all of its rows.
+    keys = list(zip(data['License text'], data['License type'] == 'Referenced'))
+    unique_keys = list(dict.fromkeys(keys))
+    print(f"Labelling {len(unique_keys)} distinct license texts ({len(keys)} rows)...")
+    # Declared and inline texts that are copies of a knowledgebase license get the labels of that license
+    fingerprint_index = load_knowledgebase().fingerprint_index
+    matches = {key: (None, None) if key[1] else fingerprint_index.match(key[0]) for key in unique_keys}
+    matched = list(dict.fromkeys(identifier for identifier, _ in matches.values() if identifier))
+    print(f"{sum(1 for identifier, _ in matches.values() if identifier)} texts matched {len(matched)} knowledgebase licenses")
+    canonical_labels = precompute_canonical_labels(matched) if matched else {}
+    unmatched_keys = [key for key in unique_keys if not matches[key][0]]
+    labels = dict(zip(unmatched_keys, label_texts(unmatched_keys)))
+    labels.update((key, canonical_labels[matches[key][0]]) for key in unique_keys if matches[key][0])
+    print(label_cache.report())
+
+    data['labels'] = [labels[key] for key in keys]
+    data['Canonical license'] = [matches[key][0] for key in keys]
+    data['Match score'] = [matches[key][1] for key in keys]
+    data['Match threshold'] = fingerprint_index.threshold
 
     data.to_excel(labelling_DIR, index = False)
 
     return True
 
+def print_gpu_memory():
+    # Only when the model is loaded in this process: a client of the model server holds no GPU memory
+    if model_server_url or not torch.cuda.is_available():
+        return
+    torch.cuda.empty_cache()
+    gpu_id = torch.cuda.current_device()
+    gpu_memory = torch.cuda.get_device_properties(gpu_id).total_memory
+    gpu_memory_allocated = torch.cuda.memory_allocated(gpu_id)
+    gpu_memory_free = gpu_memory - gpu_memory_allocated
+    print(f"Available GPU Memory: {gpu_memory_free // (1024 ** 2)} MB")
+
 def conflict_analysis(labelled_data):
     print("====================================conflict analysis starts========================================")
     repository_name = []
@@ -331,12 +390,7 @@ def conflict_analysis(labelled_data):
             conflict_details.append(json_output)
 
             del output
-            torch.cuda.empty_cache()
-            gpu_id = torch.cuda.current_device()
-            gpu_memory = torch.cuda.get_device_properties(gpu_id).total_memory
-            gpu_memory_allocated = torch.cuda.memory_allocated(gpu_id)
-            gpu_memory_free = gpu_memory - gpu_memory_allocated
-            print(f"Available GPU Memory: {gpu_memory_free // (1024 ** 2)} MB")
+            print_gpu_memory()
             print('=========================================================================================')
 
 
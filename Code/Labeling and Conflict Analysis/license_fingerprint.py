@@ -0,0 +1,96 @@
+# MinHash/LSH fingerprints of the knowledgebase licenses, to recognise lightly edited copies of them without the model
+
+import re
+import zlib
+import numpy as np
+from typing import Dict, Iterable, List, Tuple
+
+SHINGLE_SIZE = 5 # words per shingle
+NUM_PERMUTATIONS = 128
+BANDS = 32 # LSH bands of NUM_PERMUTATIONS // BANDS rows; texts that agree on a whole band become candidates
+MIN_SHINGLES = 20 # shorter texts (e.g. a one-line SPDX comment) are not fingerprinted
+# Estimated Jaccard similarity of the shingles above which a match is trusted; the GPL-3.0 and
+# AGPL-3.0 texts of the knowledgebase are 0.85-0.9 similar, but must not get each other's labels.
+MATCH_THRESHOLD = 0.92
+SHINGLE_BASE = np.uint64(1000003) # multiplier of the rolling hash combining the words of a shingle
+
+COPYRIGHT_LINE_PATTERN = re.compile(r'^[\W_]*(?:copyright\b|\(c\)|©|all rights reserved\b).*$', re.IGNORECASE | re.MULTILINE)
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+def normalize_license_text(text:str)->str:
+    """Lower case words only: copyright lines (which differ in every copy), punctuation, comment markers and whitespace are dropped."""
+    text = COPYRIGHT_LINE_PATTERN.sub(' ', str(text))
+    return NON_WORD_PATTERN.sub(' ', text.lower()).strip()
+
+def shingle_hashes(text:str, size:int=SHINGLE_SIZE)->np.ndarray:
+    """Distinct 64-bit hashes of the shingles (runs of `size` words) of the normalized text."""
+    words = normalize_license_text(text).split()
+    count = len(words) - size + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.uint64)
+    word_hashes = np.fromiter((zlib.crc32(word.encode()) for word in words), dtype=np.uint64, count=len(words))
+    hashes = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for offset in range(size):
+            hashes = hashes * SHINGLE_BASE + word_hashes[offset:offset + count]
+    return np.unique(hashes)
+
+class FingerprintIndex:
+    """
+    MinHash signatures of the knowledgebase texts, banded into LSH buckets. `match` fingerprints a
+    text, collects the knowledgebase texts sharing a bucket with it and returns the most similar one.
+    """
+    def __init__(self, identifiers:Iterable[str], texts:Iterable[str], threshold:float=MATCH_THRESHOLD,
+                 num_permutations:int=NUM_PERMUTATIONS, bands:int=BANDS, seed:int=1, signatures:np.ndarray=None):
+        # signatures: precomputed signatures of the texts (see knowledgebase.py), computed here if None
+        rng = np.random.default_rng(seed)
+        # Multiplying by an odd number modulo 2**64 permutes the 64-bit hashes; one multiplier per permutation
+        self.multipliers = rng.integers(0, np.iinfo(np.uint64).max, size=num_permutations, dtype=np.uint64, endpoint=True) | np.uint64(1)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_permutations // bands
+        self.identifiers: List[str] = []
+        self.texts: Dict[str, str] = {}
+        self.signatures = np.empty((0, num_permutations), dtype=np.uint64)
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        rows = []
+        for position, (identifier, text) in enumerate(zip(identifiers, texts)):
+            if not isinstance(identifier, str) or not isinstance(text, str):
+                continue
+            signature = signatures[position] if signatures is not None else self.signature(text)
+            if signature is None:
+                continue
+            self.identifiers.append(identifier)
+            self.texts[identifier] = text
+            for band in self.band_keys(signature):
+                self.buckets.setdefault(band, []).append(len(rows))
+            rows.append(signature)
+        if rows:
+            self.signatures = np.vstack(rows)
+
+    def signature(self, text:str):
+        """MinHash signature of the shingles of text, None if it has fewer than MIN_SHINGLES."""
+        hashes = shingle_hashes(text)
+        if len(hashes) < MIN_SHINGLES:
+            return None
+        with np.errstate(over='ignore'):
+            permuted = self.multipliers[:, None] * hashes
+        # The high bits of the products are the well mixed ones
+        return permuted.min(axis=1) >> np.uint64(32)
+
+    def band_keys(self, signature:np.ndarray)->List[Tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def match(self, text:str)->Tuple[str, float]:
+        """(identifier, estimated similarity) of the closest knowledgebase text; the identifier is None below the threshold."""
+        signature = self.signature(text)
+        if signature is None:
+            return (None, 0.0)
+        candidates = {position for band in self.band_keys(signature) for position in self.buckets.get(band, ())}
+        if not candidates:
+            return (None, 0.0)
+        candidates = sorted(candidates)
+        scores = (self.signatures[candidates] == signature).mean(axis=1)
+        best = int(scores.argmax())
+        score = round(float(scores[best]), 3)
+        return (self.identifiers[candidates[best]] if score >= self.threshold else None, score)
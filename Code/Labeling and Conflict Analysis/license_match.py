@@ -1,47 +1,49 @@
 import pandas as pd
-from fuzzywuzzy import process
 from fuzzywuzzy import fuzz
 import re
+from identifier_index import normalize_identifier
+from knowledgebase import KNOWLEDGEBASE_PATH, load_knowledgebase
 
 def load_spdx_identifiers(file_path):
-    df = pd.read_excel(file_path)
-    return df['Ref license'].tolist()
+    return load_knowledgebase(file_path).spdx_df['Ref license'].tolist()
 
-file_path = "Knowledgebase for Referenced licenses.xlsx"
-spdx_df = pd.read_excel(file_path)
-spdx_identifiers = load_spdx_identifiers(file_path)
+file_path = KNOWLEDGEBASE_PATH
 
+def __getattr__(name):
+    # spdx_df, spdx_identifiers and identifier_index are loaded on first use, from the compiled knowledgebase
+    if name == 'spdx_df':
+        return load_knowledgebase(file_path).spdx_df
+    if name == 'spdx_identifiers':
+        return load_spdx_identifiers(file_path)
+    if name == 'identifier_index':
+        # Shared by labelling_and_conflict.py: exact, alias and n-gram prefiltered fuzzy lookup of identifiers
+        return load_knowledgebase(file_path).identifier_index
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-
-def normalize_identifier(identifier):
-    return identifier.lower().strip()
-
-def find_best_matches(extracted_identifiers, spdx_identifiers, threshold=80):
+def find_best_matches(extracted_identifiers, spdx_identifiers=None, threshold=80):
+    # spdx_identifiers: kept for compatibility, the identifiers of the knowledgebase are searched
+    identifier_index = load_knowledgebase(file_path).identifier_index
     matches = {}
     scores = []
     for identifier in extracted_identifiers:
-        normalized_id = normalize_identifier(identifier)
-        best_match, score = process.extractOne(normalized_id, spdx_identifiers)
+        best_match, score = identifier_index.resolve(identifier)
         scores.append(score)
-        if score >= threshold:
+        if best_match is not None and score >= threshold:
             matches[identifier] = best_match
         else:
             matches[identifier] = None 
     return matches, scores
 
 def get_license_from_knowledgebase(license_text):
-    extracted_identifiers = [license_text]
-    #print(extracted_identifiers)
-    matches, scores = find_best_matches(extracted_identifiers, spdx_identifiers)
-    for extracted, match in matches.items():
-        print("match - ", match)
-        if match:
-            results = spdx_df.loc[spdx_df['Ref license'] == match, 'License text']
-            result = results.iloc[0]
-            print(result)
+    identifier_index = load_knowledgebase(file_path).identifier_index
+    match, score = identifier_index.resolve(license_text)
+    print("match - ", match)
+    if match:
+        result = identifier_index.texts.get(match)
+        print(result)
+        if result:
             return result
-        else:
-            return license_text
+    return license_text
 
 def normalize_license_texts(texts):
     return re.sub(r'\s+', ' ', texts).strip()
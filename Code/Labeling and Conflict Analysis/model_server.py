@@ -0,0 +1,256 @@
+# Long-lived local inference server: loads the model once and serves the labelling, conflict analysis and summary prompts of many runs
+
+import json
+import time
+import queue
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Iterator, List, Tuple
+
+DEFAULT_PORT = 8765
+MAX_WAIT = 0.05 # seconds a batch waits for more requests once the first one arrived
+MAX_QUEUED_PROMPTS = 256 # prompts handed to the model at once at most
+REQUEST_TIMEOUT = 3600 # seconds a client waits for the answer to one request
+CLIENT_CHUNK_SIZE = 64 # prompts a client sends per request, so a long run neither hits the timeout nor starves other clients
+
+class GenerationJob:
+    """One request: its prompts and generation arguments, and the answer the batching thread fills in."""
+    def __init__(self, prompts:List, generation_args:Dict):
+        self.prompts = prompts
+        self.generation_args = generation_args
+        self.outputs = None
+        self.error = None
+        self.done = threading.Event()
+
+class BatchingWorker:
+    """
+    Takes the jobs off the request queue, waits up to `max_wait` for more after the first one, and
+    generates the prompts of all the jobs with the same generation arguments in one call of the labeller
+    (which buckets them by length, see batched_labelling.py).
+    """
+    def __init__(self, labeller, max_wait:float=MAX_WAIT, max_queued_prompts:int=MAX_QUEUED_PROMPTS):
+        self.labeller = labeller
+        self.max_wait = max_wait
+        self.max_queued_prompts = max_queued_prompts
+        self.jobs = queue.Queue()
+        self.metrics = {'requests': 0, 'prompts': 0, 'batches': 0, 'errors': 0, 'generation_seconds': 0.0}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, prompts:List, generation_args:Dict)->GenerationJob:
+        job = GenerationJob(prompts, generation_args)
+        self.jobs.put(job)
+        return job
+
+    def next_jobs(self)->List[GenerationJob]:
+        jobs = [self.jobs.get()]
+        prompts = len(jobs[0].prompts)
+        deadline = time.monotonic() + self.max_wait
+        while prompts < self.max_queued_prompts:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self.jobs.get(timeout=remaining)
+            except queue.Empty:
+                break
+            jobs.append(job)
+            prompts += len(job.prompts)
+        return jobs
+
+    def generate(self, jobs:List[GenerationJob])->None:
+        # Answers jobs with the same generation arguments with one call of the labeller
+        prompts = [prompt for job in jobs for prompt in job.prompts]
+        start = time.perf_counter()
+        try:
+            outputs = self.labeller.generate(prompts, jobs[0].generation_args)
+            error = None
+        except Exception as e:
+            outputs, error = None, f"{type(e).__name__}: {e}"
+        with self._lock:
+            self.metrics['prompts'] += len(prompts)
+            self.metrics['batches'] += 1
+            self.metrics['generation_seconds'] += time.perf_counter() - start
+        if outputs is None and len(jobs) > 1:
+            # One request's prompts must not fail the requests batched with it: retry them one by one
+            for job in jobs:
+                self.generate([job])
+            return
+        with self._lock:
+            self.metrics['requests'] += len(jobs)
+            self.metrics['errors'] += len(jobs) if outputs is None else 0
+        position = 0
+        for job in jobs:
+            if outputs is None:
+                job.error = error
+            else:
+                job.outputs = outputs[position:position + len(job.prompts)]
+            position += len(job.prompts)
+            job.done.set()
+
+    def run(self)->None:
+        while True:
+            groups = {}
+            for job in self.next_jobs():
+                groups.setdefault(json.dumps(job.generation_args, sort_keys=True), []).append(job)
+            for group in groups.values():
+                self.generate(group)
+
+    def snapshot(self)->Dict:
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics['queued_requests'] = self.jobs.qsize()
+        metrics['uptime_seconds'] = round(time.time() - self.started_at, 1)
+        metrics['prompts_per_batch'] = round(metrics['prompts'] / metrics['batches'], 2) if metrics['batches'] else 0
+        metrics['prompts_per_second'] = round(metrics['prompts'] / metrics['generation_seconds'], 3) if metrics['generation_seconds'] else 0
+        metrics['generation_seconds'] = round(metrics['generation_seconds'], 3)
+        return metrics
+
+class ModelRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /generate {"prompts": [...], "generation_args": {...}} -> {"generated_texts": [...]}
+    GET /health and GET /metrics -> JSON
+    """
+    protocol_version = 'HTTP/1.1'
+    worker: BatchingWorker = None
+    model_id = ''
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status:int, body:Dict)->None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok', 'model': self.model_id, 'queued_requests': self.worker.jobs.qsize()})
+        elif self.path == '/metrics':
+            self.send_json(200, self.worker.snapshot())
+        else:
+            self.send_json(404, {'error': f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/generate':
+            self.send_json(404, {'error': f"unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            prompts = request['prompts']
+            generation_args = request.get('generation_args', {})
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {'error': f"bad request: {e}"})
+            return
+        job = self.worker.submit(prompts, generation_args)
+        if not job.done.wait(REQUEST_TIMEOUT):
+            self.send_json(504, {'error': "generation timed out"})
+        elif job.error is not None:
+            self.send_json(500, {'error': job.error})
+        else:
+            self.send_json(200, {'generated_texts': job.outputs})
+
+def serve(labeller, model_id:str, host:str='127.0.0.1', port:int=DEFAULT_PORT, max_wait:float=MAX_WAIT,
+          max_queued_prompts:int=MAX_QUEUED_PROMPTS)->ThreadingHTTPServer:
+    """Starts the server in a background thread and returns it (server.shutdown() stops it)."""
+    worker = BatchingWorker(labeller, max_wait, max_queued_prompts)
+    handler = type('Handler', (ModelRequestHandler,), {'worker': worker, 'model_id': model_id})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class ModelClient:
+    """
+    Client of a running model server, a drop-in for the in-process model: `generate` behaves like
+    BatchedLabeller.generate and `pipe` like the text-generation pipeline called with return_full_text=False.
+    """
+    def __init__(self, url:str=f"http://127.0.0.1:{DEFAULT_PORT}", generation_args:Dict=None, timeout:float=REQUEST_TIMEOUT,
+                 chunk_size:int=CLIENT_CHUNK_SIZE):
+        # timeout: seconds to wait for the answer to one chunk of chunk_size prompts
+        self.url = url.rstrip('/')
+        self.generation_args = dict(generation_args or {})
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.seconds = 0.0
+
+    def _request(self, path:str, body:Dict=None)->Dict:
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"model server error {e.code}: {e.read().decode(errors='replace')}") from None
+
+    def generate(self, prompts:List, generation_args:Dict=None)->List[str]:
+        return [output for _, outputs in self.iter_generate(prompts, generation_args) for output in outputs]
+
+    def iter_generate(self, prompts:List, generation_args:Dict=None)->Iterator[Tuple[List[int], List[str]]]:
+        """
+        Sends the prompts chunk_size at a time and yields (indices of the prompts, generated texts) for every
+        chunk as soon as it is answered, like BatchedLabeller.iter_generate.
+        """
+        arguments = generation_args if generation_args is not None else self.generation_args
+        for position in range(0, len(prompts), self.chunk_size):
+            start = time.perf_counter()
+            chunk = prompts[position:position + self.chunk_size]
+            outputs = self._request('/generate', {'prompts': chunk, 'generation_args': arguments})['generated_texts']
+            self.rows += len(chunk)
+            self.seconds += time.perf_counter() - start
+            yield list(range(position, position + len(chunk))), outputs
+
+    def pipe(self, prompt, **generation_args)->List[Dict]:
+        return [{'generated_text': self.generate([prompt], generation_args or None)[0]}]
+
+    def health(self)->Dict:
+        return self._request('/health')
+
+    def metrics(self)->Dict:
+        return self._request('/metrics')
+
+    def report(self)->str:
+        rate = self.rows / self.seconds if self.seconds else 0
+        return f"Model server labelling: {self.rows} rows in {self.seconds:.1f} s ({rate:.2f} rows/sec)"
+
+if __name__ == '__main__':
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from batched_labelling import BatchedLabeller, MAX_BATCH_SIZE, MAX_BATCH_TOKENS
+    parser = argparse.ArgumentParser(description="Serve a causal language model to the labelling and conflict analysis runs.")
+    parser.add_argument('--model', default="meta-llama/Llama-3.1-8B-Instruct",
+                        help="e.g. hf-internal-testing/tiny-random-LlamaForCausalLM to try it on CPU")
+    parser.add_argument('--device', default='auto', help="'auto' (device_map=\"auto\") or a device such as 'cpu'")
+    parser.add_argument('--token', default=None, help="Hugging Face token, for gated models")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT * 1000, help="time a batch waits for more requests")
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--max-batch-tokens', type=int, default=MAX_BATCH_TOKENS)
+    args = parser.parse_args()
+    if args.token:
+        from huggingface_hub import login
+        login(token=args.token)
+    torch.random.manual_seed(0)
+    if args.device == 'auto':
+        model = AutoModelForCausalLM.from_pretrained(args.model, device_map="auto", torch_dtype="auto", trust_remote_code=True)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype="auto", trust_remote_code=True).to(args.device)
+    model.eval()
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    labeller = BatchedLabeller(model, tokenizer, {}, max_batch_tokens=args.max_batch_tokens, max_batch_size=args.max_batch_size)
+    server = serve(labeller, args.model, args.host, args.port, args.max_wait_ms / 1000)
+    print(f"Serving {args.model} on http://{args.host}:{args.port} (POST /generate, GET /health, GET /metrics)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
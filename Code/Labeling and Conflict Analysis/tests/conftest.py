@@ -0,0 +1,5 @@
+# The modules of the labelling stage are imported flat, as labelling_and_conflict.py does
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,92 @@
+import pytest
+
+from batched_labelling import BatchedLabeller, length_batches
+
+TINY_MODEL = 'hf-internal-testing/tiny-random-LlamaForCausalLM'
+GENERATION_ARGS = {"max_new_tokens": 8, "return_full_text": False, "temperature": 0.9, "do_sample": False}
+
+
+class StandInTokenizer:
+    """One token per word; enough for the bucketing, which does not need torch."""
+    pad_token = None
+    eos_token = '</s>'
+
+    def __call__(self, prompt):
+        if 'unencodable' in prompt:
+            raise ValueError("can not encode")
+        return {'input_ids': list(range(len(prompt.split())))}
+
+
+@pytest.fixture(scope='module')
+def model_and_tokenizer():
+    pytest.importorskip('torch')
+    transformers = pytest.importorskip('transformers')
+    try:
+        model = transformers.AutoModelForCausalLM.from_pretrained(TINY_MODEL).to('cpu').eval()
+        tokenizer = transformers.AutoTokenizer.from_pretrained(TINY_MODEL)
+    except OSError as e:
+        pytest.skip(f"{TINY_MODEL} is not available: {e}")
+    return model, tokenizer
+
+
+def prompts(count):
+    return [f"Label the license terms of: Permission is hereby granted {'free of charge ' * (i % 7)}to any person." for i in range(count)]
+
+
+def test_length_batches_respect_size_and_token_budget():
+    lengths = [5, 50, 10, 40, 20, 30]
+    batches = length_batches(lengths, max_new_tokens=10, max_batch_tokens=130, max_batch_size=2)
+    assert sorted(index for batch in batches for index in batch) == list(range(len(lengths)))
+    assert batches[0][0] == 1 # longest first
+    for batch in batches:
+        assert len(batch) <= 2
+        assert len(batch) == 1 or len(batch) * (lengths[batch[0]] + 10) <= 130
+
+
+def test_iter_generate_yields_every_batch_as_it_is_done(monkeypatch):
+    labeller = BatchedLabeller(None, StandInTokenizer(), {"max_new_tokens": 10}, max_batch_size=2)
+    generated = []
+
+    def generate_batch(batch_ids, generate_args):
+        generated.append(len(batch_ids))
+        return [f"{len(ids)} words" for ids in batch_ids]
+
+    monkeypatch.setattr(labeller, '_generate_batch', generate_batch)
+    texts = ['a b c', 'unencodable', 'a', 'a b c d e', 'a b']
+    batches = labeller.iter_generate(texts)
+    assert next(batches) == ([1], [None])
+    assert next(batches) == ([3, 0], ['5 words', '3 words'])
+    assert generated == [2] # the next batch is only generated when it is asked for
+    assert list(batches) == [([4, 2], ['2 words', '1 words'])]
+    assert labeller.generate(texts) == ['3 words', None, '1 words', '5 words', '2 words']
+    assert labeller.rows == 10
+
+
+def test_batched_outputs_match_one_at_a_time(model_and_tokenizer):
+    model, tokenizer = model_and_tokenizer
+    texts = prompts(12)
+    batched = BatchedLabeller(model, tokenizer, GENERATION_ARGS, max_batch_size=4).generate(texts)
+    single = BatchedLabeller(model, tokenizer, GENERATION_ARGS, max_batch_size=1).generate(texts)
+    assert batched == single
+    assert all(isinstance(text, str) for text in batched)
+
+
+def test_failing_prompt_only_loses_its_own_output(model_and_tokenizer, monkeypatch):
+    torch = pytest.importorskip('torch')
+    model, tokenizer = model_and_tokenizer
+    texts = prompts(8)
+    expected = BatchedLabeller(model, tokenizer, GENERATION_ARGS, max_batch_size=1).generate(texts)
+    labeller = BatchedLabeller(model, tokenizer, GENERATION_ARGS, max_batch_size=8)
+    bad_ids = torch.tensor(labeller.encode(texts[3]))
+    original_generate = model.generate
+
+    def generate(input_ids=None, **kwargs):
+        for row in input_ids:
+            if torch.equal(row[-len(bad_ids):], bad_ids):
+                raise RuntimeError("rejected prompt")
+        return original_generate(input_ids=input_ids, **kwargs)
+
+    monkeypatch.setattr(model, 'generate', generate)
+    outputs = labeller.generate(texts)
+    assert outputs[3] is None
+    assert outputs[:3] + outputs[4:] == expected[:3] + expected[4:]
@@ -0,0 +1,47 @@
+import pytest
+
+from license_fingerprint import FingerprintIndex, normalize_license_text
+
+MIT_BODY = """Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE."""
+
+
+@pytest.mark.parametrize('line', [
+    "Copyright (c) 2020 Foo",
+    "(c) 2020 Foo",
+    "© 2020 Foo",
+    " * (C) Foo Inc",
+    "// All rights reserved.",
+])
+def test_copyright_lines_are_dropped(line):
+    assert normalize_license_text(f"{line}\nMIT License") == "mit license"
+
+
+def test_words_starting_with_copyright_are_kept():
+    assert normalize_license_text("Copyrighted works,\nsee NOTICE") == "copyrighted works see notice"
+
+
+def test_copies_with_other_copyright_holders_match():
+    index = FingerprintIndex(['MIT'], [f"MIT License\n\nCopyright (c) <year> <copyright holders>\n\n{MIT_BODY}"])
+    for holder in ["(c) 2021 Some Company, Inc.\n(c) 2022 Another Author", "© 2019 Jane Doe <jane@example.com>"]:
+        assert index.match(f"MIT License\n\n{holder}\n\n{MIT_BODY}") == ('MIT', 1.0)
+
+
+def test_short_texts_are_not_fingerprinted():
+    index = FingerprintIndex(['MIT'], [MIT_BODY])
+    assert index.match("SPDX-License-Identifier: MIT") == (None, 0.0)
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from model_server import ModelClient, serve
+
+
+class StandInLabeller:
+    """Echoes every prompt with its max_new_tokens; a prompt containing 'fail' fails the whole call."""
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, prompts, generation_args=None):
+        self.calls.append((list(prompts), generation_args))
+        time.sleep(0.02)
+        if any('fail' in prompt for prompt in prompts):
+            raise RuntimeError("rejected prompt")
+        return [f"{prompt}|{generation_args.get('max_new_tokens')}" for prompt in prompts]
+
+
+@pytest.fixture
+def server():
+    labeller = StandInLabeller()
+    server = serve(labeller, 'stand-in', port=0, max_wait=0.5)
+    yield labeller, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def run_concurrently(url, requests):
+    # requests: (prompts, generation_args) sent at once from separate threads
+    results = [None] * len(requests)
+
+    def send(position, prompts, generation_args):
+        try:
+            results[position] = ModelClient(url).generate(prompts, generation_args)
+        except RuntimeError as e:
+            results[position] = e
+
+    threads = [threading.Thread(target=send, args=(position, *request)) for position, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_health_and_pipe(server):
+    _, url = server
+    client = ModelClient(url, {'max_new_tokens': 5})
+    assert client.health()['model'] == 'stand-in'
+    assert client.pipe('x', max_new_tokens=7, return_full_text=False) == [{'generated_text': 'x|7'}]
+    assert client.generate(['y']) == ['y|5']
+
+
+def test_concurrent_requests_are_batched_by_generation_args(server):
+    labeller, url = server
+    requests = [([f"p{i}a", f"p{i}b"], {'max_new_tokens': i % 2}) for i in range(6)]
+    results = run_concurrently(url, requests)
+    assert results == [[f"p{i}a|{i % 2}", f"p{i}b|{i % 2}"] for i in range(6)]
+    assert len(labeller.calls) == 2 # one call per distinct generation arguments
+    metrics = ModelClient(url).metrics()
+    assert metrics['requests'] == 6 and metrics['prompts'] == 12 and metrics['errors'] == 0
+
+
+def test_failing_request_does_not_fail_the_requests_batched_with_it(server):
+    _, url = server
+    requests = [(['a'], {'max_new_tokens': 1}), (['fail'], {'max_new_tokens': 1}), (['b'], {'max_new_tokens': 1})]
+    results = run_concurrently(url, requests)
+    assert results[0] == ['a|1'] and results[2] == ['b|1']
+    assert isinstance(results[1], RuntimeError)
+    assert ModelClient(url).metrics()['errors'] == 1
+
+
+def test_client_sends_bounded_chunks(server):
+    labeller, url = server
+    client = ModelClient(url, {'max_new_tokens': 3}, chunk_size=2)
+    prompts = [f"p{i}" for i in range(5)]
+    assert client.generate(prompts) == [f"p{i}|3" for i in range(5)]
+    assert [len(prompts) for prompts, _ in labeller.calls] == [2, 2, 1]
+    assert client.metrics()['requests'] == 3 and client.rows == 5
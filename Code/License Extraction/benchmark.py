@@ -0,0 +1,282 @@
+# Benchmarks of the extraction stages on a synthetic corpus (see synthetic_corpus.py); results are written as JSON
+
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import platform
+import resource
+import tempfile
+import argparse
+import threading
+import contextlib
+import subprocess
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Dict, List
+from synthetic_corpus import generate_corpus, MIT_TEXT
+
+STAND_IN_LICENSES = ['MIT', 'Apache-2.0', 'BSD-3-Clause', 'ISC', 'GPL-3.0-only']
+
+def stand_in_license(name:str)->str:
+    return STAND_IN_LICENSES[zlib.crc32(name.encode()) % len(STAND_IN_LICENSES)]
+
+class StandInRegistryHandler(BaseHTTPRequestHandler):
+    """
+    Answers /<registry>/<package>... with a response in the format the matching get_*_license
+    function of referenced_license.py parses, after `latency` seconds.
+    """
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        parts = self.path.strip('/').split('/')
+        registry, name = parts[0], parts[1] if len(parts) > 1 else ''
+        license = stand_in_license(name)
+        if registry == 'pypi':
+            body, content_type = json.dumps({'info': {'name': name, 'license': license}}), 'application/json'
+        elif registry == 'npm':
+            body, content_type = json.dumps({'name': name, 'license': license}), 'application/json'
+        elif registry == 'crates':
+            body, content_type = json.dumps({'versions': [{'num': '1.0.0', 'license': license}]}), 'application/json'
+        elif registry == 'rubygems':
+            body, content_type = f'<html><body><span class="gem__ruby-version">{license}</span></body></html>', 'text/html'
+        elif registry == 'vcpkg':
+            body = f'<html><body><div class="sidebar-container"><div class="sidebar-section"><div>{license}</div></div></div></body></html>'
+            content_type = 'text/html'
+        elif registry == 'nuget':
+            body = f'<html><body><ul><li><i class="ms-Icon ms-Icon--Certificate"></i><a href="#">{license}</a></li></ul></body></html>'
+            content_type = 'text/html'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_stand_in_registry(latency:float=0.0)->ThreadingHTTPServer:
+    handler = type('Handler', (StandInRegistryHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def stand_in_registry_urls(base_url:str)->Dict[str, str]:
+    # Same keys as referenced_license.REGISTRY_URLS
+    return {'pypi': base_url + '/pypi/{}/json', 'npm': base_url + '/npm/{}', 'npm_web': base_url + '/npm_web/{}',
+            'rubygems': base_url + '/rubygems/{}', 'crates': base_url + '/crates/{}',
+            'vcpkg': base_url + '/vcpkg/{}', 'nuget': base_url + '/nuget/{}'}
+
+def synthetic_license_frame(rows:int, distinct_texts:int, seed:int=0)->pd.DataFrame:
+    """Rows in the output columns whose texts (with blank lines and repeated spaces to clean) repeat across repositories."""
+    rng = random.Random(seed)
+    texts = []
+    for i in range(distinct_texts):
+        text = MIT_TEXT.format(year=1995 + i % 30, owner=f"Owner {i}")
+        texts.append(text.replace('\n\n', '\n\n\n').replace(', ', ',' + ' ' * rng.randint(1, 4)))
+    types = ['Declared', 'Inline', 'Referenced', 'Vendored']
+    names = [f"repo{rng.randrange(rows // 10 + 1)}" for _ in range(rows)]
+    return pd.DataFrame({'Repository name': names, 'Repository path': [f"/corpus/{name}/LICENSE" for name in names],
+                         'License text': [texts[rng.randrange(distinct_texts)] for _ in range(rows)],
+                         'License type': [rng.choice(types) for _ in range(rows)]})
+
+# Every stage takes the corpus summary and the options and returns the work it did: 'files' and 'bytes'
+# for the rates, plus counts that show the stage did what it should.
+
+def bench_declared(corpus:Dict, options:Dict)->Dict:
+    from declared_license import iter_declared_licenses
+    records = sum(1 for _ in iter_declared_licenses(corpus['repository_paths']))
+    return {'files': corpus['files'], 'bytes': corpus['bytes'], 'records': records}
+
+def bench_inline(corpus:Dict, options:Dict)->Dict:
+    # With options['scan_cache'] the scan goes through a new ScanCache, as main.py does by default (a first, cold run)
+    from inline_license import iter_inline_licenses
+    from scan_cache import ScanCache
+    cache = ScanCache(options['scan_cache_path']) if options.get('scan_cache') else None
+    records = sum(1 for _ in iter_inline_licenses(corpus['repository_paths'], cache, header_bytes=options.get('header_bytes')))
+    if cache is not None:
+        cache.close()
+    return {'files': corpus['files'], 'bytes': corpus['bytes'], 'records': records}
+
+def bench_inline_header(corpus:Dict, options:Dict)->Dict:
+    from inline_license import HEADER_BYTES
+    return bench_inline(corpus, dict(options, header_bytes=HEADER_BYTES))
+
+def bench_scan(corpus:Dict, options:Dict)->Dict:
+    from extraction import iter_scanned_licenses
+    records = sum(len(records) for _, records, _ in iter_scanned_licenses(corpus['repository_paths']))
+    return {'files': corpus['files'], 'bytes': corpus['bytes'], 'records': records}
+
+def bench_manifests(corpus:Dict, options:Dict)->Dict:
+    from referenced_license import collect_dependencies
+    repo_dependencies = collect_dependencies(corpus['repository_paths'])
+    dependencies = sum(len(names) for _, all_dependencies in repo_dependencies for names in all_dependencies.values())
+    return {'files': corpus['files'], 'bytes': corpus['bytes'], 'dependencies': dependencies}
+
+def bench_remove_spaces(corpus:Dict, options:Dict)->Dict:
+    from utils import remove_spaces
+    texts = options['frame']['License text'].tolist()
+    for text in texts:
+        remove_spaces(text)
+    return {'files': len(texts), 'bytes': sum(len(text) for text in texts)}
+
+def bench_clean_dataframe(corpus:Dict, options:Dict)->Dict:
+    from pipeline import clean_dataframe
+    df = options['frame']
+    cleaned = clean_dataframe(df, 'License text', 'Repository name', filter_types=('Declared', 'Vendored'))
+    return {'files': len(df), 'bytes': int(df['License text'].str.len().sum()), 'rows_kept': len(cleaned)}
+
+def bench_referenced(corpus:Dict, options:Dict)->Dict:
+    # Dependency collection is not timed here (see 'manifests'), only the resolution against the stand-in registry
+    import referenced_license
+    repo_dependencies = options['repo_dependencies']
+    server = start_stand_in_registry(options.get('registry_latency', 0.0))
+    try:
+        referenced_license.REGISTRY_URLS.update(stand_in_registry_urls(f"http://127.0.0.1:{server.server_address[1]}"))
+        start = time.perf_counter()
+        licenses = referenced_license.resolve_unique_dependencies(repo_dependencies)
+        options['elapsed'] = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    resolved = sum(1 for license in licenses.values() if license in STAND_IN_LICENSES)
+    return {'files': len(licenses), 'bytes': 0, 'resolved': resolved}
+
+STAGES:Dict[str, Callable[[Dict, Dict], Dict]] = {
+    'declared': bench_declared,
+    'inline': bench_inline,
+    'inline_header': bench_inline_header,
+    'scan': bench_scan,
+    'manifests': bench_manifests,
+    'remove_spaces': bench_remove_spaces,
+    'clean_dataframe': bench_clean_dataframe,
+    'referenced': bench_referenced,
+}
+
+def peak_rss_mb()->float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+def bytes_read()->int:
+    # Bytes the process read with read() so far (Linux only, None elsewhere); memory-mapped reads are not counted
+    try:
+        with open('/proc/self/io') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('rchar:'))
+    except (OSError, StopIteration):
+        return None
+
+def prepare_options(stage:str, corpus:Dict, options:Dict)->Dict:
+    # Inputs built before the clock starts
+    options = dict(options)
+    if options.get('scan_cache'):
+        options['scan_cache_path'] = os.path.join(tempfile.mkdtemp(prefix='scan_cache_'), 'scan_cache.sqlite')
+    if stage in ('remove_spaces', 'clean_dataframe'):
+        options['frame'] = synthetic_license_frame(options['rows'], options['distinct_texts'], options['seed'])
+    if stage == 'referenced':
+        from referenced_license import collect_dependencies
+        options['repo_dependencies'] = collect_dependencies(corpus['repository_paths'])
+    return options
+
+def run_stage(stage:str, corpus:Dict, options:Dict)->Dict:
+    """Runs one stage in the current (fresh) process; the extractors' progress output is discarded."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        options = prepare_options(stage, corpus, options)
+        baseline_rss = peak_rss_mb()
+        baseline_read = bytes_read()
+        start = time.perf_counter()
+        result = STAGES[stage](corpus, options)
+        seconds = options.get('elapsed', time.perf_counter() - start)
+        read = bytes_read()
+    if options.get('scan_cache_path'):
+        shutil.rmtree(os.path.dirname(options['scan_cache_path']), ignore_errors=True)
+    # 'bytes' is the size of the input, 'bytes_read' what the stage actually read (e.g. only the headers)
+    result['bytes_read'] = read - baseline_read if read is not None and baseline_read is not None else None
+    result.update(seconds=round(seconds, 4), files_per_sec=round(result['files'] / seconds, 1) if seconds else None,
+                  mb_per_sec=round(result['bytes'] / 2**20 / seconds, 2) if seconds else None,
+                  peak_rss_mb=round(peak_rss_mb(), 1), baseline_rss_mb=round(baseline_rss, 1))
+    return result
+
+def measure(stage:str, corpus:Dict, options:Dict, repeat:int=1)->Dict:
+    """Best of `repeat` runs, each in a new spawned process so that the peak RSS belongs to the stage alone."""
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(run_stage, stage, corpus, options).result())
+    best = min(runs, key=lambda run: run['seconds'])
+    best['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+    best['runs'] = [run['seconds'] for run in runs]
+    return best
+
+def environment()->Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def run_benchmarks(stages:List[str], corpus_options:Dict, options:Dict, root:str=None, repeat:int=1)->Dict:
+    # root: directory of the synthetic corpus; a temporary directory (removed afterwards) if None
+    temporary = root is None
+    root = tempfile.mkdtemp(prefix='license_corpus_') if temporary else root
+    try:
+        corpus = generate_corpus(root, **corpus_options)
+        results = {'environment': environment(),
+                   'corpus': dict(corpus_options, files=corpus['files'], mb=round(corpus['bytes'] / 2**20, 2)),
+                   'options': options, 'stages': {}}
+        for stage in stages:
+            results['stages'][stage] = measure(stage, corpus, options, repeat)
+            result = results['stages'][stage]
+            read_mb = round(result['bytes_read'] / 2**20, 2) if result['bytes_read'] is not None else '?'
+            print(f"{stage:>16}: {result['seconds']:8.3f} s  {result['files_per_sec'] or 0:>10} files/s  "
+                  f"{result['mb_per_sec'] or 0:>8} MB/s  {read_mb:>8} MB read  peak RSS {result['peak_rss_mb']} MB")
+        return results
+    finally:
+        if temporary:
+            shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the extraction stages on a deterministic synthetic corpus.")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file the results are written to")
+    parser.add_argument('--root', default=None, help="keep the generated corpus in this directory")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per stage, the fastest is reported")
+    parser.add_argument('--repos', type=int, default=5)
+    parser.add_argument('--files', type=int, default=200, help="source files per repository")
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--file-kb', type=int, default=4)
+    parser.add_argument('--header-ratio', type=float, default=0.5)
+    parser.add_argument('--vendored-files', type=int, default=50)
+    parser.add_argument('--huge-files', type=int, default=0)
+    parser.add_argument('--huge-file-mb', type=int, default=25)
+    parser.add_argument('--dependencies', type=int, default=20, help="dependencies per ecosystem and repository")
+    parser.add_argument('--rows', type=int, default=200000, help="rows of the frame cleaned by remove_spaces/clean_dataframe")
+    parser.add_argument('--distinct-texts', type=int, default=500)
+    parser.add_argument('--registry-latency', type=float, default=0.0, help="seconds the stand-in registry waits per answer")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scan-cache', action='store_true', help="run the inline stages through a new scan cache, like main.py")
+    args = parser.parse_args()
+    corpus_options = {'repos': args.repos, 'seed': args.seed, 'files': args.files, 'depth': args.depth,
+                      'file_kb': args.file_kb, 'header_ratio': args.header_ratio, 'vendored_files': args.vendored_files,
+                      'huge_files': args.huge_files, 'huge_file_mb': args.huge_file_mb, 'dependencies': args.dependencies}
+    options = {'rows': args.rows, 'distinct_texts': args.distinct_texts, 'registry_latency': args.registry_latency, 'seed': args.seed,
+               'scan_cache': args.scan_cache}
+    results = run_benchmarks(args.stages, corpus_options, options, args.root, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
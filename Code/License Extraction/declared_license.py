@@ -1,63 +1,150 @@
 ## Extract the declared licenses
 
-import os
-import glob
-from typing import List, Dict
+from typing import Dict, Iterator, List, Tuple
+from walker import Extractor, RepositoryWalker
+from pruning import PathPruner, is_binary
+from keyword_matcher import load_matcher
+from scan_cache import file_stat
+
+# license filename prefixes (previously the glob patterns 'license*','LICENSE*',...)
+LICENSE_FILE_PREFIXES = ('license','copying','LICENSE','COPYING','License','Copying')
+
+def is_license_filename(file_name:str)->bool:
+    return file_name.startswith(LICENSE_FILE_PREFIXES)
+
+class LicenseFileMatcher(Extractor):
+    """Collects the paths of license files seen during a repository walk."""
+    name = 'declared'
+
+    def start(self, repo_path:str)->None:
+        self.license_files = []
+        # Texts of the license files that were handed over as blobs instead of being read from disk
+        self.license_texts = {}
+
+    def wants(self, file_name:str)->bool:
+        return is_license_filename(file_name)
+
+    def visit(self, file_path:str)->None:
+        self.license_files.append(file_path)
+
+    def visit_blob(self, file_path:str, data:bytes)->None:
+        self.license_files.append(file_path)
+        self.license_texts[file_path] = license_text_from_bytes(file_path, data)
+
+    def finish(self)->List[str]:
+        return self.license_files
 
 # Search for license files in the repository
-def find_license_files(repo_path:str)->List[str]:
+def find_license_files(repo_path:str, pruner:PathPruner=None)->List[str]:
+    return RepositoryWalker([LicenseFileMatcher()], pruner).walk(repo_path)['declared']
+
+# Vendored trees are walked for their license files only; nested vendored trees are walked too.
+VENDORED_PRUNER = PathPruner(vendor_dirs=(), use_gitignore=False, managed_vendor_dirs=())
+
+def find_vendored_license_files(vendored_dirs:List[str])->List[str]:
     license_files = []
-    # license filename patterns
-    patterns = ['license*','copying*','LICENSE*','COPYING*','License*','Copying*']
-    for root, _, files in os.walk(repo_path):
-        for pattern in patterns:
-            search_pattern = os.path.join(root, pattern)
-            matching_files = glob.glob(search_pattern)
-            for file_path in matching_files:
-                license_files.append(file_path)
+    for vendored_dir in vendored_dirs:
+        license_files.extend(find_license_files(vendored_dir, VENDORED_PRUNER))
     return license_files
 
 # Function to filter out incorrect license texts.
 def contains_garbage_keyword(input_text):
-    """Returns True if garbage keyword exists in the input_text."""
-    garbage_keywords = ["<?php","<!DOCTYPE","/*!","<?xml","cocos2d-x authors & contributors","li#","<p ","{-#","#copyright{","#!/bin/true","<!--","@import","<div","# Authors","<a ",".copy","&lt;","use std","#set","/*","#ifndef","&gt;","#include "]
-    for keyword in garbage_keywords:
-        if keyword in input_text:
-            print("keyword - ", keyword)
-            return True
+    """Returns True if garbage keyword exists in the input_text (rule set 'garbage' of keyword_rules.json)."""
+    hit = load_matcher('garbage').first(input_text)
+    if hit:
+        print("keyword - ", hit[1])
+        return True
     return False
 
+# Bump when the way license texts are read or filtered changes, so cached results are not reused.
+CACHE_VERSION = '1'
+
 # Extract the declared licenses.
-def extract_license_text_from_license_file(license_file:str):
+def extract_license_text_from_license_file(license_file:str, cache=None):
+    # cache: optional ScanCache; the text of an unchanged license file is taken from it
+    if cache is not None:
+        hit, license_text = cache.get('declared', license_file, CACHE_VERSION)
+        if hit:
+            return license_text
+        st = file_stat(license_file)
+    license_text = _read_license_text(license_file)
+    if cache is not None:
+        cache.put('declared', license_file, license_text, CACHE_VERSION, st)
+    return license_text
+
+def _read_license_text(license_file:str):
     try:
         #, errors='ignore'
         with open(license_file, 'r', encoding="utf8") as f:
             license_text = f.read()
-            flag = contains_garbage_keyword(license_text)
-        if flag:
-            print("flag - ", flag)
+        if is_binary(license_text):
             return None
-        return license_text
+        return filter_license_text(license_text)
     except Exception as e:
         print(f"Error reading file {license_file}: {e}") # This usually happens if the folder name has the word license in it.
         return None
 
-# Extract and return license texts
-def extract_declared_licenses(repo_paths:List)->Dict:
+def filter_license_text(license_text:str):
+    flag = contains_garbage_keyword(license_text)
+    if flag:
+        print("flag - ", flag)
+        return None
+    return license_text
+
+def license_text_from_bytes(license_file:str, data:bytes):
+    # Same as reading the file in text mode: strict utf-8 and universal newlines
+    try:
+        return filter_license_text(data.decode('utf8').replace('\r\n', '\n').replace('\r', '\n'))
+    except UnicodeDecodeError as e:
+        print(f"Error reading file {license_file}: {e}")
+        return None
+
+# Add the declared licenses found in the license_files of a repository to the license_dict.
+def declared_license_records(repo_path:str, license_files:List[str], cache=None, license_type:str="Declared",
+                             license_texts:Dict=None)->Iterator[Tuple]:
+    """Yields a (repository name, path, license text, license type) record for every license file with a text."""
+    # license_texts: {file: text} of license files that are not read from disk (e.g. git blobs)
+    for file in license_files:
+        print(f"Checking the path: {file}...")
+        if license_texts is not None and file in license_texts:
+            license_text = license_texts[file]
+        else:
+            license_text = extract_license_text_from_license_file(file, cache)
+        if license_text:
+            yield (repo_path.split('/')[-1], file, str(license_text), license_type)
+
+def add_declared_licenses(license_dict:Dict, repo_path:str, license_files:List[str], cache=None, license_type:str="Declared",
+                          license_texts:Dict=None)->Dict:
+    for name, path, text, type_ in declared_license_records(repo_path, license_files, cache, license_type, license_texts):
+        license_dict['Repository name'].append(name)
+        license_dict['Repository path'].append(path)
+        license_dict['License text'].append(text)
+        license_dict['License type'].append(type_)
+    return license_dict
+
+def iter_declared_licenses(repo_paths:List, cache=None, pruner:PathPruner=None)->Iterator[Tuple]:
     # repo_paths: ["<path_to_your_directory>/<repo_name>",...]
+    # cache: optional ScanCache used to skip unchanged license files
+    # pruner: decides which directories and files are skipped; with scan_vendored, the license
+    #         files of vendored trees are yielded with the license type "Vendored"
+    for repo_path in repo_paths:
+        walker = RepositoryWalker([LicenseFileMatcher()], pruner)
+        yield from declared_license_records(repo_path, walker.walk(repo_path)['declared'], cache)
+        yield from declared_license_records(repo_path, find_vendored_license_files(walker.vendored_dirs), cache, "Vendored")
+        if cache is not None:
+            cache.flush()
+
+# Extract and return license texts
+def extract_declared_licenses(repo_paths:List, cache=None, pruner:PathPruner=None)->Dict:
+    # Same as iter_declared_licenses, collected into a dictionary of columns
     license_dict = {"Repository name":[],
                     "Repository path":[],
                     "License text":[],
                     "License type":[]
                     }
-    for repo_path in repo_paths:
-        license_files = find_license_files(repo_path)
-        for file in license_files:
-            print(f"Checking the path: {file}...")
-            license_text = extract_license_text_from_license_file(file)
-            if license_text:
-                license_dict['Repository name'].append(repo_path.split('/')[-1])
-                license_dict['Repository path'].append(file)
-                license_dict['License text'].append(str(license_text))
-                license_dict['License type'].append("Declared")
+    for name, path, text, type_ in iter_declared_licenses(repo_paths, cache, pruner):
+        license_dict['Repository name'].append(name)
+        license_dict['Repository path'].append(path)
+        license_dict['License text'].append(text)
+        license_dict['License type'].append(type_)
     return license_dict
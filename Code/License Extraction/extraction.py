@@ -0,0 +1,63 @@
+# Extract the declared, inline and referenced licenses with a single walk per repository
+
+from typing import Dict, Iterator, List, Tuple
+from walker import RepositoryWalker
+from pruning import PathPruner
+from declared_license import LicenseFileMatcher, declared_license_records, find_vendored_license_files
+from inline_license import CommentScanner, inline_license_records
+from referenced_license import ManifestParser, ref_licenses, build_referenced_license_dict
+
+def new_license_dict()->Dict:
+    return {"Repository name":[],
+            "Repository path":[],
+            "License text":[],
+            "License type":[]
+            }
+
+def append_record(license_dict:Dict, record:Tuple)->None:
+    # record: (repository name, path, license text, license type), in the order of the columns
+    for column, value in zip(license_dict, record):
+        license_dict[column].append(value)
+
+def scan_repository(repo_path:str, cache=None, pruner:PathPruner=None, header_bytes:int=None)->Dict:
+    """Walk the repository once; returns the license files, inline comments, manifest files and vendored directories found in it."""
+    walker = RepositoryWalker([LicenseFileMatcher(), CommentScanner(cache, header_bytes), ManifestParser()], pruner)
+    found = walker.walk(repo_path)
+    found['vendored'] = walker.vendored_dirs
+    return found
+
+def iter_scanned_licenses(repo_paths:List, cache=None, pruner:PathPruner=None, header_bytes:int=None)->Iterator[Tuple[str, List, Dict]]:
+    """Yields (repository path, declared and inline license records, dependencies) as every repository is walked."""
+    for repo_path in repo_paths:
+        found = scan_repository(repo_path, cache, pruner, header_bytes)
+        records = list(declared_license_records(repo_path, found['declared'], cache))
+        records.extend(declared_license_records(repo_path, find_vendored_license_files(found['vendored']), cache, "Vendored"))
+        records.extend(inline_license_records(repo_path, found['inline']))
+        yield (repo_path, records, ref_licenses(repo_path, found['referenced'], cache))
+        if cache is not None:
+            cache.flush()
+
+def scan_licenses(repo_paths:List, cache=None, pruner:PathPruner=None, header_bytes:int=None)->Tuple[Dict, Dict, List]:
+    """Declared and inline licenses, and the (repository path, dependencies) of every repository."""
+    # repo_paths: ["<path_to_your_directory>/<repo_name>",...]
+    # cache: optional ScanCache used to skip unchanged files
+    # pruner: decides which directories and files are skipped
+    # header_bytes: scan only the header of every source file for inline licenses (None scans whole files)
+    return collect_scanned_licenses(iter_scanned_licenses(repo_paths, cache, pruner, header_bytes))
+
+def collect_scanned_licenses(scanned:Iterator[Tuple[str, List, Dict]])->Tuple[Dict, Dict, List]:
+    # Splits the output of iter_scanned_licenses into the declared and inline dictionaries and the dependencies
+    declared_dict, inline_dict, repo_dependencies = new_license_dict(), new_license_dict(), []
+    for repo_path, records, dependencies in scanned:
+        for record in records:
+            append_record(inline_dict if record[3] == 'Inline' else declared_dict, record)
+        repo_dependencies.append((repo_path, dependencies))
+    return declared_dict, inline_dict, repo_dependencies
+
+def extract_all_licenses(repo_paths:List, cache=None, pruner:PathPruner=None, registry_cache=None,
+                         snapshot=None, mode:str='online', header_bytes:int=None)->Tuple[Dict, Dict, Dict]:
+    # registry_cache: optional RegistryCache of the licenses already fetched from the registries
+    # snapshot, mode: optional RegistrySnapshot and resolution mode for offline runs
+    # header_bytes: as in scan_licenses
+    declared_dict, inline_dict, repo_dependencies = scan_licenses(repo_paths, cache, pruner, header_bytes)
+    return declared_dict, inline_dict, build_referenced_license_dict(repo_dependencies, registry_cache, snapshot, mode)
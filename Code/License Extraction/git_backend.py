@@ -0,0 +1,252 @@
+# Scan a repository's tree at a given ref straight from the git object database, without a checkout
+
+import os
+import subprocess
+import threading
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+from walker import Extractor
+from pruning import PathPruner, SNIFF_BYTES, is_binary
+from declared_license import LicenseFileMatcher, declared_license_records, is_license_filename, license_text_from_bytes
+from inline_license import CommentScanner, inline_license_records
+from referenced_license import ManifestParser, ref_licenses
+from extraction import collect_scanned_licenses
+
+GIT_ENV = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+READ_CHUNK = 1 << 20 # bytes skipped at a time past the read limit of a blob
+
+def promisor_remote(repo_path:str)->str:
+    """The remote missing objects of a partial clone are fetched from, None for a complete clone."""
+    output = subprocess.run(['git', '-C', repo_path, 'config', '--get-regexp', r'^remote\..*\.promisor$'],
+                            capture_output=True, env=GIT_ENV).stdout.decode()
+    for line in output.splitlines():
+        key, _, value = line.partition(' ')
+        if value.strip().lower() == 'true':
+            return key[len('remote.'):-len('.promisor')]
+    return None
+
+def missing_objects(repo_path:str, ref:str='HEAD')->Set[str]:
+    # Objects of the tree of ref that are not in the object database, listed without fetching them
+    output = subprocess.run(['git', '-C', repo_path, 'rev-list', '--objects', '--missing=print', '--no-walk', ref],
+                            check=True, capture_output=True, env=GIT_ENV).stdout.decode()
+    return {line[1:] for line in output.splitlines() if line.startswith('?')}
+
+def prefetch_blobs(repo_path:str, oids:Iterable[str], ref:str='HEAD')->Set[str]:
+    """
+    Fetches the blobs of oids that a partial (e.g. blobless) clone does not have yet with one `git fetch`,
+    instead of letting `git cat-file` fetch them lazily one at a time. Returns the ones still missing.
+    """
+    remote = promisor_remote(repo_path)
+    if remote is None:
+        return set()
+    missing = missing_objects(repo_path, ref) & set(oids)
+    if not missing:
+        return missing
+    print(f"Fetching {len(missing)} blobs of {repo_path} from {remote}...")
+    result = subprocess.run(['git', '-C', repo_path, 'fetch', '--no-tags', '--no-write-fetch-head', '--recurse-submodules=no',
+                             '--filter=blob:none', '--stdin', remote],
+                            input='\n'.join(sorted(missing)).encode(), capture_output=True, env=GIT_ENV)
+    if result.returncode != 0:
+        print(f"Could not fetch the blobs of {repo_path}: {result.stderr.decode(errors='replace').strip()}")
+    return missing_objects(repo_path, ref) & missing
+
+def object_sizes(repo_path:str, oids:Iterable[str])->Dict[str, int]:
+    # Sizes of objects present in the object database, from one `git cat-file --batch-check`
+    output = subprocess.run(['git', '-C', repo_path, 'cat-file', '--batch-check'], input='\n'.join(oids).encode(),
+                            check=True, capture_output=True, env=GIT_ENV).stdout.decode()
+    sizes = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) == 3:
+            sizes[fields[0]] = int(fields[2])
+    return sizes
+
+def list_tree(repo_path:str, ref:str='HEAD')->List[Tuple[str, str, int]]:
+    """
+    (path, blob id, size) of every regular file in the tree of ref; works for bare and partial clones.
+    The size of a blob a partial clone has not fetched yet is None (git needs the blob to tell it).
+    """
+    partial = promisor_remote(repo_path) is not None
+    output = subprocess.run(['git', '-C', repo_path, 'ls-tree', '-r', '-z', '--full-tree'] + ([] if partial else ['-l']) + [ref],
+                            check=True, capture_output=True, env=GIT_ENV).stdout
+    entries = []
+    for record in output.split(b'\0'):
+        if not record:
+            continue
+        info, path = record.split(b'\t', 1)
+        mode, object_type, oid = info.split()[:3]
+        # Only regular files; symlinks (120000) and submodules (commit entries) have no content to scan
+        if object_type != b'blob' or mode == b'120000':
+            continue
+        entries.append((path.decode('utf-8', errors='surrogateescape'), oid.decode(), None if partial else int(info.split()[3])))
+    if partial:
+        missing = missing_objects(repo_path, ref)
+        sizes = object_sizes(repo_path, [oid for _, oid, _ in entries if oid not in missing])
+        entries = [(path, oid, sizes.get(oid)) for path, oid, _ in entries]
+    return entries
+
+class GitObjectReader:
+    """A long-lived `git cat-file --batch` process of a repository; missing blobs of partial clones are fetched on demand."""
+    def __init__(self, repo_path:str):
+        self.repo_path = repo_path
+        self._lock = threading.Lock()
+        self._start()
+
+    def _start(self)->None:
+        self.process = subprocess.Popen(['git', '-C', self.repo_path, 'cat-file', '--batch'], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=GIT_ENV)
+
+    def read(self, oid:str, limit:int=None)->bytes:
+        """
+        Content of the object oid, or only its first `limit` bytes (the rest is still streamed by git,
+        but skipped instead of kept). Raises KeyError if the object can not be read.
+        """
+        with self._lock:
+            try:
+                self.process.stdin.write(oid.encode() + b'\n')
+                self.process.stdin.flush()
+                header = self.process.stdout.readline()
+            except BrokenPipeError:
+                header = b''
+            if not header:
+                # git gave up on the object (e.g. a failed lazy fetch) and exited: start a new process for the next ones
+                self.close()
+                self._start()
+                raise KeyError(f"object {oid} could not be read")
+            header = header.split()
+            if len(header) != 3:
+                raise KeyError(f"object {oid} is missing")
+            size = int(header[2])
+            data = self.process.stdout.read(size if limit is None else min(size, limit))
+            remaining = size - len(data)
+            while remaining > 0:
+                chunk = self.process.stdout.read(min(remaining, READ_CHUNK))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+            self.process.stdout.read(1) # the newline after the content
+            return data
+
+    def close(self)->None:
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class GitTreeWalker:
+    """Like walker.RepositoryWalker, but walks the tree of a ref and hands blob contents to `visit_blob`."""
+    def __init__(self, extractors:List[Extractor]=None, pruner:PathPruner=None):
+        self.extractors = list(extractors) if extractors else []
+        self.pruner = pruner if pruner is not None else PathPruner()
+        self.vendored_texts = {}
+        self.skipped_blobs = [] # (path, reason) of the blobs that could not be read
+
+    def register(self, extractor:Extractor)->Extractor:
+        self.extractors.append(extractor)
+        return extractor
+
+    def _directory_decision(self, repo_path:str, directory:str, decisions:Dict, children:Dict)->str:
+        # Returns 'walk', 'skip' or 'vendored' for a directory of the tree; a directory inherits the verdict of a pruned parent.
+        # .gitignore is not consulted: committed files are part of the project by definition.
+        if directory in decisions:
+            return decisions[directory]
+        parent, _, name = directory.rpartition('/')
+        decision = self._directory_decision(repo_path, parent, decisions, children) if parent else 'walk'
+        if decision == 'walk':
+            # Build and vendor markers are looked up in the tree, not on the disk
+            decision = self.pruner.check_dir(os.path.join(repo_path, directory), name, [], children.get(directory, []))
+        decisions[directory] = decision
+        return decision
+
+    def _too_large(self, size:int)->bool:
+        return size is not None and self.pruner.max_file_size is not None and size > self.pruner.max_file_size
+
+    def skip(self, path:str, reason:str)->None:
+        print(f"Skipping {path}: {reason}")
+        self.skipped_blobs.append((path, reason))
+
+    def walk(self, repo_path:str, ref:str='HEAD')->Dict:
+        # Blobs that can not be read (missing from the object database) are skipped and listed in self.skipped_blobs
+        for extractor in self.extractors:
+            extractor.start(repo_path)
+        self.skipped_blobs = []
+        vendored_blobs, wanted_blobs = [], []
+        decisions = {}
+        entries = list_tree(repo_path, ref)
+        children = {} # directory -> names of its files and sub-directories
+        for path, _, _ in entries:
+            parts = path.split('/')
+            for depth in range(1, len(parts)):
+                children.setdefault('/'.join(parts[:depth]), set()).add(parts[depth])
+        for path, oid, size in entries:
+            directory, _, name = path.rpartition('/')
+            decision = self._directory_decision(repo_path, directory, decisions, children) if directory else 'walk'
+            if decision == 'vendored':
+                if self.pruner.scan_vendored and is_license_filename(name):
+                    vendored_blobs.append((os.path.join(repo_path, path), oid))
+                continue
+            if decision == 'skip':
+                continue
+            extractors = [extractor for extractor in self.extractors if extractor.wants(name)]
+            if not extractors or self._too_large(size):
+                continue
+            wanted_blobs.append((os.path.join(repo_path, path), oid, size, extractors))
+        # Blobs a partial clone does not have are fetched together before reading; their sizes are only known then
+        missing = prefetch_blobs(repo_path, [oid for _, oid, _, _ in wanted_blobs] + [oid for _, oid in vendored_blobs], ref)
+        sizes = object_sizes(repo_path, [oid for _, oid, size, _ in wanted_blobs if size is None and oid not in missing])
+        with GitObjectReader(repo_path) as reader:
+            for path, oid, size, extractors in wanted_blobs:
+                if oid in missing:
+                    self.skip(path, f"blob {oid} is not in the object database")
+                    continue
+                if size is None and self._too_large(sizes.get(oid)):
+                    continue
+                limits = [extractor.read_limit for extractor in extractors]
+                limit = None if None in limits else max(limits + [SNIFF_BYTES if self.pruner.sniff_binary else 0])
+                try:
+                    data = reader.read(oid, limit)
+                except KeyError as e:
+                    self.skip(path, e.args[0])
+                    continue
+                if self.pruner.sniff_binary and is_binary(data):
+                    continue
+                for extractor in extractors:
+                    extractor.visit_blob(path, data)
+            # Vendored trees only contribute their license files
+            self.vendored_texts = {}
+            for path, oid in vendored_blobs:
+                if oid in missing:
+                    self.skip(path, f"blob {oid} is not in the object database")
+                    continue
+                try:
+                    self.vendored_texts[path] = license_text_from_bytes(path, reader.read(oid))
+                except KeyError as e:
+                    self.skip(path, e.args[0])
+        return {extractor.name: extractor.finish() for extractor in self.extractors}
+
+def iter_git_licenses(repo_paths:List, ref:str='HEAD', cache=None, pruner:PathPruner=None, header_bytes:int=None)->Iterator[Tuple[str, List, Dict]]:
+    """
+    Same as extraction.iter_scanned_licenses, but reads the tree of `ref` from the object database of
+    every repository (bare, partial or regular clone) instead of walking a checkout. `cache` is accepted
+    for symmetry only: blobs are content addressed and read once per run anyway.
+    """
+    for repo_path in repo_paths:
+        matcher, parser = LicenseFileMatcher(), ManifestParser()
+        walker = GitTreeWalker([matcher, CommentScanner(header_bytes=header_bytes), parser], pruner)
+        found = walker.walk(repo_path, ref)
+        records = list(declared_license_records(repo_path, found['declared'], license_texts=matcher.license_texts))
+        records.extend(declared_license_records(repo_path, list(walker.vendored_texts), license_type="Vendored",
+                                                license_texts=walker.vendored_texts))
+        records.extend(inline_license_records(repo_path, found['inline']))
+        yield (repo_path, records, ref_licenses(repo_path, found['referenced'], contents=parser.manifest_contents))
+
+def scan_git_licenses(repo_paths:List, ref:str='HEAD', cache=None, pruner:PathPruner=None, header_bytes:int=None)->Tuple[Dict, Dict, List]:
+    """Same as extraction.scan_licenses, reading the tree of `ref` from the object database."""
+    return collect_scanned_licenses(iter_git_licenses(repo_paths, ref, cache, pruner, header_bytes))
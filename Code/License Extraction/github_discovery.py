@@ -0,0 +1,194 @@
+# Concurrent, rate-limit aware discovery of repositories through the GitHub search API
+
+import math
+import time
+import json
+import sqlite3
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+GITHUB_API_URL = "https://api.github.com"
+SEARCH_QUERY = "language:{language} stars:{low}..{high}"
+STAR_RANGE = (100, 3000) # previously 100..30000
+PER_PAGE = 100 # max allowed value
+MAX_SEARCH_RESULTS = 1000 # the search API never returns more than this per query
+REQUEST_TIMEOUT = (5, 30)
+MAX_RETRIES = 5
+
+def retry_after_seconds(headers)->float:
+    """
+    Seconds to wait before the next request: Retry-After (delta seconds or an HTTP-date), else the time
+    until X-RateLimit-Reset; None if the headers tell neither.
+    """
+    value = headers.get('Retry-After')
+    if value:
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+    if headers.get('X-RateLimit-Reset'):
+        try:
+            return max(float(headers['X-RateLimit-Reset']) - time.time(), 0)
+        except ValueError:
+            pass
+    return None
+
+class TokenPool:
+    """
+    Hands out GitHub tokens (None = unauthenticated) round robin, skipping tokens whose
+    X-RateLimit-Remaining reached 0 until their X-RateLimit-Reset, and waiting when all are exhausted.
+    """
+    def __init__(self, tokens:List[str]=None):
+        self.tokens = list(tokens) if tokens else [None]
+        self.remaining = {token: None for token in self.tokens}
+        self.reset_at = {token: 0 for token in self.tokens}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self)->str:
+        while True:
+            with self._lock:
+                now = time.time()
+                for i in range(len(self.tokens)):
+                    token = self.tokens[(self._next + i) % len(self.tokens)]
+                    if self.remaining[token] != 0 or self.reset_at[token] <= now:
+                        self._next = (self._next + i + 1) % len(self.tokens)
+                        if self.remaining[token] is not None and self.remaining[token] > 0:
+                            self.remaining[token] -= 1
+                        return token
+                wait = min(self.reset_at.values()) - now
+            print(f"All GitHub tokens are rate limited, waiting {wait:.0f} seconds...")
+            time.sleep(max(wait, 1))
+
+    def update(self, token:str, headers)->None:
+        with self._lock:
+            if 'X-RateLimit-Remaining' in headers:
+                self.remaining[token] = int(headers['X-RateLimit-Remaining'])
+            if 'X-RateLimit-Reset' in headers:
+                self.reset_at[token] = float(headers['X-RateLimit-Reset'])
+
+    def block(self, token:str, seconds:float)->None:
+        with self._lock:
+            self.remaining[token] = 0
+            self.reset_at[token] = max(self.reset_at[token], time.time() + seconds)
+
+class ResponseCache:
+    """SQLite store of (url -> ETag, body) used for conditional requests; a 304 answer costs no rate limit."""
+    def __init__(self, db_path:str):
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT, body TEXT)")
+
+    def get(self, url:str):
+        with self._lock:
+            row = self.connection.execute("SELECT etag, body FROM responses WHERE url=?", (url,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, None)
+
+    def put(self, url:str, etag:str, body)->None:
+        with self._lock:
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?,?,?)", (url, etag, json.dumps(body)))
+            self.connection.commit()
+
+class GitHubDiscovery:
+    def __init__(self, tokens:List[str]=None, api_url:str=GITHUB_API_URL, workers:int=8, cache_path:str=None):
+        # tokens: optional GitHub tokens, used in turn to spread the rate limit
+        # cache_path: optional SQLite file of ETag-cached responses reused between runs
+        self.api_url = api_url.rstrip('/')
+        self.tokens = TokenPool(tokens)
+        self.workers = workers
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        self._local = threading.local()
+
+    def _session(self)->requests.Session:
+        if getattr(self._local, 'session', None) is None:
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def get_json(self, url:str, params:Dict):
+        """GET with token rotation, rate-limit handling and ETag revalidation; None if the request failed."""
+        cache_key = requests.Request('GET', url, params=params).prepare().url
+        etag, cached_body = self.cache.get(cache_key) if self.cache else (None, None)
+        for attempt in range(MAX_RETRIES):
+            token = self.tokens.acquire()
+            headers = {"Accept": "application/vnd.github+json"}
+            if token:
+                headers["Authorization"] = f"Bearer {token}"
+            if etag:
+                headers["If-None-Match"] = etag
+            try:
+                response = self._session().get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                print(f"Request to {url} failed: {e}")
+                time.sleep(2 ** attempt)
+                continue
+            self.tokens.update(token, response.headers)
+            if response.status_code == 304:
+                return cached_body
+            if response.status_code == 200:
+                body = response.json()
+                if self.cache and response.headers.get('ETag'):
+                    self.cache.put(cache_key, response.headers['ETag'], body)
+                return body
+            if response.status_code in (403, 429) and ('Retry-After' in response.headers or response.headers.get('X-RateLimit-Remaining') == '0'):
+                delay = retry_after_seconds(response.headers)
+                self.tokens.block(token, delay if delay is not None else 2 ** attempt)
+                continue
+            if response.status_code >= 500:
+                time.sleep(2 ** attempt)
+                continue
+            print(f"Failed to fetch data: {response.status_code}")
+            return None
+        print(f"Giving up on {url} after {MAX_RETRIES} attempts")
+        return None
+
+    def fetch_page(self, language:str, stars:tuple, page:int)->Dict:
+        params = {
+            "q": SEARCH_QUERY.format(language=language, low=stars[0], high=stars[1]),
+            "sort": "stars",
+            "order": "asc", #"desc",
+            "per_page": PER_PAGE,
+            "page": page
+        }
+        data = self.get_json(f"{self.api_url}/search/repositories", params)
+        return data if data else {}
+
+    @staticmethod
+    def split_star_range(star_range:tuple, slices:int)->List[tuple]:
+        # The search API returns at most 1000 results per query, so larger quotas are spread over star sub-ranges
+        low, high = star_range
+        step = max((high - low + 1) // slices, 1)
+        bounds = list(range(low, high + 1, step))[:slices] + [high + 1]
+        return [(bounds[i], bounds[i+1] - 1) for i in range(len(bounds) - 1)]
+
+    def search(self, quotas:Dict[str, int], page_num:int=1, star_range:tuple=STAR_RANGE)->Dict[str, List[Dict]]:
+        """Fetches up to quotas[language] repositories for every language, starting at page_num."""
+        queries = []
+        for language, quota in quotas.items():
+            slices = max(math.ceil(quota / MAX_SEARCH_RESULTS), 1)
+            for stars in self.split_star_range(star_range, slices):
+                queries.append((language, stars, math.ceil(quota / slices)))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # The first page of every query tells how many pages there are
+            first_pages = list(executor.map(lambda query: self.fetch_page(query[0], query[1], page_num), queries))
+            jobs = []
+            for index, (language, stars, quota) in enumerate(queries):
+                total = min(first_pages[index].get('total_count', 0), MAX_SEARCH_RESULTS)
+                last_page = min(page_num + math.ceil(quota / PER_PAGE) - 1, math.ceil(total / PER_PAGE))
+                jobs.extend((index, page) for page in range(page_num + 1, last_page + 1))
+            pages = list(executor.map(lambda job: self.fetch_page(queries[job[0]][0], queries[job[0]][1], job[1]), jobs))
+        results = [list(first_page.get('items', [])) for first_page in first_pages]
+        for (index, _), data in zip(jobs, pages):
+            results[index].extend(data.get('items', []))
+        repositories = {language: [] for language in quotas}
+        for (language, _, quota), items in zip(queries, results):
+            repositories[language].extend(items[:quota])
+        for language, quota in quotas.items():
+            repositories[language] = repositories[language][:quota]
+            print(f"Discovered {len(repositories[language])} {language} repositories")
+        return repositories
@@ -2,84 +2,224 @@
 
 import os
 import re
-import utils
-import pandas as pd
-from typing import List
-
-def extract_comments_from_repo(repo_path: str):
-    # Define patterns for different types of multi-line comments
-    patterns = {
-        '.py': r'\'\'\'(.*?)\'\'\'|"""(.*?)"""',  # Python triple-quoted strings
-        '.cpp': r'/\*(.*?)\*/',  # C++ multi-line comments
-        '.c': r'/\*(.*?)\*/',  # C multi-line comments
-        '.h': r'/\*(.*?)\*/',  # C/C++ header files multi-line comments
-        '.java': r'/\*(.*?)\*/',  # Java multi-line comments
-        '.js': r'/\*(.*?)\*/',  # JavaScript multi-line comments
-        '.ts': r'/\*(.*?)\*/',  # TypeScript multi-line comments
-        '.html': r'<!--(.*?)-->',  # HTML multi-line comments
-        '.css': r'/\*(.*?)\*/'  # CSS multi-line comments
-    }
-    
-    # Function to extract comments with keywords from a single file's content
-    def extract_comments(file_content, ext):
-        # Get the pattern for the current file extension
-        if ext in patterns:
-            combined_pattern = patterns[ext]
-            # Perform the search using re.DOTALL to allow newlines in matches
-            matches = re.findall(combined_pattern, file_content, re.DOTALL | re.IGNORECASE)
-            # Filter matches containing the keywords 'copyright' or 'agreement'
-            filtered_comments = []
-            for match in matches:
-                # 'match' is a tuple of matches from different patterns
-                if isinstance(match, tuple):
-                    for comment in match:
-                        if comment and re.search(r'copyright\b|agreement\b', comment, re.IGNORECASE):
-                            if re.search(r'permission\b|grant\b|modify\b|warranty\b', comment, re.IGNORECASE):
-                                filtered_comments.append(comment.strip())
-                else:
-                    if match and re.search(r'copyright\b|agreement\b', match, re.IGNORECASE):
-                        if re.search(r'permission\b|grant\b|modify\b|warranty\b', match, re.IGNORECASE):
-                            filtered_comments.append(match.strip())
-            return filtered_comments
+import mmap
+import hashlib
+from typing import Iterator, List, Tuple
+from walker import Extractor, RepositoryWalker
+from pruning import PathPruner, is_binary
+from keyword_matcher import load_matcher
+
+# Define patterns for different types of multi-line comments
+patterns = {
+    '.py': r'\'\'\'(.*?)\'\'\'|"""(.*?)"""',  # Python triple-quoted strings
+    '.cpp': r'/\*(.*?)\*/',  # C++ multi-line comments
+    '.c': r'/\*(.*?)\*/',  # C multi-line comments
+    '.h': r'/\*(.*?)\*/',  # C/C++ header files multi-line comments
+    '.java': r'/\*(.*?)\*/',  # Java multi-line comments
+    '.js': r'/\*(.*?)\*/',  # JavaScript multi-line comments
+    '.ts': r'/\*(.*?)\*/',  # TypeScript multi-line comments
+    '.html': r'<!--(.*?)-->',  # HTML multi-line comments
+    '.css': r'/\*(.*?)\*/'  # CSS multi-line comments
+}
+
+# Precompiled versions of the patterns; the byte patterns scan raw (possibly memory-mapped) file contents
+compiled_patterns = {ext: re.compile(pattern, re.DOTALL | re.IGNORECASE) for ext, pattern in patterns.items()}
+compiled_byte_patterns = {ext: re.compile(pattern.encode(), re.DOTALL | re.IGNORECASE) for ext, pattern in patterns.items()}
+# License comments need a keyword of both rule sets (see keyword_rules.json)
+LICENSE_COMMENT_RULES = ('inline_keyword', 'inline_term')
+COMMENT_MATCHER = load_matcher(*LICENSE_COMMENT_RULES)
+# Files without any of these bytes can not contain a license comment and are skipped right away
+PREFILTER_PATTERN = load_matcher(LICENSE_COMMENT_RULES[0]).byte_regex
+# Files larger than this are memory-mapped instead of being read into memory
+MMAP_THRESHOLD = 1 << 20
+
+# Header mode: only the first HEADER_BYTES of a source file are read, where license notices nearly always are.
+HEADER_BYTES = 8 * 1024
+# Block comments of the extensions that are only scanned in header mode
+header_patterns = dict(patterns, **{
+    '.tsx': r'/\*(.*?)\*/',  # TypeScript (JSX) multi-line comments
+    '.go': r'/\*(.*?)\*/',  # Go multi-line comments
+    '.rs': r'/\*(.*?)\*/',  # Rust multi-line comments
+    '.cs': r'/\*(.*?)\*/',  # C# multi-line comments
+    '.rb': r'^=begin(.*?)^=end',  # Ruby embedded documents
+    '.sh': r'(?!)'  # no multi-line comments in shell scripts
+})
+compiled_header_patterns = {ext: re.compile(pattern.encode(), re.DOTALL | re.IGNORECASE | re.MULTILINE) for ext, pattern in header_patterns.items()}
+# Runs of line comments, the usual form of license headers in these languages
+line_comment_prefixes = {'.py': '#', '.sh': '#', '.rb': '#', '.c': '//', '.cpp': '//', '.h': '//', '.java': '//',
+                         '.js': '//', '.ts': '//', '.tsx': '//', '.go': '//', '.rs': '//', '.cs': '//'}
+compiled_line_comment_patterns = {ext: re.compile(rb'(?:^[ \t]*' + re.escape(prefix.encode()) + rb'[^\n]*(?:\n|\Z))+', re.MULTILINE)
+                                  for ext, prefix in line_comment_prefixes.items()}
+SPDX_PATTERN = re.compile(rb'SPDX-License-Identifier:[ \t]*([^\r\n]*?)[ \t]*(?:\*/|-->)?[ \t]*(?=\r?\n|\Z)')
+
+def is_license_comment(comment:str)->bool:
+    # Keep comments containing the keywords 'copyright' or 'agreement' and one of the license terms, found in one pass
+    return bool(comment) and len(COMMENT_MATCHER.rule_sets_hit(comment)) == len(LICENSE_COMMENT_RULES)
+
+# Function to extract comments with keywords from a single file's content
+def extract_comments(file_content, ext):
+    # Get the pattern for the current file extension
+    if ext in compiled_patterns:
+        filtered_comments = []
+        for match in compiled_patterns[ext].finditer(file_content):
+            # A pattern may have several groups (Python has one per quote style), only one of them is set
+            for comment in match.groups():
+                if is_license_comment(comment):
+                    filtered_comments.append(comment.strip())
+        return filtered_comments
+    return []
+
+def _decode_comment(raw_comment:bytes)->str:
+    # Decode like a text-mode read would: ignore invalid utf-8 and translate newlines
+    return raw_comment.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+
+def scan_comments(buffer, ext:str)->List[str]:
+    """Same as extract_comments, but for the raw bytes (or mmap) of a file; only matched comments are decoded."""
+    if ext not in compiled_byte_patterns or not PREFILTER_PATTERN.search(buffer):
         return []
-    
-    # Dictionary to hold all extracted comments by file
-    extracted_comments = dict()
-    
-    # Walk through the directory
-    for root, _, files in os.walk(repo_path):
-        for file in files:
-            ext = os.path.splitext(file)[1]  # Get the file extension
-            if ext in patterns:
-                # Build the full file path
-                file_path = os.path.join(root, file)
-                if os.path.isfile(file_path) and os.path.getsize(file_path) > 0: # Checks if the file exists and is not empty
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        file_content = f.read()
-                        comments = extract_comments(file_content, ext)
-                        if comments:
-                            print(f"Inline License found at: {file_path}....")
-                            extracted_comments[file_path] = comments
-    
-    return extracted_comments
-
-def get_inline_license_dict(repo_paths:List)->dict:
+    filtered_comments = []
+    for match in compiled_byte_patterns[ext].finditer(buffer):
+        for raw_comment in match.groups():
+            if not raw_comment:
+                continue
+            comment = _decode_comment(raw_comment)
+            if is_license_comment(comment):
+                filtered_comments.append(comment.strip())
+    return filtered_comments
+
+def scan_header(buffer:bytes, ext:str)->List[str]:
+    """
+    License notices in the header of a file: 'SPDX-License-Identifier: <id>' lines in any comment
+    style, then block comments and runs of line comments that pass is_license_comment.
+    """
+    filtered_comments = [f"SPDX-License-Identifier: {_decode_comment(match.group(1))}"
+                         for match in SPDX_PATTERN.finditer(buffer) if match.group(1)]
+    if ext not in compiled_header_patterns or not PREFILTER_PATTERN.search(buffer):
+        return filtered_comments
+    for match in compiled_header_patterns[ext].finditer(buffer):
+        for raw_comment in match.groups():
+            if raw_comment and is_license_comment(comment := _decode_comment(raw_comment)):
+                filtered_comments.append(comment.strip())
+    if ext in compiled_line_comment_patterns:
+        prefix = line_comment_prefixes[ext]
+        for match in compiled_line_comment_patterns[ext].finditer(buffer):
+            lines = [line.strip()[len(prefix):].strip() for line in _decode_comment(match.group()).splitlines()
+                     if not line.lstrip().startswith('#!')] # shebang
+            comment = '\n'.join(lines)
+            if is_license_comment(comment):
+                filtered_comments.append(comment.strip())
+    return filtered_comments
+
+def scan_file(file_path:str, header_bytes:int=None, sniff_binary:bool=False, sha=None)->List[str]:
+    # header_bytes: only scan the first header_bytes of the file (see scan_header); None scans the whole file
+    # sniff_binary: return nothing for a file whose first bytes look binary (pruning.is_binary)
+    # sha: optional hashlib object updated with the bytes that were scanned (the hash ScanCache.put keeps)
+    ext = os.path.splitext(file_path)[1]
+    with open(file_path, 'rb') as f:
+        if header_bytes:
+            buffer = f.read(header_bytes)
+        elif os.fstat(f.fileno()).st_size <= MMAP_THRESHOLD:
+            buffer = f.read()
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return _scan_buffer(buffer, ext, header_bytes, sniff_binary, sha)
+        return _scan_buffer(buffer, ext, header_bytes, sniff_binary, sha)
+
+def _scan_buffer(buffer, ext:str, header_bytes:int, sniff_binary:bool, sha)->List[str]:
+    if sha is not None:
+        sha.update(buffer)
+    if not buffer or sniff_binary and is_binary(buffer):
+        return []
+    return scan_header(buffer, ext) if header_bytes else scan_comments(buffer, ext)
+
+# Bump when the comment patterns or filters change, so cached results are not reused.
+CACHE_VERSION = '2'
+
+class CommentScanner(Extractor):
+    """Collects the license comments of the source files seen during a repository walk."""
+    name = 'inline'
+
+    def __init__(self, cache=None, header_bytes:int=None):
+        # cache: optional ScanCache; the comments of unchanged files are taken from it
+        # header_bytes: scan only the header of every source file (see scan_header), None scans whole files
+        self.cache = cache
+        self.header_bytes = header_bytes
+        self.read_limit = header_bytes
+        self.extensions = header_patterns if header_bytes else patterns
+        self.cache_version = f"{CACHE_VERSION}-header{header_bytes}" if header_bytes else CACHE_VERSION
+
+    def start(self, repo_path:str)->None:
+        # Dictionary to hold all extracted comments by file
+        self.extracted_comments = dict()
+
+    def wants(self, file_name:str)->bool:
+        return os.path.splitext(file_name)[1] in self.extensions  # Get the file extension
+
+    def visit(self, file_path:str)->None:
+        st = os.stat(file_path) # taken before the file is read, see ScanCache.put
+        if st.st_size > 0: # Checks if the file is not empty
+            hit = False
+            if self.cache is not None:
+                # In header mode the entries are validated against the hash of the header only
+                hit, comments = self.cache.get('inline', file_path, self.cache_version, self.header_bytes)
+            if not hit:
+                sha = hashlib.sha1() if self.cache is not None else None
+                comments = scan_file(file_path, self.header_bytes, self.sniff_binary, sha)
+                if self.cache is not None:
+                    self.cache.put('inline', file_path, comments, self.cache_version, st, sha.hexdigest(), self.header_bytes)
+            if comments:
+                print(f"Inline License found at: {file_path}....")
+                self.extracted_comments[file_path] = comments
+
+    def visit_blob(self, file_path:str, data:bytes)->None:
+        ext = os.path.splitext(file_path)[1]
+        comments = scan_header(data[:self.header_bytes], ext) if self.header_bytes else scan_comments(data, ext)
+        if comments:
+            print(f"Inline License found at: {file_path}....")
+            self.extracted_comments[file_path] = comments
+
+    def finish(self)->dict:
+        return self.extracted_comments
+
+def extract_comments_from_repo(repo_path: str, cache=None, pruner:PathPruner=None, header_bytes:int=None):
+    return RepositoryWalker([CommentScanner(cache, header_bytes)], pruner).walk(repo_path)['inline']
+
+# Add the inline licenses of a repository (file_path -> comments) to the license_dict.
+def inline_license_records(repo_path:str, inline_license_dict:dict)->Iterator[Tuple]:
+    """Yields a (repository name, path, comment, 'Inline') record for every license comment."""
+    for file_path, comments in inline_license_dict.items():
+        for comment in comments:
+            yield (repo_path.split('/')[-1], file_path, comment, 'Inline')
+
+def add_inline_licenses(license_dict:dict, repo_path:str, inline_license_dict:dict)->dict:
+    for name, path, text, type_ in inline_license_records(repo_path, inline_license_dict):
+        license_dict['Repository name'].append(name)
+        license_dict['Repository path'].append(path)
+        license_dict['License text'].append(text)
+        license_dict['License type'].append(type_)
+    return license_dict
+
+def iter_inline_licenses(repo_paths:List, cache=None, pruner:PathPruner=None, header_bytes:int=None)->Iterator[Tuple]:
     # repo_paths: ["<path_to_your_directory>/<repo_name>",...]
+    # cache: optional ScanCache used to skip unchanged source files
+    # pruner: decides which directories and files are skipped
+    # header_bytes: scan only the first header_bytes of every source file (None scans whole files)
+    for repo_path in repo_paths:
+        yield from inline_license_records(repo_path, extract_comments_from_repo(repo_path, cache, pruner, header_bytes))
+        if cache is not None:
+            cache.flush()
+
+def get_inline_license_dict(repo_paths:List, cache=None, pruner:PathPruner=None, header_bytes:int=None)->dict:
+    # Same as iter_inline_licenses, collected into a dictionary of columns
     license_dict = {'Repository name':[],
                     'Repository path':[],
                     'License text':[],
                     'License type':[]}
-    
-    for repo_path in repo_paths:
-        inline_license_dict = extract_comments_from_repo(repo_path)
-        
-        for file_path, comments in inline_license_dict.items():
-            for comment in comments:
-                license_dict['Repository name'].append(repo_path.split('/')[-1])
-                license_dict['Repository path'].append(file_path)
-                license_dict['License text'].append(comment)
-                license_dict['License type'].append('Inline')
-
+    for name, path, text, type_ in iter_inline_licenses(repo_paths, cache, pruner, header_bytes):
+        license_dict['Repository name'].append(name)
+        license_dict['Repository path'].append(path)
+        license_dict['License text'].append(text)
+        license_dict['License type'].append(type_)
     return license_dict
 
 
@@ -0,0 +1,73 @@
+# Multi-keyword matcher shared by the text filters, built from the rule sets in keyword_rules.json
+
+import os
+import re
+import json
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keyword_rules.json')
+
+class KeywordMatcher:
+    """
+    Matches the keywords of one or more rule sets with a single compiled alternation, so a text is
+    scanned once however many keywords there are. A rule set is a dict with 'keywords' and the
+    options 'case_sensitive', 'word_start' and 'word_end' (word boundary before/after the keyword).
+    When keywords overlap at the same position, the longest one is reported.
+    """
+    def __init__(self, rule_sets:Dict[str, Dict]):
+        self.rule_sets = list(rule_sets)
+        # matched text (lowercased) -> [(rule set, keyword, pattern)], to tell which keyword a hit is
+        self.candidates = {}
+        alternatives = []
+        entries = [(name, keyword, rules) for name, rules in rule_sets.items() for keyword in rules['keywords']]
+        for name, keyword, rules in sorted(entries, key=lambda entry: -len(entry[1])):
+            pattern = re.escape(keyword)
+            if not rules.get('case_sensitive', False):
+                pattern = f'(?i:{pattern})'
+            if rules.get('word_start', False):
+                pattern = r'\b' + pattern
+            if rules.get('word_end', False):
+                pattern += r'\b'
+            alternatives.append(pattern)
+            self.candidates.setdefault(keyword.lower(), []).append((name, keyword, re.compile(pattern)))
+        # No capturing groups: they would switch off the literal prefix optimisations of the regex engine
+        self.regex = re.compile('|'.join(alternatives))
+        self.byte_regex = re.compile('|'.join(alternatives).encode())
+
+    def _hits_at(self, match:re.Match)->List[Tuple[str, str]]:
+        # Every (rule set, keyword) whose own pattern matches the hit
+        text, start, end = match.string, match.start(), match.end()
+        return [(name, keyword) for name, keyword, pattern in self.candidates[match.group().lower()]
+                if (found := pattern.match(text, start)) and found.end() == end]
+
+    def first(self, text:str)->Optional[Tuple[str, str]]:
+        """(rule set, keyword) of the first hit in the text, None if there is none."""
+        match = self.regex.search(text)
+        return self._hits_at(match)[0] if match else None
+
+    def contains(self, text:str)->bool:
+        return self.regex.search(text) is not None
+
+    def hits(self, text:str)->List[Tuple[str, str, int]]:
+        """(rule set, keyword, position) of every hit, in a single pass over the text."""
+        return [hit + (match.start(),) for match in self.regex.finditer(text) for hit in self._hits_at(match)]
+
+    def rule_sets_hit(self, text:str)->Set[str]:
+        # Stops scanning as soon as every rule set was hit
+        found = set()
+        for match in self.regex.finditer(text):
+            found.update(name for name, _ in self._hits_at(match))
+            if len(found) == len(self.rule_sets):
+                break
+        return found
+
+def load_rules(path:str=RULES_PATH)->Dict[str, Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+@lru_cache(maxsize=None)
+def load_matcher(*names:str, path:str=RULES_PATH)->KeywordMatcher:
+    """A (cached) matcher for the named rule sets of the rules file."""
+    rules = load_rules(path)
+    return KeywordMatcher({name: rules[name] for name in names})
@@ -1,128 +1,234 @@
 import os
+import argparse
 import utils
 import pandas as pd
-from declared_license import extract_declared_licenses
-from inline_license import get_inline_license_dict
-from referenced_license import get_referenced_license_dict
+from declared_license import extract_declared_licenses, iter_declared_licenses
+from inline_license import get_inline_license_dict, iter_inline_licenses
+from referenced_license import collect_dependencies, build_referenced_license_dict, iter_dependencies, iter_referenced_licenses
+from extraction import scan_licenses, iter_scanned_licenses
+from git_backend import scan_git_licenses, iter_git_licenses
+from parallel import collect, iter_parallel, run_parallel, merge_license_dicts
+from functools import partial
+from scan_cache import ScanCache
+from registry_cache import RegistryCache
+from registry_snapshot import RegistrySnapshot, RESOLUTION_MODES
+from pruning import PathPruner, DEFAULT_VENDOR_DIRS, THIRD_PARTY_DIRS
+from output_sink import SINKS, open_sink
+from pipeline import RecordPipeline, clean_dataframe, remove_invalid_rows, EXTRA_LINES_PATTERN, KEYWORD_PATTERN
 
 BASE_FILE_PATH = '<path_to_your_repositories_directory>'
 BASE_SAVE_FILE_PATH = '<path_to_your_output_directory>'
+NUM_WORKERS = 1 # processes used for the extraction, e.g. os.cpu_count()
+REPO_TIMEOUT = None # seconds after which a single repository is reported as failed
+SCAN_CACHE_PATH = '<path_to_your_output_directory>/scan_cache.sqlite' # per-file cache reused by re-runs
+REGISTRY_CACHE_PATH = '<path_to_your_output_directory>/registry_cache.sqlite' # licenses fetched from the package registries
+REGISTRY_SNAPSHOT_PATH = None # offline snapshot built with registry_snapshot.py
+RESOLUTION_MODE = 'online' # 'online', 'offline' or 'prefer-offline'
+OUTPUT_FORMAT = 'store' # 'store' (distinct texts + occurrences, SQLite), 'jsonl', 'parquet' (needs pyarrow) or 'xlsx'
+DECLARED_TYPES = ['Declared', 'Vendored'] # license types whose texts must pass check_text
 
 class DatasetBuilder:
-    def __init__(self, root_path:str=None):
+    def __init__(self, root_path:str=None, workers:int=1, chunksize:int=1, repo_timeout:float=None, cache_path:str=None,
+                 pruner:PathPruner=None, registry_cache_path:str=None, snapshot_path:str=None, resolution_mode:str='online',
+                 backend:str='checkout', ref:str='HEAD', header_bytes:int=None):
+        # workers: number of processes used to extract the licenses (1 extracts the repositories one after another)
+        # chunksize: number of repositories handed to a worker at a time
+        # repo_timeout: seconds after which the extraction of a single repository is given up and reported as failed
+        # cache_path: SQLite file caching the results of unchanged files between runs (None disables the cache)
+        # pruner: decides which directories (.git, node_modules, vendor, ...) and files are skipped (pruning.NO_PRUNING walks everything)
+        # registry_cache_path: SQLite file caching the licenses fetched from the package registries (None disables the cache)
+        # snapshot_path, resolution_mode: offline registry snapshot and whether the live registries may be used (see registry_snapshot.py)
+        # backend: 'checkout' walks the working trees, 'git' reads the tree of `ref` from the object database (bare or partial clones work too)
+        # header_bytes: scan only the first header_bytes of every source file for inline licenses (None scans whole files)
         self.ROOT = root_path
+        self.workers = workers
+        self.chunksize = chunksize
+        self.repo_timeout = repo_timeout
+        self.failed_repositories = []
+        self.cache = ScanCache(cache_path) if cache_path else None
+        self.pruner = pruner
+        self.registry_cache = RegistryCache(registry_cache_path) if registry_cache_path else None
+        self.snapshot = RegistrySnapshot(snapshot_path) if snapshot_path else None
+        self.resolution_mode = resolution_mode
+        self.backend = backend
+        self.ref = ref
+        self.header_bytes = header_bytes
         if root_path:
             self.repository_paths = [self.ROOT + repo_name for repo_name in os.listdir(self.ROOT)]
 
-    def fetch_and_clone(self, num_links, page_num):
+    def fetch_and_clone(self, num_links, page_num, **clone_options):
+        # clone_options: e.g. workers=8, depth=1, blob_filter='blob:none', sparse=True (see utils.clone_repos)
         repository_links = utils.fetch_top_repositories(num_links=num_links, page_num=page_num, run=True)
-        utils.clone_repos(repos=repository_links, run=True)
+        utils.clone_repos(repos=repository_links, run=True, **clone_options)
+
+    def run_extractor(self, extractor, **kwargs):
+        # extractor: function taking a list of repository paths, e.g. extract_declared_licenses
+        # kwargs: further keyword arguments of the extractor
+        extractor = partial(extractor, cache=self.cache, pruner=self.pruner, **kwargs)
+        if self.workers <= 1:
+            return [extractor(self.repository_paths)]
+        results, failed = run_parallel(extractor, self.repository_paths, workers=self.workers,
+                                       chunksize=self.chunksize, timeout=self.repo_timeout)
+        self.failed_repositories.extend(failed)
+        return results
+
+    def iter_extractor(self, extractor, **kwargs):
+        # Like run_extractor, but yields the result of every repository as soon as it is done.
+        # extractor: generator function taking a list of repository paths, e.g. iter_declared_licenses;
+        #            the output for one repository is collected into a list
+        extractor = partial(collect, partial(extractor, cache=self.cache, pruner=self.pruner, **kwargs))
+        if self.workers <= 1:
+            for repo_path in self.repository_paths:
+                yield extractor([repo_path])
+            return
+        for repo_path, status, value in iter_parallel(extractor, self.repository_paths, workers=self.workers,
+                                                      chunksize=self.chunksize, timeout=self.repo_timeout):
+            if status == 'ok':
+                yield value
+            else:
+                self.failed_repositories.append((repo_path, value))
     
     def get_declared_licenses(self):
         print("\n\nExtracting Declared Licenses...\n\n")
-        declared_license_dict = extract_declared_licenses(self.repository_paths)
+        if self.backend == 'git':
+            return self.scan_git()[0]
+        declared_license_dict = merge_license_dicts(self.run_extractor(extract_declared_licenses))
         return declared_license_dict
     
     def get_inline_licenses(self):
         print("\n\nExtracting Inline Licenses...\n\n")
-        inline_license_dict = get_inline_license_dict(self.repository_paths)
+        if self.backend == 'git':
+            return self.scan_git()[1]
+        inline_license_dict = merge_license_dicts(self.run_extractor(get_inline_license_dict, header_bytes=self.header_bytes))
         return inline_license_dict
 
     def get_referenced_licenses(self):
         print("\n\nExtracting Referenced Licenses...\n\n")
-        referenced_license_dict = get_referenced_license_dict(self.repository_paths)
+        if self.backend == 'git':
+            repo_dependencies = self.scan_git()[2]
+        else:
+            # The dependencies of all the repositories are collected first, so that every unique dependency is resolved only once.
+            repo_dependencies = [item for result in self.run_extractor(collect_dependencies) for item in result]
+        referenced_license_dict = build_referenced_license_dict(repo_dependencies, self.registry_cache, self.snapshot, self.resolution_mode)
         return referenced_license_dict
+
+    def scan_git(self):
+        # Declared and inline licenses, and the dependencies of every repository, read from the git object database
+        results = self.run_extractor(partial(scan_git_licenses, ref=self.ref), header_bytes=self.header_bytes)
+        declared_license_dict = merge_license_dicts([result[0] for result in results])
+        inline_license_dict = merge_license_dicts([result[1] for result in results])
+        repo_dependencies = [item for result in results for item in result[2]]
+        return declared_license_dict, inline_license_dict, repo_dependencies
+
+    def get_all_licenses(self):
+        # Walks every repository only once for the three license types.
+        print("\n\nExtracting Declared, Inline and Referenced Licenses...\n\n")
+        if self.backend == 'git':
+            declared_license_dict, inline_license_dict, repo_dependencies = self.scan_git()
+        else:
+            results = self.run_extractor(scan_licenses, header_bytes=self.header_bytes)
+            declared_license_dict = merge_license_dicts([result[0] for result in results])
+            inline_license_dict = merge_license_dicts([result[1] for result in results])
+            repo_dependencies = [item for result in results for item in result[2]]
+        return declared_license_dict, inline_license_dict, build_referenced_license_dict(repo_dependencies, self.registry_cache, self.snapshot, self.resolution_mode)
     
     @staticmethod
     def remove_extra_lines(text:str):
-        while True:
-            new_text = text.replace('\n\n','\n')
-            if new_text == text:
-                break
-            else:
-                text = new_text
-        return new_text
+        return EXTRA_LINES_PATTERN.sub('\n', text)
     
-    @staticmethod
-    def clean_dataframe(df, col1, col2):
-        df[col1] = df[col1].apply(lambda row: str(row))
-        df[col2] = df[col2].apply(lambda row: str(row))
-        try:
-            df[col1] = df[col1].apply(lambda row: DatasetBuilder.remove_extra_lines(row))
-            df[col1] = df[col1].apply(lambda row: utils.remove_spaces(row))
-        except:
-            pass
-        try:
-            df.drop_duplicates(subset=[col1,col2], inplace=True, ignore_index=True, keep='first')
-        except:
-            pass
-        return df
+    # Cleaning of whole DataFrames, see pipeline.py
+    clean_dataframe = staticmethod(clean_dataframe)
+    remove_invalid_rows = staticmethod(remove_invalid_rows)
     
     @staticmethod
     def check_text(text):
-        # Check if any of the words 'copyright', 'permission', or 'grant' appear in the text
-        keywords_true = ['copyright', 'permission', 'grant', 'license']
-        if any(word in text.lower() for word in keywords_true):
+        # Check if any of the words 'copyright', 'permission', 'grant' or 'license' appear in the text
+        if KEYWORD_PATTERN.search(text):
             return text
         else:
             return None
-    
-    @staticmethod
-    def remove_invalid_rows(df):
-        """
-        This function removes any rows from a DataFrame where the value in column 'License text' 
-        is None, an empty string, or NaN. The function returns a new DataFrame with
-        the filtered rows, without modifying the original DataFrame.
-        """
-        # Create a mask for valid values (i.e., not None, NaN, or empty string)
-        mask = df['License text'].notna() & (df['License text'] != '')
-        # Return a new DataFrame with only valid rows
-        return df[mask].copy()
 
-    def save_files(self, Declared:bool=False, Inline:bool=False, Referenced:bool=False, file_version:str=''):
+    def save_files(self, Declared:bool=False, Inline:bool=False, Referenced:bool=False, file_version:str='', output_format:str=OUTPUT_FORMAT):
+        # output_format: 'store', 'jsonl', 'parquet' or 'xlsx' (see output_sink.py)
+        # The records of every repository are cleaned, deduplicated and written as soon as it is done, so memory
+        # stays bounded and an interrupted run keeps everything written so far.
         if Declared:
-            declared_license_dict = self.get_declared_licenses()
-            df = pd.DataFrame(declared_license_dict)
-            df = DatasetBuilder.clean_dataframe(df, 'License text', 'Repository name')
-            df['License text'] = df['License text'].apply(lambda row: DatasetBuilder.check_text(row))
-            df = DatasetBuilder.remove_invalid_rows(df)
-            df.to_excel(BASE_SAVE_FILE_PATH+'Declared Licenses'+file_version+'.xlsx', index=False, engine='xlsxwriter')
-            print("Declared Licenses are saved!")
+            file_name = 'Declared Licenses'
         elif Inline:
-            inline_license_dict = self.get_inline_licenses()
-            df = pd.DataFrame(inline_license_dict)
-            df = DatasetBuilder.clean_dataframe(df, 'License text', 'Repository name')
-            df = DatasetBuilder.remove_invalid_rows(df)
-            df.to_excel(BASE_SAVE_FILE_PATH+'Inline Licenses'+file_version+'.xlsx', index=False, engine='xlsxwriter')
-            print("Inline Licenses are saved!")
+            file_name = 'Inline Licenses'
         elif Referenced:
-            referenced_license_dict = self.get_referenced_licenses()
-            df = pd.DataFrame(referenced_license_dict)
-            print("Done with creating the dataframe.")
-            df = DatasetBuilder.clean_dataframe(df, 'License text', 'Repository name')
-            df = DatasetBuilder.remove_invalid_rows(df)
-            print("Done with cleaning the dataframe.")
-            try:
-                df.to_excel(BASE_SAVE_FILE_PATH+'Referenced Licenses'+file_version+'.xlsx', index=False, engine='openpyxl')
-                print("Done with saving the file in excel format.")
-            except:
-                df.to_csv(BASE_SAVE_FILE_PATH+'Referenced Licenses'+file_version+'.csv', index=False)
-                print("Done with saving the file in csv format.")
-            print("Referenced Licenses are saved!")
+            file_name = 'Referenced Licenses'
         else:
-            # Extract all the licenses.
-            declared_df = pd.DataFrame(self.get_declared_licenses())
-            inline_df = pd.DataFrame(self.get_inline_licenses())
-            referenced_df = pd.DataFrame(self.get_referenced_licenses())
-            declared_df['License text'] = declared_df['License text'].apply(lambda row: DatasetBuilder.check_text(row))
-            
-            df = pd.concat([declared_df, inline_df, referenced_df], axis=0, ignore_index=True)
-            df = DatasetBuilder.clean_dataframe(df, 'License text', 'Repository name')
-            df = DatasetBuilder.remove_invalid_rows(df)
-            df.to_excel(BASE_SAVE_FILE_PATH+'Complete License Data'+file_version+'.xlsx', index=False, engine='xlsxwriter')
-            print("File saved!")
+            file_name = 'Complete License Data'
+        with open_sink(BASE_SAVE_FILE_PATH+file_name+file_version, output_format) as sink:
+            pipeline = RecordPipeline(sink, filter_types=DECLARED_TYPES)
+            repo_dependencies = []
+            if Declared and self.backend != 'git':
+                print("\n\nExtracting Declared Licenses...\n\n")
+                for records in self.iter_extractor(iter_declared_licenses):
+                    pipeline.write(records)
+            elif Inline and self.backend != 'git':
+                print("\n\nExtracting Inline Licenses...\n\n")
+                for records in self.iter_extractor(iter_inline_licenses, header_bytes=self.header_bytes):
+                    pipeline.write(records)
+            elif Referenced and self.backend != 'git':
+                print("\n\nExtracting Referenced Licenses...\n\n")
+                # The dependencies of all the repositories are collected first, so that every unique dependency is resolved only once.
+                for dependencies in self.iter_extractor(iter_dependencies):
+                    repo_dependencies.extend(dependencies)
+            else:
+                # Walks every repository only once for the three license types.
+                print("\n\nExtracting Licenses...\n\n")
+                extractor = partial(iter_git_licenses, ref=self.ref) if self.backend == 'git' else iter_scanned_licenses
+                for scanned in self.iter_extractor(extractor, header_bytes=self.header_bytes):
+                    for repo_path, records, dependencies in scanned:
+                        if Declared:
+                            records = [record for record in records if record[3] != 'Inline']
+                        elif Inline:
+                            records = [record for record in records if record[3] == 'Inline']
+                        if not Referenced:
+                            pipeline.write(records)
+                        repo_dependencies.append((repo_path, dependencies))
+            if not (Declared or Inline):
+                pipeline.write_all(iter_referenced_licenses(repo_dependencies, self.registry_cache, self.snapshot, self.resolution_mode))
+        print(f"{file_name} saved to {sink.path} ({sink.rows} rows, {pipeline.duplicates} duplicates dropped)")
+        if self.registry_cache is not None:
+            print(self.registry_cache.report())
+        if self.snapshot is not None:
+            print(self.snapshot.report())
+        if self.failed_repositories:
+            print(f"Licenses could not be extracted from {len(self.failed_repositories)} repositories:")
+            for repo_path, reason in self.failed_repositories:
+                print(f"    {repo_path}: {reason}")
 
 
 if __name__=='__main__':
-    class_object = DatasetBuilder(BASE_FILE_PATH)
-    class_object.save_files(file_version='_v1') 
+    parser = argparse.ArgumentParser(description="Extract the declared, inline and referenced licenses of the repositories in BASE_FILE_PATH.")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS, help="number of processes used for the extraction")
+    parser.add_argument('--repo-timeout', type=float, default=REPO_TIMEOUT, help="seconds after which a repository is reported as failed")
+    parser.add_argument('--cache-path', default=SCAN_CACHE_PATH, help="SQLite file caching the results of unchanged files")
+    parser.add_argument('--no-cache', action='store_true', help="re-read every file instead of using the cache")
+    parser.add_argument('--registry-cache-path', default=REGISTRY_CACHE_PATH, help="SQLite file caching the licenses fetched from the registries")
+    parser.add_argument('--no-registry-cache', action='store_true', help="ask the registries for every dependency")
+    parser.add_argument('--snapshot-path', default=REGISTRY_SNAPSHOT_PATH, help="offline registry snapshot built with registry_snapshot.py")
+    parser.add_argument('--backend', choices=['checkout', 'git'], default='checkout',
+                        help="'git' scans the tree of --ref from the object database instead of the working tree")
+    parser.add_argument('--ref', default='HEAD', help="ref scanned by the git backend")
+    parser.add_argument('--header-kb', type=int, default=None,
+                        help="scan only the first N KB of every source file for inline licenses (SPDX lines and header comments, more languages)")
+    parser.add_argument('--resolution-mode', choices=RESOLUTION_MODES, default=RESOLUTION_MODE,
+                        help="'offline' resolves from the snapshot (and registry cache) only")
+    parser.add_argument('--output-format', choices=list(SINKS), default=OUTPUT_FORMAT, help="format of the output file")
+    parser.add_argument('--scan-vendored', action='store_true', help="add the license files of vendored trees (node_modules, vendor, ...) as 'Vendored'")
+    parser.add_argument('--prune-third-party', action='store_true',
+                        help="also treat vendor, third_party, external, extern, ... directories as vendored trees")
+    args = parser.parse_args()
+    class_object = DatasetBuilder(BASE_FILE_PATH, workers=args.workers, repo_timeout=args.repo_timeout,
+                                  cache_path=None if args.no_cache else args.cache_path,
+                                  pruner=PathPruner(scan_vendored=args.scan_vendored,
+                                                    vendor_dirs=DEFAULT_VENDOR_DIRS + (THIRD_PARTY_DIRS if args.prune_third_party else ())),
+                                  registry_cache_path=None if args.no_registry_cache else args.registry_cache_path,
+                                  snapshot_path=args.snapshot_path, resolution_mode=args.resolution_mode,
+                                  backend=args.backend, ref=args.ref,
+                                  header_bytes=args.header_kb * 1024 if args.header_kb else None)
+    class_object.save_files(file_version='_v1', output_format=args.output_format) 
@@ -0,0 +1,167 @@
+# Pluggable writers for the extracted license rows, fed incrementally as repositories complete
+
+import os
+import json
+import argparse
+import pandas as pd
+from typing import Dict, Type
+from text_store import LicenseTextStore
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # Parquet output is optional
+    pa = pq = None
+
+COLUMNS = ["Repository name", "Repository path", "License text", "License type"]
+ROW_GROUP_SIZE = 50000 # rows buffered before a Parquet row group is written
+EXCEL_CELL_LIMIT = 32767 # characters; Excel silently cuts longer cells
+EXCEL_ROW_LIMIT = 1048575 # rows below the header
+
+class OutputSink:
+    """Base class of the sinks: `write` takes a DataFrame with COLUMNS, `close` finalises the file."""
+    extension = ''
+
+    def __init__(self, path:str):
+        self.path = path
+        self.rows = 0
+
+    def write(self, df:pd.DataFrame)->None:
+        raise NotImplementedError
+
+    def close(self)->None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class JsonlSink(OutputSink):
+    """One JSON object per row, flushed after every write so a crash keeps the rows already written."""
+    extension = '.jsonl'
+
+    def __init__(self, path:str):
+        super().__init__(path)
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, df:pd.DataFrame)->None:
+        for record in df[COLUMNS].to_dict('records'):
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+        self.rows += len(df)
+
+    def close(self)->None:
+        self.file.close()
+
+class ParquetSink(OutputSink):
+    """Columnar output (requires pyarrow); rows are buffered and written in row groups of `row_group_size`."""
+    extension = '.parquet'
+
+    def __init__(self, path:str, row_group_size:int=ROW_GROUP_SIZE):
+        if pa is None:
+            raise ImportError("Parquet output requires pyarrow (pip install pyarrow); use the 'jsonl' format otherwise")
+        super().__init__(path)
+        self.row_group_size = row_group_size
+        self.schema = pa.schema([(column, pa.string()) for column in COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, df:pd.DataFrame)->None:
+        self.buffer.append(df[COLUMNS])
+        self.buffered += len(df)
+        self.rows += len(df)
+        if self.buffered >= self.row_group_size:
+            self.flush()
+
+    def flush(self)->None:
+        if self.buffered:
+            table = pa.Table.from_pandas(pd.concat(self.buffer, ignore_index=True), schema=self.schema, preserve_index=False)
+            self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.buffer, self.buffered = [], 0
+
+    def close(self)->None:
+        self.flush()
+        self.writer.close()
+
+class ExcelSink(OutputSink):
+    """
+    .xlsx export for small outputs. Excel files can not be appended to, so the rows are kept
+    in memory until `close`; texts over Excel's cell limit and rows over its row limit are reported.
+    """
+    extension = '.xlsx'
+
+    def __init__(self, path:str):
+        super().__init__(path)
+        self.frames = []
+
+    def write(self, df:pd.DataFrame)->None:
+        self.frames.append(df[COLUMNS])
+        self.rows += len(df)
+
+    def close(self)->None:
+        df = pd.concat(self.frames, ignore_index=True) if self.frames else pd.DataFrame(columns=COLUMNS)
+        too_long = int((df['License text'].str.len() > EXCEL_CELL_LIMIT).sum())
+        if too_long:
+            print(f"Warning: {too_long} license texts are longer than {EXCEL_CELL_LIMIT} characters and are cut in {self.path}")
+        if len(df) > EXCEL_ROW_LIMIT:
+            print(f"Warning: only the first {EXCEL_ROW_LIMIT} of {len(df)} rows fit in {self.path}")
+            df = df.iloc[:EXCEL_ROW_LIMIT]
+        df.to_excel(self.path, index=False, engine='xlsxwriter')
+
+class TextStoreSink(OutputSink):
+    """Content-addressed SQLite output: every distinct text is stored once, plus one occurrence row per license (see text_store.py)."""
+    extension = '.sqlite'
+
+    def __init__(self, path:str):
+        super().__init__(path)
+        if os.path.exists(path):
+            os.remove(path) # like the other sinks, a new output replaces the old one
+        self.store = LicenseTextStore(path)
+
+    def write(self, df:pd.DataFrame)->None:
+        self.store.add(df)
+        self.rows += len(df)
+
+    def close(self)->None:
+        print(self.store.report())
+        self.store.close()
+
+SINKS:Dict[str, Type[OutputSink]] = {'store': TextStoreSink, 'jsonl': JsonlSink, 'parquet': ParquetSink, 'xlsx': ExcelSink}
+
+def open_sink(path:str, output_format:str='jsonl', **kwargs)->OutputSink:
+    # path: output file, the extension of the format is added if it is missing
+    sink_class = SINKS[output_format]
+    if not path.endswith(sink_class.extension):
+        path += sink_class.extension
+    return sink_class(path, **kwargs)
+
+def read_records(path:str)->pd.DataFrame:
+    """Reads the output of any sink (or an older .xlsx/.csv output) into a DataFrame."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        return pd.read_parquet(path)
+    if extension == '.jsonl':
+        return pd.read_json(path, lines=True, dtype=False)
+    if extension == '.sqlite':
+        store = LicenseTextStore(path)
+        try:
+            return store.records()
+        finally:
+            store.close()
+    if extension == '.csv':
+        return pd.read_csv(path)
+    return pd.read_excel(path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the output of main.py to another format, e.g. .jsonl -> .xlsx.")
+    parser.add_argument('source', help="output of main.py (.sqlite, .jsonl, .parquet, .xlsx or .csv)")
+    parser.add_argument('target', help="file to write, its extension selects the format")
+    args = parser.parse_args()
+    extension = os.path.splitext(args.target)[1].lower()
+    target_format = next(name for name, sink_class in SINKS.items() if sink_class.extension == extension)
+    with open_sink(args.target, target_format) as sink:
+        sink.write(read_records(args.source))
+    print(f"Wrote {sink.rows} rows to {sink.path}.")
@@ -0,0 +1,115 @@
+# Run the per-repository extractors in a process pool
+
+import signal
+import multiprocessing
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Tuple
+
+PARENT_GRACE = 30 # seconds the parent waits past a chunk's timeout before giving up on its worker
+
+class RepositoryTimeout(BaseException):
+    # Not an Exception, so that the extractors' `except Exception` handlers do not swallow it
+    pass
+
+_timed_out = False
+
+def _raise_timeout(signum, frame):
+    global _timed_out
+    _timed_out = True
+    raise RepositoryTimeout()
+
+def _run_one(func:Callable, timeout:float, repo_path:str)->Tuple[str, object]:
+    # Runs func([repo_path]) in a worker; a failure or timeout is returned instead of raised
+    # so that one bad repository can not stall or kill the whole run.
+    global _timed_out
+    _timed_out = False
+    use_alarm = timeout and hasattr(signal, 'setitimer')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        result = func([repo_path])
+    except RepositoryTimeout:
+        return ('failed', f"timed out after {timeout} seconds")
+    except Exception as e:
+        return ('failed', f"{type(e).__name__}: {e}")
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    if _timed_out:
+        # The timeout was swallowed by a bare `except:` of an extractor, whose result is incomplete
+        return ('failed', f"timed out after {timeout} seconds")
+    return ('ok', result)
+
+def _run_chunk(func:Callable, timeout:float, repo_paths:List[str])->List[Tuple[str, object]]:
+    return [_run_one(func, timeout, repo_path) for repo_path in repo_paths]
+
+def collect(func:Callable, repo_paths:List[str])->List:
+    # Runs a generator function in a worker and returns its output as a list (generators can not be pickled)
+    return list(func(repo_paths))
+
+def iter_parallel(func:Callable, repo_paths:List[str], workers:int=None, chunksize:int=1, timeout:float=None)->Iterator[Tuple[str, str, object]]:
+    """
+    Runs func([repo_path]) for every repository in a pool of `workers` processes, handing
+    `chunksize` repositories to a worker at a time, and yields (repo_path, status, value) in the
+    order of repo_paths as soon as each repository is done. status is 'ok' (value is the result)
+    or 'failed' (value is the reason).
+    With a timeout, the parent also gives up on a chunk PARENT_GRACE seconds after its repositories'
+    timeouts (a worker stuck in C code or killed, e.g. out of memory): its repositories are failed and
+    the pool is replaced, keeping the results of the chunks that had finished meanwhile.
+    """
+    chunks = [repo_paths[i:i + chunksize] for i in range(0, len(repo_paths), chunksize)]
+    finished = {} # chunk number -> outcomes, for the chunks done when a pool was replaced
+    position = 0
+    while position < len(chunks):
+        pool = multiprocessing.Pool(processes=workers)
+        try:
+            pending = {number: pool.apply_async(_run_chunk, (func, timeout, chunks[number]))
+                       for number in range(position, len(chunks)) if number not in finished}
+            stalled = False
+            while position < len(chunks) and not stalled:
+                chunk = chunks[position]
+                if position in finished:
+                    outcomes = finished.pop(position)
+                else:
+                    try:
+                        outcomes = pending[position].get(timeout * len(chunk) + PARENT_GRACE if timeout else None)
+                    except multiprocessing.TimeoutError:
+                        outcomes = [('failed', f"worker did not answer within {timeout * len(chunk) + PARENT_GRACE} seconds")] * len(chunk)
+                        stalled = True
+                for repo_path, (status, value) in zip(chunk, outcomes):
+                    if status != 'ok':
+                        print(f"Failed to extract licenses from {repo_path}: {value}")
+                    yield repo_path, status, value
+                position += 1
+            if stalled:
+                for number, result in pending.items():
+                    if number >= position and result.ready():
+                        finished[number] = result.get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+def run_parallel(func:Callable, repo_paths:List[str], workers:int=None, chunksize:int=1, timeout:float=None)->Tuple[List, List]:
+    """
+    Like iter_parallel, but returns the results in the order of repo_paths (failed repositories
+    are left out) and a list of (repo_path, reason) failures once all repositories are done.
+    """
+    results, failed = [], []
+    for repo_path, status, value in iter_parallel(func, repo_paths, workers, chunksize, timeout):
+        if status == 'ok':
+            results.append(value)
+        else:
+            failed.append((repo_path, value))
+    return results, failed
+
+def merge_license_dicts(license_dicts:List[Dict])->Dict:
+    license_dict = {"Repository name":[],
+                    "Repository path":[],
+                    "License text":[],
+                    "License type":[]
+                    }
+    for partial_dict in license_dicts:
+        for column in license_dict:
+            license_dict[column].extend(partial_dict[column])
+    return license_dict
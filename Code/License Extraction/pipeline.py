@@ -0,0 +1,81 @@
+# Streaming clean -> filter -> dedup stage between the extractors and the output sink
+
+import re
+import hashlib
+import itertools
+import pandas as pd
+import utils
+from typing import Iterable, Tuple
+from output_sink import COLUMNS, OutputSink
+from keyword_matcher import load_matcher
+
+EXTRA_LINES_PATTERN = re.compile(r'\n{2,}')
+KEYWORD_PATTERN = load_matcher('license').regex # declared license texts need one of these (see keyword_rules.json)
+BATCH_SIZE = 10000 # records cleaned and written at a time by write_all
+
+def remove_invalid_rows(df):
+    """
+    This function removes any rows from a DataFrame where the value in column 'License text' 
+    is None, an empty string, or NaN. The function returns a new DataFrame with
+    the filtered rows, without modifying the original DataFrame.
+    """
+    # Create a mask for valid values (i.e., not None, NaN, or empty string)
+    mask = df['License text'].notna() & (df['License text'] != '')
+    # Return a new DataFrame with only valid rows
+    return df[mask].copy()
+
+def clean_dataframe(df, col1, col2, filter_types=()):
+    """
+    Cleans the license texts of all the rows at once: blank lines and repeated spaces are collapsed,
+    rows whose 'License type' is in filter_types must contain one of the keywords of KEYWORD_PATTERN,
+    rows without a text are dropped and duplicated (col1, col2) pairs are removed.
+    """
+    df = df[df[col1].notna()]
+    # License texts repeat a lot across repositories, so every distinct text is cleaned only once
+    codes, texts = pd.factorize(df[col1].astype(str))
+    texts = pd.Series(texts).str.replace(EXTRA_LINES_PATTERN, '\n', regex=True).str.replace(utils.EXTRA_SPACES_PATTERN, ' ', regex=True)
+    df = df.assign(**{col1: texts.to_numpy()[codes], col2: df[col2].astype(str)})
+    if filter_types:
+        has_keyword = texts.str.contains(KEYWORD_PATTERN, regex=True).to_numpy()[codes]
+        df = df[~df['License type'].isin(filter_types).to_numpy() | has_keyword]
+    df = remove_invalid_rows(df)
+    return df.drop_duplicates(subset=[col1,col2], keep='first', ignore_index=True)
+
+class RecordPipeline:
+    """
+    Cleans, filters and deduplicates batches of (repository name, path, license text, license type)
+    records and writes what is left to a sink. Only a 16-byte digest of every (text, repository)
+    pair written so far is kept, so the memory does not grow with the texts.
+    """
+    def __init__(self, sink:OutputSink, filter_types=(), batch_size:int=BATCH_SIZE):
+        # filter_types: license types whose texts must contain a keyword (see clean_dataframe)
+        self.sink = sink
+        self.filter_types = filter_types
+        self.batch_size = batch_size
+        self.seen = set()
+        self.duplicates = 0
+
+    def write(self, records:Iterable[Tuple])->None:
+        """Writes one batch of records, e.g. the records of a repository that is done."""
+        df = pd.DataFrame(list(records), columns=COLUMNS)
+        if df.empty:
+            return
+        df = clean_dataframe(df, 'License text', 'Repository name', filter_types=self.filter_types)
+        keep = []
+        for text, name in zip(df['License text'], df['Repository name']):
+            key = hashlib.blake2b(f"{name}\0{text}".encode('utf-8', errors='surrogatepass'), digest_size=16).digest()
+            keep.append(key not in self.seen)
+            self.seen.add(key)
+        self.duplicates += keep.count(False)
+        df = df[keep]
+        if len(df):
+            self.sink.write(df)
+
+    def write_all(self, records:Iterable[Tuple])->None:
+        # Writes a (long) stream of records in batches of batch_size
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                break
+            self.write(batch)
@@ -0,0 +1,168 @@
+# Decide which directories and files of a repository are worth walking into
+
+import os
+import re
+from typing import List, Tuple
+
+# Directories that never hold license information of the project itself
+DEFAULT_EXCLUDE_DIRS = ('.git', '.hg', '.svn', '__pycache__', '.tox', '.venv', 'venv', '.idea', '.vscode',
+                        '.gradle', '.mypy_cache', '.pytest_cache')
+# Build output directories. Many projects keep sources under these names too, so they are only skipped
+# when they contain an entry starting with one of BUILD_MARKERS (or when they are git-ignored).
+DEFAULT_BUILD_DIRS = ('build', 'dist', 'target')
+BUILD_MARKERS = ('CACHEDIR.TAG', 'CMakeCache.txt', 'CMakeFiles', '.ninja_log', '.rustc_info.json', # cargo, cmake, ninja
+                 'maven-status', 'maven-archiver', 'bdist.', 'lib.', 'temp.') # maven, setuptools
+# Directories of package managers, which only hold copies of third party code
+DEFAULT_VENDOR_DIRS = ('node_modules', 'bower_components')
+# vendor/ is only taken as vendored when a package manager fills it (Go modules, Composer, Bundler)
+DEFAULT_MANAGED_VENDOR_DIRS = ('vendor',)
+VENDOR_MARKERS = ('modules.txt', 'autoload.php', 'bundle')
+# Directories that often hold third party code, but just as often licensed sub-components of the project;
+# add them to vendor_dirs to treat them as vendored (main.py --prune-third-party)
+THIRD_PARTY_DIRS = ('vendor', 'vendors', 'third_party', 'third-party', 'thirdparty', 'external', 'extern')
+DEFAULT_MAX_FILE_SIZE = 20 * 1024 * 1024 # bytes
+SNIFF_BYTES = 8000 # a NUL byte in the first SNIFF_BYTES marks a file as binary (same heuristic as git)
+
+def is_binary(data)->bool:
+    # data: the leading bytes (or text) of a file, as already read by the extractor
+    head = data[:SNIFF_BYTES]
+    return (b'\0' if isinstance(head, bytes) else '\0') in head
+
+# A .gitignore rule: (directory of the .gitignore, compiled pattern, negated, directories only)
+GitignoreRule = Tuple[str, 're.Pattern', bool, bool]
+
+def gitignore_pattern_to_regex(pattern:str)->str:
+    # Translate a .gitignore glob into a regex matched against a path relative to the .gitignore's directory
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+            continue
+        if pattern.startswith('/**', i) and i + 3 == len(pattern):
+            regex += '/.*'
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                regex += '[' + pattern[i+1:end].replace('\\', '\\\\').replace('!', '^', 1) + ']'
+                i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+    return regex + '$'
+
+def read_gitignore(directory:str)->List[GitignoreRule]:
+    rules = []
+    try:
+        with open(os.path.join(directory, '.gitignore'), 'r', encoding='utf-8', errors='ignore') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return rules
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        try:
+            rules.append((directory, re.compile(gitignore_pattern_to_regex(line)), negate, dir_only))
+        except re.error:
+            continue
+    return rules
+
+class PathPruner:
+    """
+    Tells the walker which directories to skip (excluded, build output or vendored), which to walk, and
+    which files are too large or git-ignored to be handed to the extractors. Binary files are recognised
+    by the extractors from the bytes they read anyway (see is_binary), when sniff_binary is set.
+    With scan_vendored the vendored directories are collected for a separate, cheaper pass
+    (license files only) instead of being dropped.
+    """
+    def __init__(self, exclude_dirs=DEFAULT_EXCLUDE_DIRS, vendor_dirs=DEFAULT_VENDOR_DIRS, use_gitignore:bool=True,
+                 max_file_size:int=DEFAULT_MAX_FILE_SIZE, sniff_binary:bool=True, scan_vendored:bool=False,
+                 build_dirs=DEFAULT_BUILD_DIRS, managed_vendor_dirs=DEFAULT_MANAGED_VENDOR_DIRS):
+        self.exclude_dirs = set(exclude_dirs)
+        self.vendor_dirs = set(vendor_dirs)
+        self.build_dirs = set(build_dirs)
+        self.managed_vendor_dirs = set(managed_vendor_dirs)
+        self.use_gitignore = use_gitignore
+        self.max_file_size = max_file_size
+        self.sniff_binary = sniff_binary
+        self.scan_vendored = scan_vendored
+
+    def rules_for(self, directory:str, parent_rules:List[GitignoreRule])->List[GitignoreRule]:
+        # Rules of the parent directories plus the ones of directory/.gitignore
+        if not self.use_gitignore:
+            return parent_rules
+        rules = read_gitignore(directory)
+        return parent_rules + rules if rules else parent_rules
+
+    @staticmethod
+    def is_ignored(path:str, is_dir:bool, rules:List[GitignoreRule])->bool:
+        ignored = False
+        # The last matching rule decides, like in git
+        for base, regex, negate, dir_only in rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(os.path.relpath(path, base).replace(os.sep, '/')):
+                ignored = not negate
+        return ignored
+
+    @staticmethod
+    def has_marker(path:str, markers:tuple, entries:List[str]=None)->bool:
+        # entries: names in the directory, listed from the disk if None
+        if entries is None:
+            try:
+                entries = os.listdir(path)
+            except OSError:
+                return False
+        return any(entry.startswith(markers) for entry in entries)
+
+    def check_dir(self, path:str, name:str, rules:List[GitignoreRule], entries:List[str]=None)->str:
+        """Returns 'walk', 'skip' or 'vendored' for a directory; entries: its names, if already known."""
+        if name in self.exclude_dirs:
+            return 'skip'
+        if name in self.vendor_dirs:
+            return 'vendored'
+        if rules and self.is_ignored(path, True, rules):
+            return 'skip'
+        if name in self.build_dirs and self.has_marker(path, BUILD_MARKERS, entries):
+            return 'skip'
+        if name in self.managed_vendor_dirs and self.has_marker(path, VENDOR_MARKERS, entries):
+            return 'vendored'
+        return 'walk'
+
+    def check_file(self, path:str, size:int, rules:List[GitignoreRule])->bool:
+        """Returns True if the file should be handed to the extractors."""
+        if self.max_file_size is not None and size > self.max_file_size:
+            return False
+        if rules and self.is_ignored(path, False, rules):
+            return False
+        return True
+
+# Walks everything, like the plain os.walk used before.
+NO_PRUNING = PathPruner(exclude_dirs=(), vendor_dirs=(), use_gitignore=False, max_file_size=None, sniff_binary=False,
+                        build_dirs=(), managed_vendor_dirs=())
@@ -6,11 +6,17 @@
     4. for Java dependencies: use maven central
     5. for c, c++ and c# dependencies: manually extract from GitHub
 """
-import os
 import requests
 # import pandas as pd
-from typing import List
+from typing import Iterator, List, Tuple
+from functools import partial
 from bs4 import BeautifulSoup
+from walker import Extractor, RepositoryWalker
+from registry_client import http_get, resolve_concurrently, reset_transient_failures, transient_failures
+from registry_cache import NEGATIVE_RESULTS
+from registry_snapshot import RESOLUTION_MODES
+from pruning import PathPruner
+from scan_cache import file_stat
 from utils import (extract_python_dependencies,
                    extract_js_dependencies,
                 #    extract_java_dependencies,
@@ -19,37 +25,85 @@ from utils import (extract_python_dependencies,
                    extract_csharp_dependencies,
                    extract_c_cplusplus_dependencies)
 
-def extract_dependencies_from_file(file_path: str) -> List[str]:
+def extract_dependencies_from_file(file_path: str, content: str = None) -> List[str]:
+    # content: the manifest's text, if it was not read from file_path (e.g. a git blob)
     # print(file_path.split('/')[-1])
     if file_path.endswith(('requirements.txt', 'Pipfile', 'Pipfile.txt', 'pyproject.toml', 'environment.yaml')):
         print(f"Python file found at {file_path}")
-        return extract_python_dependencies(file_path, language="Python")
+        return extract_python_dependencies(file_path, language="Python", content=content)
     elif file_path.endswith('package.json'):
         print(f"Javascript file found at {file_path}")
-        return extract_js_dependencies(file_path, language="Js")
+        return extract_js_dependencies(file_path, language="Js", content=content)
     # elif file_path.endswith(('pom.xml', 'build.gradle')):
     #     print(f"Java file found!")
-    #     return extract_java_dependencies(file_path, language="Java")
+    #     return extract_java_dependencies(file_path, language="Java", content=content)
     elif file_path.endswith('Gemfile'):
         print(f"Ruby file found at {file_path}!")
-        return extract_ruby_dependencies(file_path, language="Ruby")
+        return extract_ruby_dependencies(file_path, language="Ruby", content=content)
     elif file_path.endswith('Cargo.toml'):
         print(f"Rust file found at {file_path}!")
-        return extract_rust_dependencies(file_path, language="Rust")
+        return extract_rust_dependencies(file_path, language="Rust", content=content)
     elif file_path.endswith(('CMakeLists.txt', 'Makefile')):
         print(f"C++ file found at {file_path}")
-        return extract_c_cplusplus_dependencies(file_path, language="C++")
+        return extract_c_cplusplus_dependencies(file_path, language="C++", content=content)
     elif file_path.endswith(('.csproj', 'packages.config')):
         print(f"C# file found at {file_path}")
-        return extract_csharp_dependencies(file_path, language="C#")
+        return extract_csharp_dependencies(file_path, language="C#", content=content)
     return []
 
-def find_all_files(directory: str) -> List[str]:
-    all_files = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            all_files.append(os.path.join(root, file))
-    return all_files
+# Bump when the manifest parsers change, so cached dependencies are not reused.
+CACHE_VERSION = '1'
+
+def extract_cached_dependencies_from_file(file_path: str, cache=None):
+    # cache: optional ScanCache; the dependencies of an unchanged manifest are taken from it
+    if cache is None:
+        return extract_dependencies_from_file(file_path)
+    hit, dependencies = cache.get('referenced', file_path, CACHE_VERSION)
+    if not hit:
+        st = file_stat(file_path)
+        dependencies = extract_dependencies_from_file(file_path)
+        cache.put('referenced', file_path, dependencies, CACHE_VERSION, st)
+    return tuple(dependencies) if dependencies else []
+
+def find_all_files(directory: str, pruner: PathPruner = None) -> List[str]:
+    return RepositoryWalker([ManifestParser()], pruner).walk(directory)['referenced']
+
+# File name endings handled by extract_dependencies_from_file
+MANIFEST_SUFFIXES = ('requirements.txt', 'Pipfile', 'Pipfile.txt', 'pyproject.toml', 'environment.yaml',
+                     'package.json', 'Gemfile', 'Cargo.toml', 'CMakeLists.txt', 'Makefile',
+                     '.csproj', 'packages.config')
+
+class ManifestParser(Extractor):
+    """Collects the dependency manifests seen during a repository walk."""
+    name = 'referenced'
+
+    def start(self, repo_path:str)->None:
+        self.manifest_files = []
+        # Texts of the manifests that were handed over as blobs instead of being read from disk
+        self.manifest_contents = {}
+
+    def wants(self, file_name:str)->bool:
+        return file_name.endswith(MANIFEST_SUFFIXES)
+
+    def visit(self, file_path:str)->None:
+        self.manifest_files.append(file_path)
+
+    def visit_blob(self, file_path:str, data:bytes)->None:
+        self.manifest_files.append(file_path)
+        self.manifest_contents[file_path] = data.decode('utf-8', errors='ignore').replace('\r\n', '\n')
+
+    def finish(self)->List[str]:
+        return self.manifest_files
+
+# Registry endpoints; {} is replaced by the package name
+REGISTRY_URLS = {"pypi": 'https://pypi.org/pypi/{}/json',
+                 "npm": 'https://registry.npmjs.org/{}',
+                 "npm_web": 'https://www.npmjs.com/package/{}',
+                 "rubygems": 'https://rubygems.org/gems/{}',
+                 "crates": 'https://crates.io/api/v1/crates/{}',
+                 "vcpkg": "https://vcpkg.io/en/package/{}",
+                 "nuget": 'https://www.nuget.org/packages/{}'
+                 }
 
 def get_pypi_license(package_name: str) -> str:
     """
@@ -57,8 +111,8 @@ def get_pypi_license(package_name: str) -> str:
         :param package_name: The name of the PyPI package
         :return: License information or a message if not found
     """
-    url = f'https://pypi.org/pypi/{package_name}/json'
-    response = requests.get(url)
+    url = REGISTRY_URLS['pypi'].format(package_name)
+    response = http_get(url)
     if response.status_code == 200:
         try:
             data = response.json()
@@ -75,11 +129,11 @@ def get_npm_license(package_name: str) -> str:
         :param package_name: The name of the npm package
         :return: License information or a message if not found
     """
-    api_url = f'https://registry.npmjs.org/{package_name}'
-    web_url = f'https://www.npmjs.com/package/{package_name}'
+    api_url = REGISTRY_URLS['npm'].format(package_name)
+    web_url = REGISTRY_URLS['npm_web'].format(package_name)
     try:
         """First Try to extract the license using the api"""
-        response = requests.get(api_url)
+        response = http_get(api_url)
         if response.status_code == 200:
             data = response.json()
             license_info = data.get('license', 'No license information found')
@@ -90,7 +144,7 @@ def get_npm_license(package_name: str) -> str:
         """If max retry limit exceeds, try to scraping the web for license"""
         try:
             # Send a GET request to the URL
-            response = requests.get(web_url)
+            response = http_get(web_url)
             response.raise_for_status()  # Raise an error for bad responses
 
             # Parse the content of the page with BeautifulSoup
@@ -115,10 +169,10 @@ def get_npm_license(package_name: str) -> str:
 
 def get_ruby_gem_license(package: str)->str:
     """Useful to extract Ruby dependency license identifier."""
-    url=f'https://rubygems.org/gems/{package}'
+    url=REGISTRY_URLS['rubygems'].format(package)
     try:
         # Send a GET request to the URL
-        response=requests.get(url)
+        response=http_get(url)
         response.raise_for_status() #Raise an error for bad response
 
         # Parse the content of the page with BeautifulSoup
@@ -134,10 +188,10 @@ def get_ruby_gem_license(package: str)->str:
 
 def get_rust_license(package:str):
     """Useful to extract rust dependency license identifier"""
-    url = f'https://crates.io/api/v1/crates/{package}'
+    url = REGISTRY_URLS['crates'].format(package)
     try:
         # Send a GET request to the URL
-        response=requests.get(url)
+        response=http_get(url)
         response_dict = response.json()
         versions = response_dict['versions']
         versions_dict = versions[0]
@@ -148,10 +202,10 @@ def get_rust_license(package:str):
 
 def get_vcpkg_license_identifier(package_name):
     """Useful to extract C++ dependency license identifiers"""
-    url = f"https://vcpkg.io/en/package/{package_name}"
+    url = REGISTRY_URLS['vcpkg'].format(package_name)
     try:
         # Send a GET request to the URL
-        response = requests.get(url)
+        response = http_get(url)
         response.raise_for_status()  # Check for HTTP errors
 
         # Parse the HTML content
@@ -173,11 +227,11 @@ def get_vcpkg_license_identifier(package_name):
 def get_nuget_license_identifier(package_name):
     """Useful to extract C# dependency license identifiers."""
     # URL for the NuGet package
-    url = f'https://www.nuget.org/packages/{package_name}'
+    url = REGISTRY_URLS['nuget'].format(package_name)
     
     try:
         # Send a GET request to the URL
-        response = requests.get(url)
+        response = http_get(url)
         response.raise_for_status()  # Raise an error for bad responses
 
         # Parse the HTML content
@@ -198,15 +252,23 @@ def get_nuget_license_identifier(package_name):
     except requests.exceptions.RequestException as e:
         return "Package not found"
 
-def ref_licenses(path:str):
-    all_files = find_all_files(path)
+def ref_licenses(path:str, all_files:List[str]=None, cache=None, pruner:PathPruner=None, contents:dict=None):
+    # all_files: manifest files of the repository, if they were already collected by a walk
+    # cache: optional ScanCache used to skip unchanged manifests
+    # pruner: decides which directories and files are skipped when all_files is not given
+    # contents: {file: text} of manifests that are not read from disk (e.g. git blobs)
+    if all_files is None:
+        all_files = find_all_files(path, pruner)
     all_dependencies = {"Python":[], "Js":[],
                         # "Java":[],
                         "Ruby":[], "Rust":[],
                         "C++":[], "C#":[]
                         }
     for file in all_files:
-        dependencies = extract_dependencies_from_file(file)
+        if contents is not None and file in contents:
+            dependencies = extract_dependencies_from_file(file, contents[file])
+        else:
+            dependencies = extract_cached_dependencies_from_file(file, cache)
         if dependencies:
             all_dependencies[dependencies[1]].extend(dependencies[0])
             #dependencied[1]->language, dependencies[0]->dependency
@@ -214,35 +276,109 @@ def ref_licenses(path:str):
     all_dependencies = {language: list(set(all_dependencies[language])) for language in all_dependencies}
     return all_dependencies
 
-def get_referenced_license_dict(paths):
-    all_functions = {"Python":get_pypi_license,
-                     "Js":get_npm_license,
-                    #  "Java":get_maven_license,
-                     "Ruby":get_ruby_gem_license,
-                     "Rust":get_rust_license,
-                     "C++":get_vcpkg_license_identifier,
-                     "C#":get_nuget_license_identifier
-                     }
+all_functions = {"Python":get_pypi_license,
+                 "Js":get_npm_license,
+                #  "Java":get_maven_license,
+                 "Ruby":get_ruby_gem_license,
+                 "Rust":get_rust_license,
+                 "C++":get_vcpkg_license_identifier,
+                 "C#":get_nuget_license_identifier
+                 }
+
+def resolve_license(language:str, dependency:str, registry_cache=None, snapshot=None, mode:str='online')->str:
+    # registry_cache: optional RegistryCache consulted before (and filled after) asking the registry
+    # snapshot: optional RegistrySnapshot used in the 'offline' and 'prefer-offline' modes
+    # mode: one of registry_snapshot.RESOLUTION_MODES; only 'offline' never touches the network
+    if snapshot is not None and mode != 'online':
+        hit, license = snapshot.get(language, dependency)
+        # In 'prefer-offline' a negative entry (e.g. from an older snapshot) does not stop the live lookup
+        if hit and (mode == 'offline' or license not in NEGATIVE_RESULTS):
+            return license
+    if registry_cache is not None:
+        hit, license = registry_cache.get(language, dependency)
+        if hit:
+            return license
+    if mode == 'offline':
+        return 'Package not found'
+    reset_transient_failures()
+    license = all_functions[language](dependency)
+    # A 'not found' after a timeout, connection error or 5xx is not an answer of the registry: not cached
+    if registry_cache is not None and not (license in NEGATIVE_RESULTS and transient_failures()):
+        registry_cache.put(language, dependency, license)
+    return license
+
+# Resolve the (language, dependency) tasks that are not cached yet and store them in the registry_cache.
+def warm_registry_cache(registry_cache, tasks:List)->None:
+    missing = [task for task in tasks if not registry_cache.get(*task, count=False)[0]]
+    print(f"Warming the registry cache with {len(missing)} of {len(tasks)} dependencies...")
+    resolve_concurrently(missing, partial(resolve_license, registry_cache=registry_cache))
+
+def dependency_tasks(all_dependencies:dict)->List:
+    return [(language, dependency) for language in all_dependencies for dependency in all_dependencies[language]]
+
+# Resolve every unique (language, dependency) of all the repositories once.
+def resolve_unique_dependencies(repo_dependencies:List, registry_cache=None, snapshot=None, mode:str='online')->dict:
+    # repo_dependencies: [(repository path, {language: [dependency,...]}),...]
+    if mode not in RESOLUTION_MODES:
+        raise ValueError(f"Unknown resolution mode {mode}, expected one of {RESOLUTION_MODES}")
+    all_tasks = [task for _, all_dependencies in repo_dependencies for task in dependency_tasks(all_dependencies)]
+    unique_tasks = list(dict.fromkeys(all_tasks))
+    print(f"Resolving {len(unique_tasks)} unique dependencies ({len(all_tasks)} across {len(repo_dependencies)} repositories)...")
+    return resolve_concurrently(unique_tasks, partial(resolve_license, registry_cache=registry_cache, snapshot=snapshot, mode=mode))
+
+# Add the licenses of the dependencies of a repository to the license_dict.
+def referenced_license_records(path:str, all_dependencies:dict, licenses:dict)->Iterator[Tuple]:
+    """Yields a (repository name, path, license, 'Referenced') record for every dependency with a known license."""
+    # licenses: {(language, dependency): license} as returned by resolve_unique_dependencies
+    for task in dependency_tasks(all_dependencies):
+        license = licenses[task]
+        if license in ['SEE LICENSE IN LICENSE','No license information found','Package not found', 'N/A']:
+            continue
+        yield (path.split('/')[-1], path, license, "Referenced")
+
+def add_referenced_licenses(license_dict:dict, path:str, all_dependencies:dict, licenses:dict)->dict:
+    for name, repo_path, text, type_ in referenced_license_records(path, all_dependencies, licenses):
+        license_dict['Repository name'].append(name)
+        license_dict['Repository path'].append(repo_path)
+        license_dict['License text'].append(text)
+        license_dict['License type'].append(type_)
+    return license_dict
+
+# Phase 1: collect the dependencies of every repository.
+def iter_dependencies(paths, cache=None, pruner:PathPruner=None)->Iterator[Tuple]:
+    # Yields (repository path, dependencies) for every repository
+    for path in paths:
+        yield (path, ref_licenses(path, cache=cache, pruner=pruner))
+        if cache is not None:
+            cache.flush()
+
+def collect_dependencies(paths, cache=None, pruner:PathPruner=None)->List:
+    return list(iter_dependencies(paths, cache, pruner))
+
+# Phase 2 and 3: resolve the unique dependencies once, then fan the licenses back out to the repositories.
+def iter_referenced_licenses(repo_dependencies:List, registry_cache=None, snapshot=None, mode:str='online')->Iterator[Tuple]:
+    licenses = resolve_unique_dependencies(repo_dependencies, registry_cache, snapshot, mode)
+    for path, all_dependencies in repo_dependencies:
+        yield from referenced_license_records(path, all_dependencies, licenses)
+
+def build_referenced_license_dict(repo_dependencies:List, registry_cache=None, snapshot=None, mode:str='online')->dict:
     license_dict = {
         "Repository name":[],
         "Repository path":[],
         "License text":[],
         "License type":[]
     }
-    for path in paths:
-        # print(path)
-        all_dependencies = ref_licenses(path)
-        
-        for language in all_dependencies:
-            for dependency in all_dependencies[language]:
-                license = all_functions[language](dependency)
-                if license in ['SEE LICENSE IN LICENSE','No license information found','Package not found', 'N/A']:
-                    continue
-                license_dict['Repository name'].append(path.split('/')[-1])
-                license_dict['Repository path'].append(path)
-                license_dict['License text'].append(license)
-                license_dict['License type'].append("Referenced")
+    for name, path, text, type_ in iter_referenced_licenses(repo_dependencies, registry_cache, snapshot, mode):
+        license_dict['Repository name'].append(name)
+        license_dict['Repository path'].append(path)
+        license_dict['License text'].append(text)
+        license_dict['License type'].append(type_)
     return license_dict
 
+def get_referenced_license_dict(paths, cache=None, pruner:PathPruner=None, registry_cache=None, snapshot=None, mode:str='online'):
+    # registry_cache: optional RegistryCache of the licenses already fetched from the registries
+    # snapshot, mode: optional RegistrySnapshot and resolution mode for offline runs
+    return build_referenced_license_dict(collect_dependencies(paths, cache, pruner), registry_cache, snapshot, mode)
+
 if __name__ == '__main__':
     print("Nothing to see here!")
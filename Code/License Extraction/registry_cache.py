@@ -0,0 +1,128 @@
+# Persistent cache of the licenses returned by the package registries
+
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from typing import Iterable, Tuple
+
+DEFAULT_TTL = 30 * 24 * 3600 # seconds a found license is reused
+DEFAULT_NEGATIVE_TTL = 24 * 3600 # seconds a "not found" answer is reused
+# Answers of the registry functions that mean no license was found. They are only cached when the registry
+# actually answered (e.g. a 404), not after a timeout, a connection error or a 5xx (see resolve_license).
+NEGATIVE_RESULTS = ('SEE LICENSE IN LICENSE', 'No license information found', 'Package not found',
+                    'Package not found.', 'N/A', None)
+
+class RegistryCache:
+    """
+    SQLite cache of registry answers keyed on (ecosystem, package name, version). Negative
+    answers are kept for a shorter TTL. Thread safe, and picklable for worker processes.
+    """
+    def __init__(self, db_path:str, ttl:float=DEFAULT_TTL, negative_ttl:float=DEFAULT_NEGATIVE_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        state['_connection'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self)->sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS licenses (
+                                        ecosystem TEXT, name TEXT, version TEXT, license TEXT,
+                                        negative INTEGER, fetched_at REAL,
+                                        PRIMARY KEY (ecosystem, name, version))""")
+        return self._connection
+
+    def get(self, ecosystem:str, name:str, version:str='', count:bool=True):
+        """Returns (True, license) for a fresh cached answer, (False, None) otherwise."""
+        # count: False for lookups that only check what is cached (they are not hits or misses of a resolution)
+        with self._lock:
+            row = self.connection.execute("SELECT license, negative, fetched_at FROM licenses WHERE ecosystem=? AND name=? AND version=?",
+                                          (ecosystem, name, version)).fetchone()
+            ttl = (self.negative_ttl if row[1] else self.ttl) if row else 0
+            if row is None or time.time() - row[2] > ttl:
+                self.misses += count
+                return (False, None)
+            self.hits += count
+            return (True, row[0])
+
+    def put(self, ecosystem:str, name:str, license:str, version:str='', fetched_at:float=None)->None:
+        with self._lock:
+            self.connection.execute("INSERT OR REPLACE INTO licenses VALUES (?,?,?,?,?,?)",
+                                    (ecosystem, name, version, license, int(license in NEGATIVE_RESULTS),
+                                     fetched_at if fetched_at is not None else time.time()))
+            self.connection.commit()
+
+    def entries(self)->Iterable[Tuple]:
+        with self._lock:
+            rows = self.connection.execute("SELECT ecosystem, name, version, license, fetched_at FROM licenses ORDER BY ecosystem, name, version").fetchall()
+        return rows
+
+    def export_jsonl(self, path:str)->int:
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for ecosystem, name, version, license, fetched_at in self.entries():
+                f.write(json.dumps({"ecosystem":ecosystem, "name":name, "version":version,
+                                    "license":license, "fetched_at":fetched_at}) + '\n')
+                count += 1
+        return count
+
+    def import_jsonl(self, path:str)->int:
+        # Lines look like the ones written by export_jsonl; fetched_at defaults to now
+        count = 0
+        with self._lock:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    license = entry.get('license')
+                    self.connection.execute("INSERT OR REPLACE INTO licenses VALUES (?,?,?,?,?,?)",
+                                            (entry['ecosystem'], entry['name'], entry.get('version', ''), license,
+                                             int(license in NEGATIVE_RESULTS), entry.get('fetched_at') or time.time()))
+                    count += 1
+            self.connection.commit()
+        return count
+
+    def report(self)->str:
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0
+        return f"Registry cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export, import or warm up the registry license cache.")
+    parser.add_argument('db_path', help="SQLite file of the cache")
+    parser.add_argument('command', choices=['export', 'import', 'warm'])
+    parser.add_argument('path', help="JSONL file to write (export) or read (import: cache entries, warm: {\"ecosystem\", \"name\"} lines)")
+    args = parser.parse_args()
+    cache = RegistryCache(args.db_path)
+    if args.command == 'export':
+        print(f"Exported {cache.export_jsonl(args.path)} entries.")
+    elif args.command == 'import':
+        print(f"Imported {cache.import_jsonl(args.path)} entries.")
+    else:
+        from referenced_license import warm_registry_cache
+        tasks = []
+        with open(args.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    tasks.append((entry['ecosystem'], entry['name']))
+        warm_registry_cache(cache, tasks)
+        print(cache.report())
@@ -0,0 +1,128 @@
+# Pooled, rate-limit aware HTTP client for the package registries, and a concurrent resolver on top of it
+
+import time
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Iterable, Tuple
+
+REQUEST_TIMEOUT = (5, 30) # (connect, read) seconds
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 1.0 # seconds, doubled after every retry
+MAX_RETRY_AFTER = 300 # never wait longer than this for a single Retry-After
+PER_HOST_LIMIT = 8 # concurrent requests per registry host
+RESOLVER_WORKERS = 32
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_local = threading.local()
+_host_lock = threading.Lock()
+_host_semaphores = {}
+_host_blocked_until = {}
+
+def get_session()->requests.Session:
+    # One keep-alive session per thread (requests.Session is not thread safe)
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=PER_HOST_LIMIT)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+def _host_semaphore(host:str)->threading.Semaphore:
+    with _host_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+        return _host_semaphores[host]
+
+def _retry_after(response:requests.Response, attempt:int)->float:
+    value = response.headers.get('Retry-After')
+    if value:
+        try:
+            return min(float(value), MAX_RETRY_AFTER)
+        except ValueError:
+            try:
+                return min(max(parsedate_to_datetime(value).timestamp() - time.time(), 0), MAX_RETRY_AFTER)
+            except (TypeError, ValueError):
+                pass
+    return BACKOFF_FACTOR * 2 ** attempt
+
+def _block_host(host:str, seconds:float)->None:
+    # Everyone talking to this host waits, not just the request that was told to back off
+    with _host_lock:
+        _host_blocked_until[host] = max(_host_blocked_until.get(host, 0), time.monotonic() + seconds)
+
+def _wait_for_host(host:str)->None:
+    with _host_lock:
+        delay = _host_blocked_until.get(host, 0) - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+def reset_transient_failures()->None:
+    _local.transient_failures = 0
+
+def transient_failures()->int:
+    """
+    Requests of this thread since reset_transient_failures() that ended in a connection error, a timeout or
+    a retryable status (429/5xx) once the retries ran out: their 'not found' answers may not be true.
+    """
+    return getattr(_local, 'transient_failures', 0)
+
+def _count_transient_failure()->None:
+    _local.transient_failures = transient_failures() + 1
+
+def http_get(url:str, **kwargs)->requests.Response:
+    """
+    requests.get with a pooled keep-alive session, a timeout, a per-host concurrency limit and
+    retries with exponential backoff (honouring Retry-After on 429/503). The last response is
+    returned if the retries run out; connection errors are raised after the last retry.
+    """
+    host = urlsplit(url).netloc
+    kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+    for attempt in range(MAX_RETRIES + 1):
+        _wait_for_host(host)
+        try:
+            with _host_semaphore(host):
+                response = get_session().get(url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == MAX_RETRIES:
+                _count_transient_failure()
+                raise
+            time.sleep(BACKOFF_FACTOR * 2 ** attempt)
+            continue
+        if response.status_code not in RETRY_STATUS_CODES:
+            return response
+        if attempt == MAX_RETRIES:
+            _count_transient_failure()
+            return response
+        delay = _retry_after(response, attempt)
+        if response.status_code in (429, 503):
+            _block_host(host, delay)
+        else:
+            time.sleep(delay)
+    return response
+
+def resolve_concurrently(tasks:Iterable[Tuple[str, str]], resolve:Callable[[str, str], str],
+                         workers:int=RESOLVER_WORKERS, progress_every:int=100)->Dict[Tuple[str, str], str]:
+    """
+    Calls resolve(language, dependency) for every (language, dependency) task in a thread pool.
+    A task that raises resolves to 'Package not found'.
+    """
+    tasks = list(dict.fromkeys(tasks))
+    def run(task):
+        try:
+            return resolve(*task)
+        except Exception as e:
+            print(f"Could not resolve the license of {task[1]} ({task[0]}): {e}")
+            return 'Package not found'
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for done, (task, license) in enumerate(zip(tasks, executor.map(run, tasks)), start=1):
+            results[task] = license
+            if done % progress_every == 0 or done == len(tasks):
+                print(f"Resolved {done}/{len(tasks)} dependencies")
+    return results
@@ -0,0 +1,106 @@
+# Local, indexed snapshot of registry licenses for resolving referenced licenses without network access
+
+import os
+import json
+import sqlite3
+import argparse
+import threading
+from registry_cache import NEGATIVE_RESULTS
+
+# online: ask the live registries only; offline: use the snapshot only;
+# prefer-offline: use the snapshot and ask the live registries for the packages it does not know
+RESOLUTION_MODES = ('online', 'offline', 'prefer-offline')
+
+class RegistrySnapshot:
+    """
+    Read-mostly SQLite store of licenses with a primary key on (ecosystem, name), built from
+    JSONL metadata dumps or from a RegistryCache of a previous run. Thread safe and picklable.
+    """
+    def __init__(self, db_path:str, create:bool=False):
+        # create: start a new snapshot if db_path does not exist (when building one); otherwise a missing
+        # file is an error, so a mistyped path does not resolve every dependency as unknown
+        if not create and not os.path.exists(db_path):
+            raise FileNotFoundError(f"No registry snapshot at {db_path}; build one with registry_snapshot.py")
+        self.db_path = db_path
+        self.create = create
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        state['_connection'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self)->sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+            if self.create:
+                self._connection.execute("""CREATE TABLE IF NOT EXISTS licenses (
+                                            ecosystem TEXT, name TEXT, license TEXT,
+                                            PRIMARY KEY (ecosystem, name)) WITHOUT ROWID""")
+        return self._connection
+
+    def get(self, ecosystem:str, name:str):
+        """Returns (True, license) if the snapshot knows the package, (False, None) otherwise."""
+        with self._lock:
+            row = self.connection.execute("SELECT license FROM licenses WHERE ecosystem=? AND name=?", (ecosystem, name)).fetchone()
+            if row is None:
+                self.misses += 1
+                return (False, None)
+            self.hits += 1
+            return (True, row[0])
+
+    def import_jsonl(self, path:str)->int:
+        # One {"ecosystem": "Js", "name": "react", "license": "MIT"} object per line
+        count = 0
+        with self._lock:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry.get('license') in NEGATIVE_RESULTS:
+                        continue # the snapshot only keeps known licenses
+                    self.connection.execute("INSERT OR REPLACE INTO licenses VALUES (?,?,?)",
+                                            (entry['ecosystem'], entry['name'], entry.get('license')))
+                    count += 1
+            self.connection.commit()
+        return count
+
+    def import_registry_cache(self, cache_db_path:str)->int:
+        # Copies the (latest, any version) licenses of a RegistryCache database; its negative answers
+        # ('Package not found', ...) are left out, they may only have been a failed request
+        with self._lock:
+            self.connection.execute("ATTACH DATABASE ? AS cache", (cache_db_path,))
+            try:
+                count = self.connection.execute("""INSERT OR REPLACE INTO licenses
+                                                   SELECT ecosystem, name, license FROM cache.licenses
+                                                   WHERE NOT negative AND license IS NOT NULL
+                                                   ORDER BY fetched_at""").rowcount
+                self.connection.commit()
+            finally:
+                self.connection.execute("DETACH DATABASE cache")
+        return count
+
+    def report(self)->str:
+        return f"Registry snapshot: {self.hits} hits, {self.misses} misses"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the offline registry snapshot used by referenced_license.py.")
+    parser.add_argument('db_path', help="SQLite file of the snapshot (created if missing)")
+    parser.add_argument('--jsonl', action='append', default=[], help="JSONL dump with ecosystem, name and license per line")
+    parser.add_argument('--registry-cache', action='append', default=[], help="registry cache (SQLite) of a previous run")
+    args = parser.parse_args()
+    snapshot = RegistrySnapshot(args.db_path, create=True)
+    for path in args.registry_cache:
+        print(f"Imported {snapshot.import_registry_cache(path)} entries from {path}.")
+    for path in args.jsonl:
+        print(f"Imported {snapshot.import_jsonl(path)} entries from {path}.")
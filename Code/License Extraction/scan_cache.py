@@ -0,0 +1,125 @@
+# Persistent per-file cache of extraction results, so unchanged files are not re-read on a re-run
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+# A file modified this close (in nanoseconds) to the moment it was cached may have been changed again
+# within the same mtime tick, so its stat is not trusted and its content hash is checked instead.
+RACY_WINDOW_NS = 2 * 10**9
+
+def hash_file(file_path:str, limit:int=None)->str:
+    # limit: hash only the first limit bytes of the file
+    sha = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        if limit:
+            sha.update(f.read(limit))
+        else:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+def file_stat(file_path:str):
+    # The stat to hand to ScanCache.put, taken before the file is read; None if it can not be read
+    try:
+        return os.stat(file_path)
+    except OSError:
+        return None
+
+class ScanCache:
+    """
+    SQLite cache of the values extracted from a file, keyed on (kind, path) and validated
+    against the file's size, mtime and content hash. `kind` names the extractor
+    (e.g. 'inline') and `version` its extraction logic; a different version is a miss.
+    Picklable, so the same cache can be handed to the worker processes.
+    """
+    def __init__(self, db_path:str, commit_every:int=500):
+        # commit_every: rows kept in memory before they are written; each write is one short transaction,
+        # so the worker processes sharing the database do not hold its write lock while they scan
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pending = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_pending'] = []
+        return state
+
+    @property
+    def connection(self)->sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, timeout=60)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS files (
+                                        kind TEXT, path TEXT, version TEXT, size INTEGER, mtime_ns INTEGER,
+                                        sha1 TEXT, cached_at_ns INTEGER, value TEXT,
+                                        PRIMARY KEY (kind, path))""")
+        return self._connection
+
+    def get(self, kind:str, file_path:str, version:str='1', limit:int=None):
+        """
+        Returns (True, value) if the file is unchanged since it was cached, (False, None) otherwise.
+        limit: the value only depends on the first limit bytes of the file (header mode), only those are hashed
+        """
+        try:
+            st = os.stat(file_path)
+            row = self.connection.execute("SELECT version, size, mtime_ns, sha1, cached_at_ns, value FROM files WHERE kind=? AND path=?",
+                                          (kind, file_path)).fetchone()
+            if row is None or row[0] != version or row[1] != st.st_size:
+                self.misses += 1
+                return (False, None)
+            if row[2] != st.st_mtime_ns or st.st_mtime_ns >= row[4] - RACY_WINDOW_NS:
+                if hash_file(file_path, limit) != row[3]:
+                    self.misses += 1
+                    return (False, None)
+                self._write(kind, file_path, version, st, row[3], row[5])
+            self.hits += 1
+            return (True, json.loads(row[5]))
+        except (OSError, sqlite3.Error) as e:
+            print(f"Scan cache lookup failed for {file_path}: {e}")
+            self.misses += 1
+            return (False, None)
+
+    def put(self, kind:str, file_path:str, value, version:str='1', st:os.stat_result=None, sha1:str=None,
+            limit:int=None)->None:
+        """
+        Caches the value extracted from a file. st: the stat of the file taken before it was read, the value
+        is not cached if the file changed since; sha1: the hash of the bytes the value was extracted from
+        (the file is hashed again if it is not given); limit: as in get.
+        """
+        try:
+            now = os.stat(file_path)
+            if st is None:
+                st = now
+            elif (now.st_size, now.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+                return
+            self._write(kind, file_path, version, st, sha1 or hash_file(file_path, limit), json.dumps(value))
+        except (OSError, sqlite3.Error) as e:
+            print(f"Could not cache the result for {file_path}: {e}")
+
+    def _write(self, kind, file_path, version, st, sha1, value)->None:
+        self._pending.append((kind, file_path, version, st.st_size, st.st_mtime_ns, sha1, time.time_ns(), value))
+        if len(self._pending) >= self.commit_every:
+            self.flush()
+
+    def flush(self)->None:
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        try:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?)", rows)
+        except sqlite3.Error as e:
+            print(f"Could not write {len(rows)} scan cache entries: {e}")
+
+    def close(self)->None:
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
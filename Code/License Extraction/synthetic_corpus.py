@@ -0,0 +1,166 @@
+# Deterministic synthetic repositories for benchmarking the extraction stages
+
+import os
+import json
+import random
+import argparse
+from typing import Dict, List
+
+MIT_TEXT = """MIT License
+
+Copyright (c) {year} {owner}
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+"""
+
+HEADER_TEXT = """Copyright {year} {owner}
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use
+this file except in compliance with the License. Unless required by applicable law
+or agreed to in writing, software is distributed WITHOUT WARRANTY OF ANY KIND;
+permission is granted under the terms of the License."""
+
+# Extension -> how a license header is written in it
+HEADER_STYLES = {'.py': 'docstring', '.c': 'block', '.h': 'block', '.cpp': 'block', '.java': 'block', '.js': 'block',
+                 '.ts': 'block', '.go': 'line', '.rs': 'line', '.cs': 'line', '.rb': 'hash', '.sh': 'hash', '.txt': None}
+SPDX_IDS = ['MIT', 'Apache-2.0', 'BSD-3-Clause', 'GPL-2.0-only', 'MPL-2.0']
+ECOSYSTEMS = ['Python', 'Js', 'Ruby', 'Rust', 'C++', 'C#']
+
+def license_header(ext:str, rng:random.Random, owner:str)->str:
+    style = HEADER_STYLES[ext]
+    if style is None:
+        return ''
+    if rng.random() < 0.3:
+        spdx = f"SPDX-License-Identifier: {rng.choice(SPDX_IDS)}"
+        return {'docstring': f'# {spdx}\n', 'block': f'/* {spdx} */\n', 'line': f'// {spdx}\n', 'hash': f'# {spdx}\n'}[style]
+    text = HEADER_TEXT.format(year=rng.randint(1995, 2024), owner=owner)
+    if style == 'docstring':
+        return f'"""\n{text}\n"""\n'
+    if style == 'block':
+        return '/*\n' + ''.join(f' * {line}\n' for line in text.splitlines()) + ' */\n'
+    prefix = '//' if style == 'line' else '#'
+    return ''.join(f'{prefix} {line}\n' for line in text.splitlines())
+
+def source_body(ext:str, rng:random.Random, size:int)->str:
+    comment = {'docstring': '#', 'hash': '#', 'line': '//', 'block': '//', None: ''}[HEADER_STYLES[ext]]
+    lines, length = [], 0
+    while length < size:
+        if rng.random() < 0.05:
+            line = f"{comment} TODO: refactor function_{rng.randint(0, 999)} before the next release"
+        else:
+            line = f"value_{rng.randint(0, 9999)} = compute({rng.randint(0, 99)}, {rng.random():.6f})"
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+def package_names(ecosystem:str, count:int)->List[str]:
+    prefix = {'Python': 'pypkg', 'Js': 'jspkg', 'Ruby': 'gem', 'Rust': 'crate', 'C++': 'cpplib', 'C#': 'Nuget.Pkg'}[ecosystem]
+    return [f"{prefix}{i}" for i in range(count)]
+
+def write_file(path:str, content)->int:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = 'wb' if isinstance(content, bytes) else 'w'
+    with open(path, mode, **({} if mode == 'wb' else {'encoding': 'utf-8'})) as f:
+        f.write(content)
+    return len(content)
+
+def write_manifests(repo_path:str, dependencies:Dict[str, List[str]])->None:
+    """One manifest of every kind extract_dependencies_from_file understands."""
+    python, js, ruby = dependencies['Python'], dependencies['Js'], dependencies['Ruby']
+    rust, cpp, csharp = dependencies['Rust'], dependencies['C++'], dependencies['C#']
+    half = len(python) // 2
+    write_file(os.path.join(repo_path, 'requirements.txt'), ''.join(f"{name}\n" for name in python[:half]))
+    write_file(os.path.join(repo_path, 'Pipfile'), '[packages]\n' + ''.join(f'{name} = "*"\n' for name in python[half:]))
+    write_file(os.path.join(repo_path, 'pyproject.toml'), '[build-system]\nrequires = ' + json.dumps(python[:2]) + '\n')
+    write_file(os.path.join(repo_path, 'environment.yaml'), 'dependencies:\n' + ''.join(f"  - {name}\n" for name in python[-2:]))
+    write_file(os.path.join(repo_path, 'web', 'package.json'), json.dumps({'name': 'web', 'dependencies': {name: '^1.0.0' for name in js},
+                                                                        'devDependencies': {}}, indent=2))
+    write_file(os.path.join(repo_path, 'Gemfile'), "source 'https://rubygems.org'\n" + ''.join(f"gem '{name}'\n" for name in ruby))
+    write_file(os.path.join(repo_path, 'native', 'Cargo.toml'), '[package]\nname = "native"\n\n[dependencies]\n'
+               + ''.join(f'{name} = "1"\n' for name in rust))
+    write_file(os.path.join(repo_path, 'native', 'CMakeLists.txt'), ''.join(f"find_package({name})\n" for name in cpp[:len(cpp) // 2]))
+    write_file(os.path.join(repo_path, 'native', 'Makefile'), 'LDLIBS = ' + ' '.join(f"-l{name}" for name in cpp[len(cpp) // 2:]) + '\n')
+    write_file(os.path.join(repo_path, 'dotnet', 'App.csproj'), '<Project>\n' + ''.join(f'  <PackageReference Include="{name}" Version="1.0" />\n'
+                                                                                 for name in csharp) + '</Project>\n')
+    write_file(os.path.join(repo_path, 'dotnet', 'packages.config'), '<packages>\n' + ''.join(f'  <package id="{name}" version="1.0" />\n'
+                                                                                       for name in csharp[:2]) + '</packages>\n')
+
+def generate_repository(repo_path:str, rng:random.Random, files:int=200, depth:int=3, file_kb:int=4, header_ratio:float=0.5,
+                        vendored_files:int=50, huge_files:int=0, huge_file_mb:int=25, dependencies:int=20,
+                        package_pool:int=60)->Dict:
+    owner = f"Owner {rng.randint(0, 10**6)}"
+    written = {'files': 0, 'bytes': 0}
+    def add(path, content):
+        written['files'] += 1
+        written['bytes'] += write_file(path, content)
+    add(os.path.join(repo_path, 'LICENSE'), MIT_TEXT.format(year=rng.randint(1995, 2024), owner=owner))
+    add(os.path.join(repo_path, '.gitignore'), 'build/\n*.log\n')
+    directories = [repo_path]
+    for level in range(depth):
+        directories += [os.path.join(rng.choice(directories), f"module{level}_{i}") for i in range(3)]
+    extensions = list(HEADER_STYLES)
+    for i in range(files):
+        ext = rng.choice(extensions)
+        header = license_header(ext, rng, owner) if rng.random() < header_ratio else ''
+        add(os.path.join(rng.choice(directories), f"file{i}{ext}"), header + source_body(ext, rng, file_kb * 1024))
+    # Git-ignored build output and a vendored tree, which the pruner should skip
+    for i in range(max(files // 10, 1)):
+        add(os.path.join(repo_path, 'build', f"generated{i}.js"), source_body('.js', rng, file_kb * 1024))
+    for i in range(vendored_files):
+        package = os.path.join(repo_path, 'node_modules', f"vendored{i % 10}")
+        name = 'LICENSE' if i < 10 else f"lib{i}.js"
+        add(os.path.join(package, name), MIT_TEXT.format(year=2020, owner=f"Vendor {i}") if name == 'LICENSE'
+            else license_header('.js', rng, f"Vendor {i}") + source_body('.js', rng, file_kb * 1024))
+    for i in range(huge_files):
+        add(os.path.join(repo_path, 'data', f"huge{i}.c"), license_header('.c', rng, owner) + source_body('.c', rng, huge_file_mb * 1024 * 1024))
+    add(os.path.join(repo_path, 'assets', 'logo.png'), bytes(rng.getrandbits(8) for _ in range(4096)))
+    # Dependencies are drawn from a shared pool, so that repositories have dependencies in common
+    chosen = {ecosystem: rng.sample(package_names(ecosystem, package_pool), min(dependencies, package_pool)) for ecosystem in ECOSYSTEMS}
+    write_manifests(repo_path, chosen)
+    return written
+
+def generate_corpus(root:str, repos:int=5, seed:int=0, **options)->Dict:
+    """
+    Writes `repos` synthetic repositories under root (same seed, same corpus) and returns
+    their paths with the number of files and bytes written. options: see generate_repository.
+    """
+    rng = random.Random(seed)
+    summary = {'repository_paths': [], 'files': 0, 'bytes': 0}
+    for i in range(repos):
+        repo_path = os.path.join(root, f"repo{i:04d}")
+        written = generate_repository(repo_path, rng, **options)
+        summary['repository_paths'].append(repo_path)
+        summary['files'] += written['files']
+        summary['bytes'] += written['bytes']
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic corpus of repositories.")
+    parser.add_argument('root', help="directory the repositories are written to")
+    parser.add_argument('--repos', type=int, default=5)
+    parser.add_argument('--files', type=int, default=200, help="source files per repository")
+    parser.add_argument('--depth', type=int, default=3, help="directory nesting levels")
+    parser.add_argument('--file-kb', type=int, default=4, help="size of a source file")
+    parser.add_argument('--header-ratio', type=float, default=0.5, help="share of source files with a license header")
+    parser.add_argument('--vendored-files', type=int, default=50, help="files in node_modules per repository")
+    parser.add_argument('--huge-files', type=int, default=0, help="huge source files per repository")
+    parser.add_argument('--huge-file-mb', type=int, default=25)
+    parser.add_argument('--dependencies', type=int, default=20, help="dependencies per ecosystem and repository")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    summary = generate_corpus(args.root, repos=args.repos, seed=args.seed, files=args.files, depth=args.depth,
+                              file_kb=args.file_kb, header_ratio=args.header_ratio, vendored_files=args.vendored_files,
+                              huge_files=args.huge_files, huge_file_mb=args.huge_file_mb, dependencies=args.dependencies)
+    print(f"Wrote {summary['files']} files ({summary['bytes'] / 2**20:.1f} MB) in {len(summary['repository_paths'])} repositories.")
@@ -0,0 +1,56 @@
+# The modules of the extraction stage are imported flat, as main.py does
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import referenced_license
+import registry_client
+
+
+class ScriptedRegistry(BaseHTTPRequestHandler):
+    """
+    PyPI-like stand-in: /pypi/<name>/json answers the (status, headers) of `script[name]` in turn, then 200
+    with the license `<name>-license`; every request path is recorded in `requests`.
+    """
+    protocol_version = 'HTTP/1.1'
+    script = {}
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        name = self.path.strip('/').split('/')[1]
+        with self.lock:
+            self.requests.append((name, time.monotonic()))
+            steps = self.script.get(name, [])
+            status, headers = steps.pop(0) if steps else (200, {})
+        body = json.dumps({'info': {'name': name, 'license': f"{name}-license"}}).encode() if status == 200 else b'{}'
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    ScriptedRegistry.script, ScriptedRegistry.requests = {}, []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedRegistry)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setitem(referenced_license.REGISTRY_URLS, 'pypi', base_url + '/pypi/{}/json')
+    monkeypatch.setattr(registry_client, 'BACKOFF_FACTOR', 0.01)
+    yield base_url
+    server.shutdown()
+    server.server_close()
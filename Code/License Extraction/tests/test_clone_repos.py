@@ -0,0 +1,97 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from utils import clone_repos
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason="git is not installed")
+
+
+def git(*args, cwd=None):
+    return subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+def commit(work, message):
+    git('add', '.', cwd=work)
+    git('-c', 'user.email=a@b', '-c', 'user.name=a', 'commit', '-qm', message, cwd=work)
+    git('push', '-q', 'origin', 'HEAD', cwd=work)
+
+
+@pytest.fixture
+def remotes(tmp_path):
+    # Bare repositories with two commits each, cloned through file:// so that --depth and --filter apply
+    urls = {}
+    for name in ('alpha', 'beta', 'gamma'):
+        bare = tmp_path / 'remotes' / f"{name}.git"
+        git('init', '-q', '--bare', str(bare))
+        git('config', 'uploadpack.allowfilter', 'true', cwd=bare)
+        work = tmp_path / 'work' / name
+        git('clone', '-q', str(bare), str(work))
+        (work / 'LICENSE').write_text(f"{name} license\n")
+        (work / 'requirements.txt').write_text("requests\n")
+        (work / 'src').mkdir()
+        (work / 'src' / 'main.py').write_text("print('hello')\n")
+        commit(work, 'first')
+        (work / 'src' / 'main.py').write_text("print('hello again')\n")
+        commit(work, 'second')
+        urls[name] = f"file://{bare}"
+    return urls
+
+
+def test_parallel_shallow_clones(remotes, tmp_path):
+    target = tmp_path / 'clones'
+    statuses = clone_repos(list(remotes.values()), workers=3, depth=1, path=str(target))
+    assert statuses == {url: 'cloned' for url in remotes.values()}
+    for name in remotes:
+        assert (target / f"remotes_{name}" / 'LICENSE').read_text() == f"{name} license\n"
+        assert git('rev-list', '--count', 'HEAD', cwd=target / f"remotes_{name}").strip() == '1'
+
+
+def test_sparse_blobless_clone_only_checks_out_license_files_and_manifests(remotes, tmp_path):
+    target = tmp_path / 'clones'
+    statuses = clone_repos([remotes['alpha']], blob_filter='blob:none', sparse=True, path=str(target))
+    assert statuses == {remotes['alpha']: 'cloned'}
+    assert sorted(os.listdir(target / 'remotes_alpha')) == ['.git', 'LICENSE', 'requirements.txt']
+
+
+def test_existing_clones_are_skipped_or_fetched_when_stale(remotes, tmp_path):
+    target = tmp_path / 'clones'
+    url = remotes['beta']
+    clone_repos([url], depth=1, path=str(target))
+    assert clone_repos([url], depth=1, path=str(target)) == {url: 'skipped'}
+    work = tmp_path / 'work' / 'beta'
+    (work / 'LICENSE').write_text("beta license, version 2\n")
+    commit(work, 'third')
+    assert clone_repos([url], depth=1, stale_after=0, path=str(target)) == {url: 'fetched'}
+    assert (target / 'remotes_beta' / 'LICENSE').read_text() == "beta license, version 2\n"
+
+
+def test_failed_clone_is_reported_and_cleaned_up(remotes, tmp_path):
+    target = tmp_path / 'clones'
+    missing = f"file://{tmp_path}/remotes/missing.git"
+    statuses = clone_repos([missing, remotes['gamma']], workers=2, path=str(target))
+    assert statuses[missing].startswith('failed: ')
+    assert statuses[remotes['gamma']] == 'cloned'
+    assert not os.path.exists(target / 'remotes_missing')
+
+
+def test_same_named_repositories_of_different_owners_get_their_own_directory(remotes, tmp_path):
+    # Another owner's 'alpha', and a second url of the first one
+    other = tmp_path / 'other' / 'alpha.git'
+    git('clone', '-q', '--bare', remotes['gamma'], str(other))
+    urls = [remotes['alpha'], f"file://{other}", remotes['alpha'][:-len('.git')]]
+    target = tmp_path / 'clones'
+    statuses = clone_repos(urls, workers=3, path=str(target))
+    assert list(statuses.values()) == ['cloned', 'cloned', f"skipped: same directory as {urls[0]}"]
+    assert (target / 'remotes_alpha' / 'LICENSE').read_text() == "alpha license\n"
+    assert (target / 'other_alpha' / 'LICENSE').read_text() == "gamma license\n"
+
+
+def test_clone_without_head_or_fetch_head_does_not_abort_the_run(remotes, tmp_path):
+    target = tmp_path / 'clones'
+    clone_repos([remotes['beta']], depth=1, path=str(target))
+    os.remove(target / 'remotes_beta' / '.git' / 'HEAD')
+    statuses = clone_repos([remotes['beta'], remotes['gamma']], workers=2, path=str(target))
+    assert statuses == {remotes['beta']: 'skipped', remotes['gamma']: 'cloned'}
@@ -0,0 +1,14 @@
+from extraction import extract_all_licenses
+from inline_license import HEADER_BYTES
+
+
+def test_extract_all_licenses_passes_header_bytes(tmp_path):
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    # .go files are only scanned in header mode
+    (repo / 'main.go').write_text("// SPDX-License-Identifier: Apache-2.0\npackage main\n")
+    _, inline, _ = extract_all_licenses([str(repo)])
+    assert inline['License text'] == []
+    _, inline, _ = extract_all_licenses([str(repo)], header_bytes=HEADER_BYTES)
+    assert inline['License text'] == ["SPDX-License-Identifier: Apache-2.0"]
+    assert inline['License type'] == ['Inline']
@@ -0,0 +1,82 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from declared_license import LicenseFileMatcher
+from git_backend import GitObjectReader, GitTreeWalker, list_tree, missing_objects
+from inline_license import CommentScanner
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason="git is not installed")
+
+LICENSE = "MIT License\n\nPermission is hereby granted, free of charge, to any person obtaining a copy of this software.\n"
+HEADER = "// SPDX-License-Identifier: Apache-2.0\n"
+
+
+def git(*args, cwd=None):
+    return subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture
+def source(tmp_path):
+    # A repository served over file:// that allows the blob filter and fetching blobs by id
+    repo = tmp_path / 'source'
+    repo.mkdir()
+    (repo / 'LICENSE').write_text(LICENSE)
+    (repo / 'src').mkdir()
+    (repo / 'src' / 'main.go').write_text(HEADER + "package main\n" + "// filler\n" * 2000)
+    (repo / 'data.csv').write_text("a,b\n1,2\n")
+    git('init', '-q', cwd=repo)
+    git('add', '.', cwd=repo)
+    git('-c', 'user.email=a@b', '-c', 'user.name=a', 'commit', '-qm', 'init', cwd=repo)
+    git('config', 'uploadpack.allowfilter', 'true', cwd=repo)
+    git('config', 'uploadpack.allowAnySHA1InWant', 'true', cwd=repo)
+    return repo
+
+
+def blobless_clone(source, tmp_path):
+    clone = tmp_path / 'clone'
+    git('clone', '-q', '--no-checkout', '--filter=blob:none', f"file://{source}", str(clone))
+    return str(clone)
+
+
+def oid_of(repo_path, name):
+    return next(oid for path, oid, _ in list_tree(repo_path) if path == name)
+
+
+def walker(header_bytes=None):
+    return GitTreeWalker([LicenseFileMatcher(), CommentScanner(header_bytes=header_bytes)])
+
+
+def test_read_limit_keeps_the_stream_in_sync(source):
+    with GitObjectReader(str(source)) as reader:
+        assert reader.read(oid_of(str(source), 'src/main.go'), limit=10) == HEADER[:10].encode()
+        assert reader.read(oid_of(str(source), 'LICENSE')) == LICENSE.encode()
+
+
+def test_missing_object_raises_key_error_and_reader_recovers(source):
+    with GitObjectReader(str(source)) as reader:
+        with pytest.raises(KeyError):
+            reader.read('0' * 40)
+        assert reader.read(oid_of(str(source), 'LICENSE')) == LICENSE.encode()
+
+
+def test_blobless_clone_fetches_only_the_wanted_blobs(source, tmp_path):
+    clone = blobless_clone(source, tmp_path)
+    scanner = walker(header_bytes=4096)
+    found = scanner.walk(clone)
+    assert found['declared'] == [os.path.join(clone, 'LICENSE')]
+    assert list(found['inline']) == [os.path.join(clone, 'src', 'main.go')]
+    assert scanner.skipped_blobs == []
+    # Blobs no extractor wants stay unfetched
+    assert missing_objects(clone) == {oid_of(clone, 'data.csv')}
+
+
+def test_unreachable_blobs_are_skipped_instead_of_failing_the_repository(source, tmp_path):
+    clone = blobless_clone(source, tmp_path)
+    shutil.rmtree(source) # the promisor remote is gone, so no blob can be fetched
+    scanner = walker(header_bytes=4096)
+    found = scanner.walk(clone)
+    assert found['declared'] == [] and found['inline'] == {}
+    assert sorted(os.path.relpath(path, clone) for path, _ in scanner.skipped_blobs) == ['LICENSE', os.path.join('src', 'main.go')]
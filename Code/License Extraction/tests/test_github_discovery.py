@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import github_discovery
+from github_discovery import GitHubDiscovery, retry_after_seconds
+
+
+class FakeSearchAPI(BaseHTTPRequestHandler):
+    """
+    /search/repositories with `total` results per query, named <language>/<low>-<high>/<page>/<n>.
+    The first request of every query in `limited` answers 403 with the headers of limited[query];
+    answers carry an ETag and a matching If-None-Match gets a 304.
+    """
+    protocol_version = 'HTTP/1.1'
+    total = 25
+    limited = {}
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlsplit(self.path).query).items()}
+        query, page, per_page = params['q'], int(params['page']), int(params['per_page'])
+        with self.lock:
+            self.requests.append((query, page, time.monotonic()))
+            limit_headers = self.limited.pop(query, None)
+        if limit_headers is not None:
+            self.reply(403, {'message': 'rate limited'}, limit_headers)
+            return
+        etag = f'"{query}-{page}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.reply(304)
+            return
+        language, stars = query.split()[0].split(':')[1], query.split()[1].split(':')[1]
+        start = (page - 1) * per_page
+        items = [{'full_name': f"{language}/{stars}/{page}/{n}"} for n in range(start, min(start + per_page, self.total))]
+        self.reply(200, {'total_count': self.total, 'items': items}, {'ETag': etag, 'X-RateLimit-Remaining': '100'})
+
+
+@pytest.fixture
+def api(monkeypatch):
+    FakeSearchAPI.limited, FakeSearchAPI.requests = {}, []
+    monkeypatch.setattr(github_discovery, 'PER_PAGE', 10)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSearchAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_quotas_are_filled_across_pages_in_order(api):
+    repositories = GitHubDiscovery(api_url=api, workers=4).search({'Python': 23, 'Go': 5}, star_range=(100, 200))
+    assert [item['full_name'] for item in repositories['Python']] == \
+        [f"Python/100..200/{n // 10 + 1}/{n}" for n in range(23)]
+    assert len(repositories['Go']) == 5
+    # 3 pages for Python, 1 for Go
+    assert len(FakeSearchAPI.requests) == 4
+
+
+def test_large_quotas_are_split_over_star_ranges(api, monkeypatch):
+    monkeypatch.setattr(github_discovery, 'MAX_SEARCH_RESULTS', 20)
+    repositories = GitHubDiscovery(api_url=api, workers=4).search({'Rust': 40}, star_range=(100, 199))
+    assert len(repositories['Rust']) == 40
+    assert {name.split('/')[1] for name in (item['full_name'] for item in repositories['Rust'])} == {'100..149', '150..199'}
+
+
+@pytest.mark.parametrize('form', ['seconds', 'date', 'reset'])
+def test_rate_limited_query_is_retried_after_the_advertised_delay(api, form):
+    query = "language:C stars:100..200"
+    if form == 'seconds':
+        headers = {'Retry-After': '1'}
+    elif form == 'date':
+        # An HTTP-date has a resolution of one second, so it is set 2 seconds ahead
+        headers = {'Retry-After': formatdate(time.time() + 2, usegmt=True)}
+    else:
+        headers = {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(time.time()) + 2)}
+    FakeSearchAPI.limited[query] = headers
+    repositories = GitHubDiscovery(api_url=api).search({'C': 5}, star_range=(100, 200))
+    assert len(repositories['C']) == 5
+    first, second = [at for requested, _, at in FakeSearchAPI.requests if requested == query]
+    assert second - first >= 0.9
+
+
+def test_retry_after_seconds_parses_every_form():
+    assert retry_after_seconds({'Retry-After': '7'}) == 7
+    assert 8 <= retry_after_seconds({'Retry-After': formatdate(time.time() + 10, usegmt=True)}) <= 10
+    assert 8 <= retry_after_seconds({'Retry-After': 'soon', 'X-RateLimit-Reset': str(time.time() + 10)}) <= 10
+    assert retry_after_seconds({}) is None
+
+
+def test_etag_revalidation_reuses_cached_pages(api, tmp_path):
+    cache_path = str(tmp_path / 'github.sqlite')
+    first = GitHubDiscovery(api_url=api, cache_path=cache_path).search({'Java': 15}, star_range=(100, 200))
+    second = GitHubDiscovery(api_url=api, cache_path=cache_path).search({'Java': 15}, star_range=(100, 200))
+    assert first == second and len(second['Java']) == 15
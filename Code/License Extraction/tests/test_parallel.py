@@ -0,0 +1,64 @@
+import signal
+import time
+
+import parallel
+from parallel import run_parallel
+
+
+def ok(repo_paths):
+    return repo_paths[0]
+
+
+def sleeps_in_broad_handler(repo_paths):
+    if repo_paths[0] == 'slow':
+        try:
+            time.sleep(10)
+        except Exception:
+            pass
+    return repo_paths[0]
+
+
+def sleeps_in_bare_handler(repo_paths):
+    if repo_paths[0] == 'slow':
+        try:
+            time.sleep(10)
+        except:
+            pass
+    return repo_paths[0]
+
+
+def hangs(repo_paths):
+    if repo_paths[0] == 'stuck':
+        # Stands in for a worker stuck in C code: the alarm never interrupts it
+        signal.signal(signal.SIGALRM, signal.SIG_IGN)
+        time.sleep(10)
+    return repo_paths[0]
+
+
+def test_results_keep_repository_order():
+    results, failed = run_parallel(ok, ['a', 'b', 'c', 'd'], workers=2, chunksize=3)
+    assert results == ['a', 'b', 'c', 'd']
+    assert failed == []
+
+
+def test_timeout_escapes_except_exception():
+    start = time.monotonic()
+    results, failed = run_parallel(sleeps_in_broad_handler, ['a', 'slow', 'b'], workers=2, timeout=0.5)
+    assert time.monotonic() - start < 5
+    assert results == ['a', 'b']
+    assert [repo_path for repo_path, _ in failed] == ['slow']
+
+
+def test_timeout_swallowed_by_bare_except_still_fails():
+    results, failed = run_parallel(sleeps_in_bare_handler, ['slow', 'a'], workers=2, timeout=0.5)
+    assert results == ['a']
+    assert [repo_path for repo_path, _ in failed] == ['slow']
+
+
+def test_parent_deadline_replaces_stuck_worker(monkeypatch):
+    monkeypatch.setattr(parallel, 'PARENT_GRACE', 0.5)
+    start = time.monotonic()
+    results, failed = run_parallel(hangs, ['a', 'stuck', 'b', 'c'], workers=2, timeout=0.5)
+    assert time.monotonic() - start < 8
+    assert results == ['a', 'b', 'c']
+    assert [repo_path for repo_path, _ in failed] == ['stuck']
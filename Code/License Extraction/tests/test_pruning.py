@@ -0,0 +1,48 @@
+from inline_license import scan_file
+from pruning import DEFAULT_VENDOR_DIRS, THIRD_PARTY_DIRS, PathPruner, is_binary
+
+
+def decide(pruner, tmp_path, name, files=()):
+    # Creates tmp_path/<n>/name holding the given (empty) files and asks the pruner about it
+    directory = tmp_path / str(len(list(tmp_path.iterdir()))) / name
+    directory.mkdir(parents=True)
+    for file in files:
+        (directory / file).write_text('')
+    return pruner.check_dir(str(directory), name, [])
+
+
+def test_build_dirs_are_only_skipped_with_a_build_marker(tmp_path):
+    pruner = PathPruner()
+    assert decide(pruner, tmp_path, 'build', ['setup.py']) == 'walk'
+    assert decide(pruner, tmp_path, 'build', ['CMakeCache.txt']) == 'skip'
+    assert decide(pruner, tmp_path, 'target', ['CACHEDIR.TAG']) == 'skip'
+    assert decide(pruner, tmp_path, 'dist', ['LICENSE']) == 'walk'
+
+
+def test_build_markers_can_come_from_a_tree_listing(tmp_path):
+    pruner = PathPruner()
+    assert pruner.check_dir('missing/build', 'build', [], entries=['lib.linux-x86_64-3.11']) == 'skip'
+    assert pruner.check_dir('missing/build', 'build', [], entries=['gradle.kts']) == 'walk'
+
+
+def test_vendor_is_only_vendored_with_a_package_manager_marker(tmp_path):
+    pruner = PathPruner()
+    assert decide(pruner, tmp_path, 'node_modules') == 'vendored'
+    assert decide(pruner, tmp_path, 'vendor', ['modules.txt']) == 'vendored'
+    assert decide(pruner, tmp_path, 'vendor', ['LICENSE', 'vendor.c']) == 'walk'
+    assert decide(pruner, tmp_path, 'third_party', ['LICENSE']) == 'walk'
+
+
+def test_third_party_dirs_are_opt_in(tmp_path):
+    pruner = PathPruner(vendor_dirs=DEFAULT_VENDOR_DIRS + THIRD_PARTY_DIRS)
+    assert decide(pruner, tmp_path, 'third_party', ['LICENSE']) == 'vendored'
+    assert decide(pruner, tmp_path, 'vendor', ['LICENSE']) == 'vendored'
+
+
+def test_binary_files_are_sniffed_from_the_scanned_buffer(tmp_path):
+    source = tmp_path / 'blob.c'
+    source.write_bytes(b"/* Copyright 2024 Example. Provided without warranty. */\n\0\0\0")
+    assert is_binary(source.read_bytes())
+    assert scan_file(str(source), sniff_binary=True) == []
+    assert scan_file(str(source), header_bytes=4096, sniff_binary=True) == []
+    assert scan_file(str(source)) != []
@@ -0,0 +1,49 @@
+import pytest
+
+import referenced_license
+import registry_client
+from conftest import ScriptedRegistry
+from referenced_license import resolve_license, warm_registry_cache
+from registry_cache import RegistryCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RegistryCache(str(tmp_path / 'registry_cache.sqlite'))
+
+
+def test_found_licenses_are_cached(registry, cache):
+    assert resolve_license('Python', 'requests', registry_cache=cache) == 'requests-license'
+    assert resolve_license('Python', 'requests', registry_cache=cache) == 'requests-license'
+    assert len(ScriptedRegistry.requests) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_warm_up_counts_every_lookup_once(registry, cache):
+    cache.put('Python', 'numpy', 'BSD')
+    warm_registry_cache(cache, [('Python', 'numpy'), ('Python', 'flask')])
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert [name for name, _ in ScriptedRegistry.requests] == ['flask']
+
+
+def test_not_found_answer_is_cached_as_negative(registry, cache):
+    ScriptedRegistry.script['ghost'] = [(404, {})]
+    assert resolve_license('Python', 'ghost', registry_cache=cache) == 'Package not found'
+    assert cache.get('Python', 'ghost') == (True, 'Package not found')
+
+
+def test_server_errors_are_not_cached(registry, cache, monkeypatch):
+    monkeypatch.setattr(registry_client, 'MAX_RETRIES', 1)
+    ScriptedRegistry.script['flaky'] = [(503, {'Retry-After': '0'})] * 2
+    assert resolve_license('Python', 'flaky', registry_cache=cache) == 'Package not found'
+    assert cache.get('Python', 'flaky') == (False, None)
+    # The next run asks again and gets the real answer
+    assert resolve_license('Python', 'flaky', registry_cache=cache) == 'flaky-license'
+
+
+def test_connection_errors_are_not_cached(cache, monkeypatch):
+    # get_ruby_gem_license turns the connection error into 'Package not found.'
+    monkeypatch.setattr(registry_client, 'MAX_RETRIES', 0)
+    monkeypatch.setitem(referenced_license.REGISTRY_URLS, 'rubygems', 'http://127.0.0.1:9/gems/{}')
+    assert resolve_license('Ruby', 'offline', registry_cache=cache) == 'Package not found.'
+    assert cache.get('Ruby', 'offline') == (False, None)
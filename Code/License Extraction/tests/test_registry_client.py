@@ -0,0 +1,71 @@
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+
+import registry_client
+from conftest import ScriptedRegistry
+from referenced_license import build_referenced_license_dict
+from registry_client import http_get
+
+
+def requests_for(name):
+    return [at for requested, at in ScriptedRegistry.requests if requested == name]
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_retries_transient_statuses(registry, status):
+    ScriptedRegistry.script['flaky'] = [(status, {}), (status, {})]
+    response = http_get(registry + '/pypi/flaky/json')
+    assert response.status_code == 200
+    assert len(requests_for('flaky')) == 3
+
+
+def test_gives_up_with_the_last_response(registry, monkeypatch):
+    monkeypatch.setattr(registry_client, 'MAX_RETRIES', 2)
+    ScriptedRegistry.script['down'] = [(503, {})] * 5
+    assert http_get(registry + '/pypi/down/json').status_code == 503
+    assert len(requests_for('down')) == 3
+
+
+def test_does_not_retry_not_found(registry):
+    ScriptedRegistry.script['missing'] = [(404, {})]
+    assert http_get(registry + '/pypi/missing/json').status_code == 404
+    assert len(requests_for('missing')) == 1
+
+
+@pytest.mark.parametrize('form', ['seconds', 'date'])
+def test_honours_retry_after_seconds_and_dates(registry, form):
+    # An HTTP-date has a resolution of one second, so it is set 2 seconds ahead
+    retry_after = '1' if form == 'seconds' else formatdate(time.time() + 2, usegmt=True)
+    ScriptedRegistry.script['limited'] = [(429, {'Retry-After': retry_after})]
+    assert http_get(registry + '/pypi/limited/json').status_code == 200
+    first, second = requests_for('limited')
+    assert second - first >= 0.9
+
+
+def test_retry_after_blocks_the_whole_host(registry):
+    # A 429 makes the other requests to the same host wait too
+    ScriptedRegistry.script['limited'] = [(429, {'Retry-After': '1'})]
+    start = time.monotonic()
+    threads = [threading.Thread(target=http_get, args=(registry + '/pypi/limited/json',))]
+    threads[0].start()
+    time.sleep(0.2)
+    threads.append(threading.Thread(target=http_get, args=(registry + '/pypi/other/json',)))
+    threads[1].start()
+    for thread in threads:
+        thread.join()
+    assert requests_for('other')[0] - start >= 0.9
+
+
+def test_referenced_licenses_keep_repository_and_dependency_order(registry):
+    ScriptedRegistry.script['requests'] = [(503, {'Retry-After': '0'})]
+    repo_dependencies = [('/repos/one', {'Python': ['requests', 'numpy']}),
+                         ('/repos/two', {'Python': ['numpy', 'flask', 'requests']})]
+    license_dict = build_referenced_license_dict(repo_dependencies)
+    assert license_dict['Repository name'] == ['one', 'one', 'two', 'two', 'two']
+    assert license_dict['License text'] == ['requests-license', 'numpy-license', 'numpy-license', 'flask-license', 'requests-license']
+    assert set(license_dict['License type']) == {'Referenced'}
+    # Every distinct dependency is resolved once across the repositories (plus the retry)
+    assert sorted(name for name, _ in ScriptedRegistry.requests) == ['flask', 'numpy', 'requests', 'requests']
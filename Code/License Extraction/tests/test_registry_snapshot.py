@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from conftest import ScriptedRegistry
+from referenced_license import resolve_license
+from registry_cache import RegistryCache
+from registry_snapshot import RegistrySnapshot
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    return RegistrySnapshot(str(tmp_path / 'snapshot.sqlite'), create=True)
+
+
+def test_registry_cache_import_leaves_negative_answers_out(snapshot, tmp_path):
+    cache = RegistryCache(str(tmp_path / 'registry_cache.sqlite'))
+    cache.put('Python', 'requests', 'Apache-2.0')
+    cache.put('Python', 'ghost', 'Package not found')
+    cache.put('Ruby', 'rails', None)
+    assert snapshot.import_registry_cache(cache.db_path) == 1
+    assert snapshot.get('Python', 'requests') == (True, 'Apache-2.0')
+    assert snapshot.get('Python', 'ghost') == (False, None)
+    assert snapshot.get('Ruby', 'rails') == (False, None)
+
+
+def test_jsonl_import_leaves_negative_answers_out(snapshot, tmp_path):
+    dump = tmp_path / 'dump.jsonl'
+    dump.write_text('\n'.join(json.dumps(entry) for entry in [
+        {'ecosystem': 'Js', 'name': 'react', 'license': 'MIT'},
+        {'ecosystem': 'Js', 'name': 'left-pad', 'license': 'No license information found'},
+        {'ecosystem': 'Js', 'name': 'void'}]))
+    assert snapshot.import_jsonl(str(dump)) == 1
+    assert snapshot.get('Js', 'react') == (True, 'MIT')
+
+
+def test_prefer_offline_asks_the_registry_past_a_negative_entry(registry, snapshot):
+    # e.g. a snapshot built before negative answers were left out
+    snapshot.connection.execute("INSERT INTO licenses VALUES (?,?,?)", ('Python', 'flask', 'Package not found'))
+    snapshot.connection.execute("INSERT INTO licenses VALUES (?,?,?)", ('Python', 'numpy', 'BSD'))
+    assert resolve_license('Python', 'numpy', snapshot=snapshot, mode='prefer-offline') == 'BSD'
+    assert resolve_license('Python', 'flask', snapshot=snapshot, mode='prefer-offline') == 'flask-license'
+    assert [name for name, _ in ScriptedRegistry.requests] == ['flask']
+
+
+def test_offline_never_asks_the_registry(registry, snapshot):
+    snapshot.connection.execute("INSERT INTO licenses VALUES (?,?,?)", ('Python', 'flask', 'Package not found'))
+    assert resolve_license('Python', 'flask', snapshot=snapshot, mode='offline') == 'Package not found'
+    assert resolve_license('Python', 'unknown', snapshot=snapshot, mode='offline') == 'Package not found'
+    assert ScriptedRegistry.requests == []
+
+
+def test_missing_snapshot_is_an_error_unless_it_is_being_built(tmp_path):
+    path = str(tmp_path / 'snapshot.sqlite')
+    with pytest.raises(FileNotFoundError):
+        RegistrySnapshot(path)
+    RegistrySnapshot(path, create=True).get('Js', 'react')
+    assert RegistrySnapshot(path).get('Js', 'react') == (False, None)
@@ -0,0 +1,99 @@
+import os
+
+import inline_license
+import scan_cache
+from inline_license import CommentScanner
+from scan_cache import ScanCache
+
+LICENSE_COMMENT = "/* Copyright 2020 X. Permission is granted */\nint x;\n"
+EDITED = "/* no notice here, just code to keep. */\nint x;\n"
+
+
+def scan(cache, path):
+    return scan_with(CommentScanner(cache), cache, path)
+
+
+def scan_with(scanner, cache, path):
+    scanner.start(str(path.parent))
+    scanner.visit(str(path))
+    cache.flush()
+    return scanner.finish().get(str(path), [])
+
+
+def test_unchanged_files_are_hits_and_edited_files_misses(tmp_path):
+    source = tmp_path / 'main.c'
+    source.write_text(LICENSE_COMMENT)
+    cache = ScanCache(str(tmp_path / 'cache.sqlite'))
+    assert scan(cache, source) == ['Copyright 2020 X. Permission is granted']
+    assert scan(cache, source) == ['Copyright 2020 X. Permission is granted']
+    assert cache.hits == 1
+    source.write_text(EDITED)
+    assert scan(cache, source) == []
+    assert cache.misses == 2
+
+
+def test_a_file_edited_while_it_is_scanned_is_not_cached(tmp_path, monkeypatch):
+    source = tmp_path / 'main.c'
+    source.write_text(LICENSE_COMMENT)
+    scan_file = inline_license.scan_file
+
+    def scan_then_edit(file_path, *args):
+        comments = scan_file(file_path, *args)
+        with open(file_path, 'w') as f:
+            f.write(EDITED)
+        os.utime(file_path, ns=(os.stat(file_path).st_atime_ns, os.stat(file_path).st_mtime_ns + 10**9))
+        return comments
+
+    cache = ScanCache(str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(inline_license, 'scan_file', scan_then_edit)
+    assert scan(cache, source) == ['Copyright 2020 X. Permission is granted']
+    monkeypatch.setattr(inline_license, 'scan_file', scan_file)
+    assert scan(cache, source) == []
+
+
+def test_the_hash_is_the_one_of_the_scanned_bytes(tmp_path):
+    # The file is changed within the same mtime tick, keeping its size: the racy entry is rehashed
+    source = tmp_path / 'main.c'
+    source.write_text(LICENSE_COMMENT)
+    st = os.stat(source)
+    cache = ScanCache(str(tmp_path / 'cache.sqlite'))
+    cache.put('inline', str(source), ['stale'], '1', st, 'hash of other bytes')
+    cache.flush()
+    assert cache.get('inline', str(source), '1') == (False, None)
+
+
+def test_workers_do_not_hold_the_write_lock_between_flushes(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    first, second = ScanCache(path), ScanCache(path)
+    second.connection.execute("PRAGMA busy_timeout = 100")
+    sources = []
+    for name in ('a.c', 'b.c'):
+        sources.append(tmp_path / name)
+        sources[-1].write_text(LICENSE_COMMENT)
+    first.put('inline', str(sources[0]), ['a'])
+    second.put('inline', str(sources[1]), ['b'])
+    second.flush()
+    first.flush()
+    third = ScanCache(path)
+    assert third.get('inline', str(sources[0])) == (True, ['a'])
+    assert third.get('inline', str(sources[1])) == (True, ['b'])
+
+
+def test_header_mode_entries_are_validated_against_the_header_only(tmp_path, monkeypatch):
+    source = tmp_path / 'main.c'
+    source.write_text(LICENSE_COMMENT + "/* filler */\n" * 1000)
+    cache = ScanCache(str(tmp_path / 'cache.sqlite'))
+    scanner = CommentScanner(cache, header_bytes=256)
+    assert scan_with(scanner, cache, source) == ['Copyright 2020 X. Permission is granted']
+    # The tail changes (same size, new mtime): the header, and so the result, is the same
+    source.write_text(LICENSE_COMMENT + "/* filler */\n" * 999 + "/* FILLER */\n")
+    os.utime(source, ns=(os.stat(source).st_atime_ns, os.stat(source).st_mtime_ns + 10**9))
+    hashed = []
+    hash_file = scan_cache.hash_file
+    monkeypatch.setattr(scan_cache, 'hash_file', lambda path, limit=None: hashed.append(limit) or hash_file(path, limit))
+    assert scan_with(scanner, cache, source) == ['Copyright 2020 X. Permission is granted']
+    assert (cache.hits, hashed) == (1, [256])
+    # A change in the header is still a miss
+    source.write_text(EDITED.ljust(len(LICENSE_COMMENT)) + "/* filler */\n" * 999 + "/* FILLER */\n")
+    os.utime(source, ns=(os.stat(source).st_atime_ns, os.stat(source).st_mtime_ns + 10**9))
+    assert scan_with(scanner, cache, source) == []
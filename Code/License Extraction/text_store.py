@@ -0,0 +1,57 @@
+# Content-addressed store of the extracted license texts: every distinct text once, plus where it occurs
+
+import sqlite3
+import hashlib
+import pandas as pd
+from typing import Iterator, Tuple
+
+def text_hash(text:str)->str:
+    return hashlib.sha1(text.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+class LicenseTextStore:
+    """
+    SQLite file with a `texts` table (text_hash -> text, stored once) and an `occurrences` table
+    (repository, path, type, text_hash) with one row per extracted license.
+    """
+    def __init__(self, db_path:str):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS texts (text_hash TEXT PRIMARY KEY, text TEXT) WITHOUT ROWID")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS occurrences (
+                                   repository TEXT, path TEXT, type TEXT, text_hash TEXT)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS occurrences_text_hash ON occurrences (text_hash)")
+
+    def add(self, df:pd.DataFrame)->int:
+        """Adds the rows of a DataFrame with the output columns; returns the number of texts that were new."""
+        codes, texts = pd.factorize(df['License text'])
+        hashes = [text_hash(text) for text in texts]
+        before = self.connection.total_changes
+        self.connection.executemany("INSERT OR IGNORE INTO texts VALUES (?,?)", zip(hashes, texts))
+        new_texts = self.connection.total_changes - before
+        self.connection.executemany("INSERT INTO occurrences VALUES (?,?,?,?)",
+                                    zip(df['Repository name'], df['Repository path'], df['License type'],
+                                        (hashes[code] for code in codes)))
+        self.connection.commit()
+        return new_texts
+
+    def texts(self)->Iterator[Tuple[str, str]]:
+        # (text_hash, text) of every distinct text
+        return self.connection.execute("SELECT text_hash, text FROM texts")
+
+    def occurrences(self)->pd.DataFrame:
+        return pd.read_sql_query("SELECT repository, path, type, text_hash FROM occurrences", self.connection)
+
+    def records(self)->pd.DataFrame:
+        """The occurrences joined with their texts, in the columns of the other outputs plus 'Text hash'."""
+        return pd.read_sql_query("""SELECT o.repository AS "Repository name", o.path AS "Repository path",
+                                           t.text AS "License text", o.type AS "License type", o.text_hash AS "Text hash"
+                                    FROM occurrences o JOIN texts t ON t.text_hash = o.text_hash
+                                    ORDER BY o.rowid""", self.connection)
+
+    def report(self)->str:
+        texts = self.connection.execute("SELECT COUNT(*) FROM texts").fetchone()[0]
+        occurrences = self.connection.execute("SELECT COUNT(*) FROM occurrences").fetchone()[0]
+        return f"License text store: {texts} distinct texts in {occurrences} occurrences"
+
+    def close(self)->None:
+        self.connection.close()
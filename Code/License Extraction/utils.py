@@ -1,123 +1,174 @@
 # Utility file for creating benchmark dataset for OSS-LCAT
 
-# import os
+import os
 import re
 import json
+import time
 import yaml
 import toml
+import shutil
 import requests
 import subprocess
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from github_discovery import GitHubDiscovery
 # from dotenv import load_dotenv
 
 # load_dotenv()
 
 BASE_FILE_PATH = '<path_to_store_repositories>'
+EXTRA_SPACES_PATTERN = re.compile(r' {2,}')
 
 # Fetch the top repos.
-def fetch_top_repositories(num_links:int=5, page_num:int=1, run:bool=True, languages:List[str]=None)->List[str]:
-    # num_links: number of top repository links you want to download
+def fetch_top_repositories(num_links:int=5, page_num:int=1, run:bool=True, languages:List[str]=None,
+                           tokens:List[str]=None, workers:int=8, cache_path:str=None)->List[str]:
+    # num_links: number of top repository links you want to download, split evenly over the languages
     # page_num: from which page you want to download the repo links
     # run: boolean value, indicating whether you want to fetch the repos or not
+    # tokens: optional GitHub tokens, used in turn to spread the API rate limit
+    # workers: number of concurrent requests
+    # cache_path: optional SQLite file of ETag-cached API responses reused between runs
     if run:
         if languages is None:
             languages = ['Python','Javascript','Java','HTML','C++','c#','C','Rust','Ruby']
-        url = "https://api.github.com/search/repositories"
-        repositories = []
-        for language in languages:
-            page = page_num
-            params = {
-                "q": "language:{language} stars:100..3000", # previously 100..30000
-                "sort": "stars",
-                "order": "asc", #"desc",
-                "per_page": 100 #max allowed value
-            }
-            while len(repositories) < num_links:
-                params["page"] = page
-                response = requests.get(url, params=params)
-                
-                if response.status_code != 200:
-                    print(f"Failed to fetch data: {response.status_code}")
-                    break
-                data = response.json()
-                items = data.get('items',[])
-
-                if not items:
-                    break # No more results
-                repositories.extend(items)
-                page+=1
-
-                if len(repositories) >= num_links:
-                    repositories = repositories[:num_links]
-                    break
+        # Every language gets its own quota, so the first language can not use up num_links
+        quotas = {language: num_links // len(languages) + (1 if i < num_links % len(languages) else 0)
+                  for i, language in enumerate(languages)}
+        discovery = GitHubDiscovery(tokens=tokens, workers=workers, cache_path=cache_path)
+        repositories = discovery.search({language: quota for language, quota in quotas.items() if quota}, page_num=page_num)
         # Extract the repository urls
-        repo_urls = [repo['clone_url'] for repo in repositories]
+        repo_urls = [repo['clone_url'] for language in languages for repo in repositories.get(language, [])]
         return repo_urls
 
+# Sparse checkouts only contain the files the license extraction needs (gitignore syntax, non-cone mode)
+SPARSE_PATTERNS = ['license*', 'LICENSE*', 'License*', 'copying*', 'COPYING*', 'Copying*',
+                   'requirements.txt', 'Pipfile', 'Pipfile.txt', 'pyproject.toml', 'environment.yaml',
+                   'package.json', 'Gemfile', 'Cargo.toml', 'CMakeLists.txt', 'Makefile', '*.csproj', 'packages.config']
+GIT_ENV = dict(os.environ, GIT_TERMINAL_PROMPT='0') # fail instead of waiting for credentials
+
+def run_git(args:List[str], timeout:float=None)->None:
+    subprocess.run(['git'] + args, check=True, timeout=timeout, env=GIT_ENV,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+def clone_repo(repo:str, target:str, depth:int=None, blob_filter:str=None, sparse_patterns:List[str]=None,
+               timeout:float=None, stale_after:float=None)->str:
+    """Clones repo into target; returns 'cloned', 'skipped', 'fetched' or 'failed: <reason>'."""
+    created = not os.path.exists(target)
+    try:
+        if os.path.isdir(os.path.join(target, '.git')):
+            # Already cloned: only fetch the tip again if the last clone or fetch is older than stale_after seconds
+            git_dir = os.path.join(target, '.git')
+            last_update = max((os.path.getmtime(os.path.join(git_dir, name))
+                               for name in ('HEAD', 'FETCH_HEAD') if os.path.exists(os.path.join(git_dir, name))), default=0)
+            if stale_after is None or time.time() - last_update < stale_after:
+                return 'skipped'
+            run_git(['-C', target, 'fetch'] + (['--depth', str(depth)] if depth else []) + ['origin', 'HEAD'], timeout)
+            run_git(['-C', target, 'reset', '--hard', 'FETCH_HEAD'], timeout)
+            return 'fetched'
+        args = ['clone']
+        if depth:
+            args += ['--depth', str(depth)]
+        if blob_filter:
+            args += [f'--filter={blob_filter}']
+        if sparse_patterns:
+            args += ['--no-checkout']
+        run_git(args + [repo, target], timeout)
+        if sparse_patterns:
+            run_git(['-C', target, 'sparse-checkout', 'set', '--no-cone'] + list(sparse_patterns), timeout)
+            run_git(['-C', target, 'checkout'], timeout)
+        return 'cloned'
+    except subprocess.TimeoutExpired:
+        reason = f"timed out after {timeout} seconds"
+    except subprocess.CalledProcessError as e:
+        reason = e.stderr.decode(errors='ignore').strip().splitlines()[-1] if e.stderr else str(e)
+    except OSError as e:
+        reason = str(e)
+    # Do not leave a half-cloned repository behind; it would be skipped by the next run
+    if created:
+        shutil.rmtree(target, ignore_errors=True)
+    return f"failed: {reason}"
+
+def repo_directory_name(repo:str)->str:
+    # '<owner>_<name>' of a clone url: repositories of different owners may have the same name
+    parts = repo.rstrip('/').split('/')
+    name = parts[-1][:-len('.git')] if parts[-1].endswith('.git') else parts[-1]
+    return f"{parts[-2]}_{name}" if len(parts) > 1 and parts[-2] else name
+
 # Clone the repos in your disk
-def clone_repos(repos:List, run:bool=True)->None:
-    PATH = f'{BASE_FILE_PATH}/Repositories'
+def clone_repos(repos:List, run:bool=True, workers:int=1, depth:int=None, blob_filter:str=None, sparse:bool=False,
+                timeout:float=None, stale_after:float=None, path:str=None)->Dict[str, str]:
+    # repos: clone urls (or paths) of the repositories
+    # workers: number of clones running at the same time
+    # depth: e.g. 1 to clone only the tip commit
+    # blob_filter: partial clone filter, e.g. 'blob:none'
+    # sparse: only check out license files and manifests (SPARSE_PATTERNS)
+    # timeout: seconds after which a single clone is given up
+    # stale_after: seconds after which an already cloned repository is fetched again (None never fetches)
+    # path: directory the repositories are cloned into
+    PATH = path if path else f'{BASE_FILE_PATH}/Repositories'
+    statuses = {}
     if run:
-        # repository_names = []
+        # Every directory is cloned by one thread only: a second url of the same repository is not cloned again
+        targets = {}
         for repo in repos:
-            repo_name = repo.split('/')[-1].replace('.git', '')
+            repo_name = repo_directory_name(repo)
+            if repo_name in targets:
+                statuses[repo] = f"skipped: same directory as {targets[repo_name]}"
+            else:
+                targets[repo_name] = repo
+        def clone(repo_name):
             print(f"Cloning {repo_name}...")
-            try:
-                print("Running the try block...")
-                subprocess.run(['git', 'clone', repo, PATH+'/'+repo_name])
-            except:
-                print("Running the except block...")
-                subprocess.run(['git', 'clone', repo, PATH])
+            status = clone_repo(targets[repo_name], os.path.join(PATH, repo_name), depth=depth, blob_filter=blob_filter,
+                                sparse_patterns=SPARSE_PATTERNS if sparse else None, timeout=timeout, stale_after=stale_after)
+            print(f"{repo_name}: {status}")
+            return status
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            for repo_name, status in zip(targets, executor.map(clone, targets)):
+                statuses[targets[repo_name]] = status
+        statuses = {repo: statuses[repo] for repo in repos} # in the order of repos
+    return statuses
 
 # Remove extra spaces from the license text (if exists)
 def remove_spaces(full_text:str)->str:
-    text = ''
-    for idx, char in enumerate(full_text):
-        try:
-            if (ord(char)==32 and ord(full_text[idx-1])==32):
-                continue
-            else:
-                text += char
-        except:
-            if idx==0:
-                if ord(char)==32:
-                    continue
-                else:
-                    text += char
-    return text
+    # Collapses every run of spaces into a single space
+    return EXTRA_SPACES_PATTERN.sub(' ', full_text)
+
+# The dependency extractors read the file unless its content is given (e.g. a blob read from git)
+def read_text(file_path:str, content:str=None, encoding:str=None)->str:
+    if content is not None:
+        return content
+    with open(file_path, 'r', encoding=encoding) as f:
+        return f.read()
 
-def extract_python_dependencies(file_path: str, language: str = 'Python') -> Tuple[List[str], str]:
+def extract_python_dependencies(file_path: str, language: str = 'Python', content: str = None) -> Tuple[List[str], str]:
     dependencies = []
     
     if file_path.endswith('requirements.txt'):
-        with open(file_path, 'r') as f:
-            dependencies = f.read().splitlines()
+        dependencies = read_text(file_path, content).splitlines()
     elif file_path.endswith('Pipfile') or file_path.endswith('Pipfile.txt'):
         try:
             # Load the Pipfile using toml
-            pipfile = toml.load(file_path)
+            pipfile = toml.loads(read_text(file_path, content))
             # Extract dependencies
             dependencies = list(pipfile.get('packages',{}).keys())
         except:
             print(f"Couldn't extract dependencies from {file_path}")
     elif file_path.endswith('pyproject.toml'):
         try:
-            with open(file_path, 'r') as f:
-                toml_content = f.read()
-                parsed_content = toml.loads(toml_content) # Parse the TOML content
-                dependencies = parsed_content.get('build-system', {}).get('requires', []) # Extract the dependencies from the 'requires' list
+            toml_content = read_text(file_path, content)
+            parsed_content = toml.loads(toml_content) # Parse the TOML content
+            dependencies = parsed_content.get('build-system', {}).get('requires', []) # Extract the dependencies from the 'requires' list
         except:
             print(f"Couldn't extract dependencies from {file_path}")
     elif file_path.endswith('environment.yaml'):
         try:
-            with open(file_path, 'r') as f:
-                environment = yaml.safe_load(f)
-                deps = environment.get('dependencies', [])
-                for dep in deps:
-                    if isinstance(dep, dict) and 'pip' in dep:
-                        dependencies.extend(dep['pip'])
-                    else:
-                        dependencies.append(dep)
+            environment = yaml.safe_load(read_text(file_path, content))
+            deps = environment.get('dependencies', [])
+            for dep in deps:
+                if isinstance(dep, dict) and 'pip' in dep:
+                    dependencies.extend(dep['pip'])
+                else:
+                    dependencies.append(dep)
         except:
             print(f"Couldn't extract dependencies from {file_path}")
     # Extracting names using regex
@@ -130,72 +181,67 @@ def extract_python_dependencies(file_path: str, language: str = 'Python') -> Tup
         unique_names = []
     return (unique_names, language)
 
-def extract_js_dependencies(file_path: str, language:str="Js") -> List[str]:
+def extract_js_dependencies(file_path: str, language:str="Js", content:str=None) -> List[str]:
     dependencies = []
+    file_str = read_text(file_path, content)
     if file_path.endswith('package.json'):
-        with open(file_path, 'r') as f:
-            file_str = f.read()
-            try:
-                package_json = json.loads(file_str)
-                dependencies = list(package_json.get('dependencies', {}).keys())
-                dev_dependencies = list(package_json.get('devDependencies', {}).keys())
-                dependencies.extend(dev_dependencies)
-            except:
-                pass
+        try:
+            package_json = json.loads(file_str)
+            dependencies = list(package_json.get('dependencies', {}).keys())
+            dev_dependencies = list(package_json.get('devDependencies', {}).keys())
+            dependencies.extend(dev_dependencies)
+        except:
+            pass
     if not dependencies:
-        with open(file_path, 'r') as f:
-            file_str = f.read()
-            try:
-                file_dict = json.loads(file_str)
-                dependencies.append(file_dict['name'])
-            except:
-                pass
+        try:
+            file_dict = json.loads(file_str)
+            dependencies.append(file_dict['name'])
+        except:
+            pass
     return (dependencies, language)
 
-def extract_java_dependencies(file_path: str, language:str="Java") -> List[str]:
+def extract_java_dependencies(file_path: str, language:str="Java", content:str=None) -> List[str]:
     dependencies = []
     if file_path.endswith('pom.xml'):
-        with open(file_path, 'r') as f:
-            pom_content = f.read()
-            dependencies = re.findall(r'<artifactId>(.*?)</artifactId>', pom_content)
+        pom_content = read_text(file_path, content)
+        dependencies = re.findall(r'<artifactId>(.*?)</artifactId>', pom_content)
     elif file_path.endswith('build.gradle'):
-        with open(file_path, 'r') as f:
-            gradle_content = f.read()
-            dependencies = re.findall(r'''implementation\s*["\''](.*?)["\'']''', gradle_content)
+        gradle_content = read_text(file_path, content)
+        dependencies = re.findall(r'''implementation\s*["\''](.*?)["\'']''', gradle_content)
     return (dependencies, language)
 
-def extract_ruby_dependencies(file_path: str, language:str="Ruby") -> List[str]:
+def extract_ruby_dependencies(file_path: str, language:str="Ruby", content:str=None) -> List[str]:
     dependencies = []
     if file_path.endswith('Gemfile'):
-        with open(file_path, 'r') as f:
-            gemfile_content = f.read()
-            dependencies = re.findall(r'''gem\s*["\''](.*?)["\'']''', gemfile_content)
+        gemfile_content = read_text(file_path, content)
+        dependencies = re.findall(r'''gem\s*["\''](.*?)["\'']''', gemfile_content)
     return (dependencies, language)
 
-def extract_rust_dependencies(file_path:str, language:str="Rust") -> List[str]:
+def extract_rust_dependencies(file_path:str, language:str="Rust", content:str=None) -> List[str]:
     """Extracts dependencies from a Rust project directory."""
     dependencies = []
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            in_dependencies_section=False
-            for line in f:
-                line = line.strip()
-                if line.startswith('[dependencies]'):
-                    in_dependencies_section=True
-                elif line.startswith('['):
-                    # Stop parsing once another section is encountered
-                    break
-                elif in_dependencies_section and line:
-                    dep_name = line.split('=')[0].strip()
-                    dependencies.append(dep_name)
+        in_dependencies_section=False
+        for line in read_text(file_path, content, encoding='utf-8').splitlines():
+            line = line.strip()
+            if line.startswith('[dependencies]'):
+                in_dependencies_section=True
+            elif line.startswith('['):
+                # Stop parsing once another section is encountered
+                break
+            elif in_dependencies_section and line:
+                dep_name = line.split('=')[0].strip()
+                dependencies.append(dep_name)
         return (dependencies, language)
     except:
         return (dependencies, language)
 
-def extract_c_cplusplus_dependencies(file_path: str, language: str = "C++") -> Tuple[List[str], str]:
+def extract_c_cplusplus_dependencies(file_path: str, language: str = "C++", content: str = None) -> Tuple[List[str], str]:
     dependencies = []
     
     def read_file_with_encoding(path: str) -> str:
+        if content is not None:
+            return content
         encodings = ['utf-8', 'iso-8859-1', 'cp1252']  # List of encodings to try
         for encoding in encodings:
             try:
@@ -220,16 +266,14 @@ def extract_c_cplusplus_dependencies(file_path: str, language: str = "C++") -> T
     
     return (dependencies, language)
 
-def extract_csharp_dependencies(file_path: str, language:str="C#") -> List[str]:
+def extract_csharp_dependencies(file_path: str, language:str="C#", content:str=None) -> List[str]:
     dependencies = []
     if file_path.endswith('.csproj'):
-        with open(file_path, 'r') as f:
-            csproj_content = f.read()
-            dependencies = re.findall(r'<PackageReference Include="(.*?)"', csproj_content)
+        csproj_content = read_text(file_path, content)
+        dependencies = re.findall(r'<PackageReference Include="(.*?)"', csproj_content)
     elif file_path.endswith('packages.config'):
-        with open(file_path, 'r') as f:
-            packages_config_content = f.read()
-            dependencies = re.findall(r'<package id="(.*?)"', packages_config_content)
+        packages_config_content = read_text(file_path, content)
+        dependencies = re.findall(r'<package id="(.*?)"', packages_config_content)
     return (dependencies, language)
 
 if __name__ == '__main__':
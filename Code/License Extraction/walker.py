@@ -0,0 +1,86 @@
+# Single-pass repository walker shared by the declared, inline and referenced extractors
+
+import os
+from typing import Dict, List
+from pruning import PathPruner
+
+class Extractor:
+    """Base class for anything that wants to look at the files of a repository.
+
+    The walker calls `start` once per repository, `visit` for every file whose
+    name the extractor `wants`, and `finish` once the walk is over. Whatever
+    `finish` returns is stored under the extractor's `name`. Walkers that read
+    files from somewhere else than the disk (git_backend.GitTreeWalker) call
+    `visit_blob` with the file's content instead of `visit`; `read_limit` tells
+    them how many leading bytes of a file it looks at (None: all of them).
+    An extractor that reads a file skips it if it looks binary (pruning.is_binary)
+    and `sniff_binary` is set; the walkers set it from their pruner.
+    """
+    name = 'extractor'
+    read_limit = None
+    sniff_binary = True
+
+    def start(self, repo_path:str)->None:
+        pass
+
+    def wants(self, file_name:str)->bool:
+        return True
+
+    def visit(self, file_path:str)->None:
+        pass
+
+    def visit_blob(self, file_path:str, data:bytes)->None:
+        pass
+
+    def finish(self):
+        return None
+
+class RepositoryWalker:
+    def __init__(self, extractors:List[Extractor]=None, pruner:PathPruner=None):
+        # pruner: decides which directories and files are skipped (a default PathPruner if None)
+        self.extractors = list(extractors) if extractors else []
+        self.pruner = pruner if pruner is not None else PathPruner()
+        self.vendored_dirs = []
+
+    def register(self, extractor:Extractor)->Extractor:
+        self.extractors.append(extractor)
+        return extractor
+
+    def walk(self, repo_path:str)->Dict:
+        # Walk the repository once and hand every file to the extractors that want it.
+        # Vendored directories are not walked; when the pruner asks for it they are kept in self.vendored_dirs.
+        for extractor in self.extractors:
+            extractor.sniff_binary = self.pruner.sniff_binary
+            extractor.start(repo_path)
+        self.vendored_dirs = []
+        stack = [(repo_path, self.pruner.rules_for(repo_path, []))]
+        while stack:
+            directory, rules = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError as e:
+                print(f"Could not read the directory {directory}: {e}")
+                continue
+            sub_directories = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        decision = self.pruner.check_dir(entry.path, entry.name, rules)
+                        if decision == 'walk':
+                            sub_directories.append((entry.path, self.pruner.rules_for(entry.path, rules)))
+                        elif decision == 'vendored' and self.pruner.scan_vendored:
+                            self.vendored_dirs.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    extractors = [extractor for extractor in self.extractors if extractor.wants(entry.name)]
+                    if not extractors or not self.pruner.check_file(entry.path, entry.stat().st_size, rules):
+                        continue
+                except OSError:
+                    continue
+                for extractor in extractors:
+                    extractor.visit(entry.path)
+            # Push in reverse so that directories are visited in sorted order.
+            stack.extend(reversed(sub_directories))
+        return {extractor.name: extractor.finish() for extractor in self.extractors}